@@ -0,0 +1,85 @@
+# animacoes.py
+import json
+import os
+import threading
+from pathlib import Path
+
+import streamlit as st
+
+# Tenta importar Lottie, se não tiver, usa fallback
+try:
+    from streamlit_lottie import st_lottie
+
+    HAS_LOTTIE = True
+except ImportError:
+    HAS_LOTTIE = False
+
+# --- CONFIGURAÇÃO (ajustável por variável de ambiente) ---
+# Modo rápido: nenhuma animação, só o emoji (máquinas lentas / rede da loja sem internet)
+MODO_RAPIDO = os.environ.get('LOJA_MODO_RAPIDO', '0') == '1'
+# Por padrão nada é baixado: as animações vêm de assets/lottie. Com LOJA_ANIMACOES_ONLINE=1, uma animação
+# sem arquivo local é baixada uma única vez e gravada no cache em disco.
+ANIMACOES_ONLINE = os.environ.get('LOJA_ANIMACOES_ONLINE', '0') == '1'
+PASTA_ANIMACOES = Path(__file__).parent / "assets" / "lottie"
+PASTA_CACHE = Path(os.environ.get('LOJA_ANIMACOES_CACHE', Path.home() / ".cache" / "cerrado_terere" / "lottie"))
+
+# nome -> (arquivo em assets/lottie, URL de origem, emoji usado sem animação)
+ANIMACOES = {
+    "login": ("login.json", "https://lottie.host/6e64d7c0-671e-450b-8d5c-912dfa88785e/3u1s4Xz6tB.json", "🌿"),
+    "sucesso": ("sucesso.json", "https://lottie.host/939b4b0e-6169-4508-b785-52d3a0429188/8p7X5Zq7tB.json", "🎉"),
+    "tchau": ("tchau.json", "https://lottie.host/020050df-d035-4303-8854-9725d2222238/v1G8Y2X20n.json", "👋"),
+}
+
+_carregadas = {}
+_lock = threading.Lock()
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _baixar(nome, url):
+    import requests
+
+    try:
+        r = requests.get(url, timeout=2)
+        dados = r.json() if r.status_code == 200 else None
+    except (requests.RequestException, ValueError):
+        return None
+    if dados is not None:
+        try:
+            PASTA_CACHE.mkdir(parents=True, exist_ok=True)
+            (PASTA_CACHE / f"{nome}.json").write_text(json.dumps(dados), encoding="utf-8")
+        except OSError:
+            pass
+    return dados
+
+
+def carregar_animacao(nome):
+    """JSON da animação (ou None), lido uma única vez por processo: assets/lottie, cache em disco e,
+    só se habilitado, download."""
+    if MODO_RAPIDO or not HAS_LOTTIE:
+        return None
+    if nome in _carregadas:
+        return _carregadas[nome]
+    arquivo, url, _ = ANIMACOES[nome]
+    with _lock:
+        if nome not in _carregadas:
+            dados = _ler_json(PASTA_ANIMACOES / arquivo) or _ler_json(PASTA_CACHE / f"{nome}.json")
+            if dados is None and ANIMACOES_ONLINE:
+                dados = _baixar(nome, url)
+            _carregadas[nome] = dados
+    return _carregadas[nome]
+
+
+def exibir_animacao(nome, height, key, emoji_markdown="#"):
+    """Mostra a animação `nome`; sem ela (modo rápido, sem streamlit-lottie ou sem arquivo) mostra o emoji."""
+    dados = carregar_animacao(nome)
+    if dados is not None:
+        st_lottie(dados, height=height, key=key)
+    else:
+        st.markdown(f"{emoji_markdown} {ANIMACOES[nome][2]}")
@@ -0,0 +1,290 @@
+# benchmark.py
+"""Benchmark das consultas das telas, sem navegador, sobre uma base sintética gerada com semente fixa.
+
+Uso:
+    python benchmark.py                                  # 10 mil produtos, 100 mil clientes, 5 milhões de linhas
+    python benchmark.py --escala 0.01                    # mesma proporção, 1% do tamanho (rodada rápida)
+    python benchmark.py --json base.json                 # grava os percentis para comparar depois
+    python benchmark.py --comparar base.json             # aponta operações que ficaram mais lentas
+
+A base fica em --banco (nunca em loja_dados.db) e é reaproveitada enquanto os parâmetros forem os mesmos.
+As operações de escrita alteram essa base; use --recriar para voltar ao estado gerado.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import database
+
+# --- GERADOR DE DADOS SINTÉTICOS ---
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Heitor", "Isabela", "João", "Karina",
+         "Lucas", "Mariana", "Nicolas", "Olívia", "Pedro", "Rafaela", "Samuel", "Tatiane", "Vitor"]
+SOBRENOMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Lima", "Carvalho", "Ferreira", "Rodrigues",
+              "Almeida", "Costa", "Gomes", "Martins", "Araújo", "Barbosa", "Ribeiro"]
+PRODUTOS = ["Erva Mate", "Erva Tereré", "Guampa", "Bomba", "Garrafa Térmica", "Copo Térmico", "Essência", "Cuia"]
+SABORES = ["Menta", "Limão", "Abacaxi", "Maracujá", "Morango", "Tradicional", "Cidreira", "Hortelã"]
+
+TAMANHO_LOTE = 50_000
+
+
+def gerar_base(caminho, produtos, clientes, linhas, semente=42, dias=730):
+    """Cria do zero a base em `caminho` com o schema atual e dados sintéticos determinísticos.
+
+    As linhas de venda passam pelos triggers (resumo de clientes, consolidados diários, recebimentos),
+    como numa venda feita pela tela. Retorna a duração em segundos.
+    """
+    inicio = time.perf_counter()
+    database.close_all_connections()
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    database.DB_NAME = caminho
+    database.init_db()
+    rng = random.Random(semente)
+
+    # Índice 0 vazio para acessar por id
+    cadastro_produtos = [None] + [
+        (f"{PRODUTOS[i % len(PRODUTOS)]} {SABORES[(i // len(PRODUTOS)) % len(SABORES)]} #{i}",
+         round(rng.uniform(2, 150), 2)) for i in range(1, produtos + 1)]
+    nomes_clientes = [None] + [f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {i}" for i in range(1, clientes + 1)]
+    with database.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO produtos (id, nome, preco, quantidade, minimo_alerta) VALUES (?, ?, ?, ?, ?)",
+            ((i, nome, preco, rng.randint(0, 500), rng.randint(5, 20))
+             for i, (nome, preco) in enumerate(cadastro_produtos[1:], start=1)))
+        conn.executemany(
+            "INSERT INTO clientes (id, nome, telefone, cpf, endereco) VALUES (?, ?, ?, ?, ?)",
+            ((i, nome, f"67 9{rng.randrange(10 ** 8):08d}", f"{rng.randrange(10 ** 11):011d}",
+              f"Rua {rng.randint(1, 500)}, {rng.randint(1, 2000)}")
+             for i, nome in enumerate(nomes_clientes[1:], start=1)))
+    print(f"[gerador] {produtos} produtos e {clientes} clientes", flush=True)
+
+    hoje = date.today()
+    primeiro_dia = hoje - timedelta(days=dias - 1)
+    pedido_id = 0
+    geradas = 0
+    while geradas < linhas:
+        pedidos, vendas = [], []
+        while geradas < linhas and len(vendas) < TAMANHO_LOTE:
+            pedido_id += 1
+            # Datas crescem com o id, como numa loja de verdade
+            data_venda = primeiro_dia + timedelta(days=geradas * dias // linhas)
+            n_itens = min(rng.randint(1, 5), linhas - geradas)
+            if rng.random() < 0.2:
+                cliente_id, cliente_nome, tipo = None, "Consumidor Final", "À Vista"
+            else:
+                cliente_id = rng.randint(1, clientes)
+                cliente_nome = nomes_clientes[cliente_id]
+                tipo = "À Vista" if rng.random() < 0.6 else "A Prazo"
+            vencimento = data_venda if tipo == "À Vista" else data_venda + timedelta(days=30)
+            total_pedido = 0.0
+            for _ in range(n_itens):
+                produto_id = rng.randint(1, produtos)
+                produto_nome, preco = cadastro_produtos[produto_id]
+                qtd = rng.randint(1, 4)
+                total = round(preco * qtd, 2)
+                total_pedido += total
+                if tipo == "À Vista":
+                    pago, status = total, "Recebido"
+                elif vencimento < hoje - timedelta(days=30) and rng.random() < 0.9:
+                    pago, status = total, "Recebido"  # fiado antigo quase sempre já foi pago
+                else:
+                    pago = round(total * rng.choice([0, 0, 0.5]), 2)
+                    status = "Pendente"
+                vendas.append((pedido_id, produto_id, produto_nome, cliente_id, cliente_nome, qtd, total,
+                               pago, tipo, data_venda, vencimento, status))
+            pedidos.append((pedido_id, cliente_id, cliente_nome, tipo, data_venda, vencimento, round(total_pedido, 2)))
+            geradas += n_itens
+
+        with database.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO pedidos (id, cliente_id, cliente_nome, tipo_pagamento, data_venda, data_vencimento, "
+                "total) VALUES (?, ?, ?, ?, ?, ?, ?)", pedidos)
+            conn.executemany(
+                "INSERT INTO vendas (pedido_id, produto_id, produto_nome, cliente_id, cliente_nome, qtd_vendida, "
+                "total, valor_pago, tipo_pagamento, data_venda, data_recebimento, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", vendas)
+        print(f"[gerador] {geradas}/{linhas} linhas de venda", flush=True)
+
+    with database.transaction() as conn:
+        # O trigger data os recebimentos com o dia de hoje; na base sintética cada um vai para o dia do pagamento
+        conn.execute('''
+            UPDATE recebimentos SET data = (
+                SELECT CASE WHEN v.tipo_pagamento = 'À Vista' THEN v.data_venda ELSE v.data_recebimento END
+                FROM vendas v WHERE v.id = recebimentos.venda_id)
+        ''')
+        conn.executemany(
+            "INSERT INTO caixa_movimentos (data, tipo, descricao, valor) VALUES (?, ?, ?, ?)",
+            ((hoje - timedelta(days=d), tipo, descricao, valor)
+             for d in range(dias)
+             for tipo, descricao, valor in (("Entrada", "Troco inicial", 100.0), ("Saida", "Despesas", 60.0))))
+    database.close_all_connections()
+    return time.perf_counter() - inicio
+
+
+def preparar_base(caminho, produtos, clientes, linhas, semente, recriar=False):
+    """Reaproveita a base de `caminho` se foi gerada com os mesmos parâmetros e schema; senão gera de novo."""
+    parametros = {"produtos": produtos, "clientes": clientes, "linhas": linhas, "semente": semente,
+                  "schema_version": database.SCHEMA_VERSION}
+    arquivo_parametros = caminho + ".json"
+    if not recriar and os.path.exists(caminho) and os.path.exists(arquivo_parametros):
+        with open(arquivo_parametros, encoding="utf-8") as f:
+            if json.load(f) == parametros:
+                database.DB_NAME = caminho
+                print(f"[gerador] reaproveitando {caminho}")
+                return
+    duracao = gerar_base(caminho, produtos, clientes, linhas, semente)
+    with open(arquivo_parametros, "w", encoding="utf-8") as f:
+        json.dump(parametros, f)
+    print(f"[gerador] base pronta em {duracao:.1f} s ({os.path.getsize(caminho) / 2 ** 20:.0f} MB)")
+
+
+# --- OPERAÇÕES MEDIDAS ---
+def operacoes(produtos, clientes, pedidos):
+    """(tela, nome, função que recebe o gerador aleatório) de cada consulta/escrita das telas."""
+    hoje = date.today()
+    mes = hoje - timedelta(days=29)
+    ano = hoje - timedelta(days=364)
+
+    def venda_nova(rng):
+        produto_id = rng.randint(1, produtos)
+        cliente_id = rng.randint(1, clientes)
+        itens = [{'id': produto_id, 'nome': f"Produto {produto_id}", 'qtd': 1, 'total_item': 10.0}]
+        database.registrar_venda(itens, cliente_id, f"Cliente {cliente_id}", "A Prazo", hoje,
+                                 hoje + timedelta(days=30))
+
+    return [
+        ("home", "vendas_do_dia", lambda rng: database.vendas_do_dia()),
+        ("home", "vendas_por_periodo 30d/dia", lambda rng: database.vendas_por_periodo(mes, hoje, "dia")),
+        ("home", "vendas_por_periodo 365d/mes", lambda rng: database.vendas_por_periodo(ano, hoje, "mes")),
+        ("home", "produtos_mais_vendidos 30d", lambda rng: database.produtos_mais_vendidos(mes, hoje)),
+        ("home", "total_a_receber", lambda rng: database.total_a_receber()),
+        ("home", "contar_produtos_em_alerta", lambda rng: database.contar_produtos_em_alerta()),
+        ("home", "ultimas_vendas", lambda rng: database.ultimas_vendas(5)),
+        ("vendas", "buscar_vendas 30d", lambda rng: database.buscar_vendas(mes, hoje)),
+        ("vendas", "buscar_vendas 30d + busca", lambda rng: database.buscar_vendas(mes, hoje, rng.choice(NOMES))),
+        ("vendas", "buscar_pedido", lambda rng: database.buscar_pedido(rng.randint(1, pedidos))),
+        ("vendas", "listar_clientes", lambda rng: database.listar_clientes()),
+        ("vendas", "registrar_venda", venda_nova),
+        ("estoque", "listar_produtos", lambda rng: database.listar_produtos()),
+        ("estoque", "atualizar_produto", lambda rng: database.atualizar_produto(
+            rng.randint(1, produtos), f"Produto {rng.randint(1, produtos)}", 10.0, rng.randint(0, 500), 5)),
+        ("financeiro", "resumo_financeiro", lambda rng: database.resumo_financeiro()),
+        ("financeiro", "listar_pendencias", lambda rng: database.listar_pendencias(rng.randint(1, clientes))),
+        ("financeiro", "listar_devedores", lambda rng: database.listar_devedores()),
+        ("financeiro", "extrato_financeiro 30d", lambda rng: database.extrato_financeiro(mes, hoje)),
+        ("financeiro", "resumo_extrato 30d", lambda rng: database.resumo_extrato(mes, hoje)),
+        ("financeiro", "baixar_pagamento_cliente", lambda rng: database.baixar_pagamento_cliente(
+            rng.randint(1, clientes), 5.0)),
+        ("clientes", "contar_clientes", lambda rng: database.contar_clientes()),
+        ("clientes", "buscar_cliente", lambda rng: database.buscar_cliente(rng.randint(1, clientes))),
+        ("clientes", "resumo_cliente", lambda rng: database.resumo_cliente(rng.randint(1, clientes))),
+        ("clientes", "historico_cliente 50", lambda rng: database.historico_cliente(rng.randint(1, clientes), 50)),
+    ]
+
+
+def percentil(ordenados, p):
+    """Percentil `p` (0-100) pelo método do posto mais próximo; `ordenados` em ordem crescente."""
+    indice = max(0, min(len(ordenados) - 1, -(-len(ordenados) * p // 100) - 1))
+    return ordenados[int(indice)]
+
+
+def medir(funcao, repeticoes, rng, com_cache=False):
+    """Tempos (ms, crescentes) de `repeticoes` chamadas, após uma de aquecimento.
+
+    Sem `com_cache` o cache de consultas é esvaziado antes de cada chamada: mede-se o SQL, não o acerto.
+    """
+    funcao(rng)
+    tempos = []
+    for _ in range(repeticoes):
+        if not com_cache:
+            database.limpar_cache_consultas()
+        inicio = time.perf_counter()
+        funcao(rng)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return sorted(tempos)
+
+
+def executar(repeticoes, semente, produtos, clientes, filtro=None, com_cache=False):
+    resultados = {}
+    pedidos = database.run_query("SELECT COALESCE(MAX(id), 1) FROM pedidos", fetch=True)[0][0]
+    for tela, nome, funcao in operacoes(produtos, clientes, pedidos):
+        chave = f"{tela}.{nome}"
+        if filtro and not any(f in chave for f in filtro):
+            continue
+        tempos = medir(funcao, repeticoes, random.Random(semente), com_cache)
+        resultados[chave] = {
+            "p50": percentil(tempos, 50), "p90": percentil(tempos, 90), "p99": percentil(tempos, 99),
+            "max": tempos[-1], "media": sum(tempos) / len(tempos), "n": len(tempos),
+        }
+        r = resultados[chave]
+        print(f"{chave:<45} {r['p50']:>9.2f} {r['p90']:>9.2f} {r['p99']:>9.2f} {r['max']:>9.2f}", flush=True)
+    return resultados
+
+
+def comparar(resultados, arquivo_base, tolerancia):
+    """Lista as operações cujo p50 ou p90 piorou mais que `tolerancia` (fração) em relação à base gravada."""
+    with open(arquivo_base, encoding="utf-8") as f:
+        base = json.load(f)["resultados"]
+    regressoes = []
+    for chave, atual in resultados.items():
+        anterior = base.get(chave)
+        if not anterior:
+            continue
+        for p in ("p50", "p90"):
+            # Diferenças abaixo de 0,5 ms são ruído de medição
+            if atual[p] > anterior[p] * (1 + tolerancia) and atual[p] - anterior[p] > 0.5:
+                regressoes.append((chave, p, anterior[p], atual[p]))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das consultas das telas sobre dados sintéticos.")
+    parser.add_argument("--banco", default=os.path.join(tempfile.gettempdir(), "loja_benchmark.db"))
+    parser.add_argument("--produtos", type=int, default=10_000)
+    parser.add_argument("--clientes", type=int, default=100_000)
+    parser.add_argument("--linhas", type=int, default=5_000_000, help="linhas de venda (itens de pedido)")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplica produtos, clientes e linhas")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--repeticoes", type=int, default=30)
+    parser.add_argument("--somente", nargs="*", help="mede só as operações cujo nome contém um destes trechos")
+    parser.add_argument("--com-cache", action="store_true", help="mantém o cache de consultas entre as chamadas")
+    parser.add_argument("--recriar", action="store_true", help="gera a base de novo mesmo se já existir")
+    parser.add_argument("--json", help="grava parâmetros e percentis neste arquivo")
+    parser.add_argument("--comparar", help="JSON de uma rodada anterior para apontar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceitável no --comparar (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    if os.path.abspath(args.banco) == os.path.abspath(database.DB_NAME):
+        parser.error("o benchmark não roda sobre o banco da loja; escolha outro --banco")
+    produtos = max(1, int(args.produtos * args.escala))
+    clientes = max(1, int(args.clientes * args.escala))
+    linhas = max(1, int(args.linhas * args.escala))
+    preparar_base(args.banco, produtos, clientes, linhas, args.semente, args.recriar)
+
+    print(f"\n{'operação (ms)':<45} {'p50':>9} {'p90':>9} {'p99':>9} {'máx':>9}")
+    resultados = executar(args.repeticoes, args.semente, produtos, clientes, args.somente, args.com_cache)
+    database.close_all_connections()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": {"produtos": produtos, "clientes": clientes, "linhas": linhas,
+                                      "semente": args.semente, "repeticoes": args.repeticoes,
+                                      "com_cache": args.com_cache},
+                       "resultados": resultados}, f, indent=2)
+    if args.comparar:
+        regressoes = comparar(resultados, args.comparar, args.tolerancia)
+        for chave, p, antes, depois in regressoes:
+            print(f"[regressão] {chave} {p}: {antes:.2f} ms -> {depois:.2f} ms")
+        if regressoes:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,46 @@
 # database.py
 import sqlite3
 import hashlib
+import json
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
 
 DB_NAME = 'loja_dados.db'
 
+# --- CONFIGURAÇÃO DE PERFORMANCE (ajustável por variável de ambiente) ---
+DB_POOL_SIZE = int(os.environ.get('LOJA_DB_POOL_SIZE', 8))
+DB_CACHE_SIZE_KB = int(os.environ.get('LOJA_DB_CACHE_KB', 16384))  # 16 MB de cache de páginas por conexão
+DB_MMAP_SIZE = int(os.environ.get('LOJA_DB_MMAP_BYTES', 64 * 1024 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('LOJA_DB_BUSY_TIMEOUT_MS', 5000))
+DB_STATEMENT_CACHE = int(os.environ.get('LOJA_DB_STATEMENT_CACHE', 256))
+# Escritas que ainda acham o banco ocupado depois do busy_timeout são repetidas com espera crescente
+DB_TENTATIVAS = int(os.environ.get('LOJA_DB_TENTATIVAS', 5))
+DB_ESPERA_BASE_MS = float(os.environ.get('LOJA_DB_ESPERA_BASE_MS', 50))
+DB_ESPERA_MAX_MS = float(os.environ.get('LOJA_DB_ESPERA_MAX_MS', 2000))
+# Escritor único (group commit): junta as escritas de todas as sessões em uma transação por lote
+ESCRITOR_UNICO = os.environ.get('LOJA_ESCRITOR_UNICO', '0') == '1'
+# Espera por mais escritas antes do commit; 0 = leva só o que já está na fila (as escritas se acumulam
+# enquanto o commit anterior roda). Janelas maiores fazem lotes maiores ao custo de latência.
+ESCRITOR_JANELA_MS = float(os.environ.get('LOJA_ESCRITOR_JANELA_MS', 0))
+ESCRITOR_LOTE_MAX = int(os.environ.get('LOJA_ESCRITOR_LOTE_MAX', 64))
+ESCRITOR_TIMEOUT_S = float(os.environ.get('LOJA_ESCRITOR_TIMEOUT_S', 30))  # espera máxima pelo commit de uma escrita
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('LOJA_QUERY_CACHE_ENTRIES', 256))
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('LOJA_QUERY_CACHE_MB', 32)) * 1024 * 1024
+PERFIL_CONSULTAS = os.environ.get('LOJA_PERFIL_CONSULTAS', '1') == '1'
+PERFIL_BUFFER = int(os.environ.get('LOJA_PERFIL_BUFFER', 2000))  # últimos comandos guardados em memória
+CONSULTA_LENTA_MS = float(os.environ.get('LOJA_CONSULTA_LENTA_MS', 200))
+LOG_CONSULTAS_LENTAS = os.environ.get('LOJA_LOG_CONSULTAS_LENTAS', '')  # arquivo .jsonl; vazio = só em memória
+
 
 # --- SEGURANÇA ---
 def make_hashes(password):
@@ -16,38 +53,597 @@ def check_hashes(password, hashed_text):
     return False
 
 
+# --- POOL DE CONEXÕES ---
+# O Streamlit roda cada rerun de cada sessão em uma thread própria, então as conexões
+# são emprestadas de um pool (uma conexão nunca é usada por duas threads ao mesmo tempo)
+# em vez de abrir/fechar o arquivo a cada consulta.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _abrir_conexao(db_name):
+    # isolation_level=None: cada comando faz autocommit; transações são explícitas (BEGIN)
+    conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False, cached_statements=DB_STATEMENT_CACHE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _get_pool(db_name):
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_name, queue.LifoQueue(maxsize=DB_POOL_SIZE))
+    return pool
+
+
+@contextmanager
+def get_connection():
+    """Empresta uma conexão do pool e devolve ao final (fecha se o pool estiver cheio)."""
+    pool = _get_pool(DB_NAME)
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _abrir_conexao(DB_NAME)
+    try:
+        yield conn
+    finally:
+        # Nunca devolve ao pool uma conexão com transação aberta
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+def close_all_connections():
+    parar_escritores()
+    with _pools_lock:
+        for pool in _pools.values():
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+        _pools.clear()
+    _fechar_sentinelas()
+    limpar_cache_consultas()
+
+
+@contextmanager
+def transaction(immediate=True):
+    """Abre uma transação explícita (BEGIN IMMEDIATE reserva a escrita logo no início).
+
+    Faz commit ao sair do bloco e rollback se ocorrer qualquer exceção.
+    """
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def _banco_ocupado(erro):
+    codigo = getattr(erro, 'sqlite_errorcode', None)
+    if codigo is not None:
+        return codigo & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)  # inclui códigos estendidos
+    return 'locked' in str(erro) or 'busy' in str(erro)
+
+
+def repetir_se_ocupado(funcao, tentativas=None):
+    """Chama `funcao()` e, se o banco estiver ocupado (SQLITE_BUSY/LOCKED), repete com espera exponencial
+    e jitter. A função deve abrir a própria transação, para cada tentativa começar do zero."""
+    tentativas = tentativas or DB_TENTATIVAS
+    for tentativa in range(tentativas):
+        try:
+            return funcao()
+        except sqlite3.OperationalError as e:
+            if not _banco_ocupado(e) or tentativa == tentativas - 1:
+                raise
+            espera_ms = min(DB_ESPERA_MAX_MS, DB_ESPERA_BASE_MS * 2 ** tentativa) * random.uniform(0.5, 1.0)
+            time.sleep(espera_ms / 1000)
+
+
+# --- ESCRITOR ÚNICO (group commit) ---
+# Com LOJA_ESCRITOR_UNICO=1 as escritas de todas as sessões vão para uma fila atendida por uma única thread
+# por banco, dona de uma conexão própria. A thread junta o que chega em até ESCRITOR_JANELA_MS em um lote
+# e grava o lote em uma única transação (um BEGIN IMMEDIATE e um commit por lote, em vez de um por escrita);
+# cada escrita roda em seu SAVEPOINT, então a falha de uma desfaz só ela. Os caixas deixam de disputar o
+# lock de escrita entre si e o resultado volta por um Future só depois do commit.
+_escritores = {}
+_escritores_lock = threading.Lock()
+_escritor_local = threading.local()  # .conn na thread escritora
+_escritor_stats = {"lotes": 0, "escritas": 0, "falhas": 0, "maior_lote": 0, "ms_total": 0.0}
+
+
+class EscritorIndisponivel(sqlite3.OperationalError):
+    """A thread do escritor único parou por erro (ex.: não conseguiu abrir o banco)."""
+
+
+class _Escritor:
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.fila = queue.SimpleQueue()
+        self.parado = False
+        self.falha = None  # exceção que derrubou a thread
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._rodar, name="escritor-sqlite", daemon=True)
+        self.thread.start()
+
+    def enviar(self, funcao):
+        """Enfileira `funcao(conn)`; retorna o Future ou None se o escritor já foi parado ou caiu."""
+        futuro = Future()
+        with self._lock:
+            if self.parado or not self.thread.is_alive():
+                return None
+            self.fila.put((funcao, futuro))
+        return futuro
+
+    def parar(self):
+        """Grava o que já está na fila e encerra a thread."""
+        with self._lock:
+            self.parado = True
+            self.fila.put(None)
+        self.thread.join()
+
+    def _rodar(self):
+        conn, lote = None, []
+        try:
+            conn = _abrir_conexao(self.db_name)
+            _escritor_local.conn = conn
+            parar = False
+            while not parar:
+                item = self.fila.get()
+                if item is None:
+                    break
+                lote, parar = self._coletar_lote(item)
+                self._gravar_lote(conn, lote)
+        except BaseException as e:
+            print(f"Escritor único parou: {e}")
+            self._encerrar(e, lote)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _encerrar(self, erro, lote):
+        """Marca o escritor como caído e falha as escritas em andamento e na fila, para ninguém esperar à toa."""
+        with self._lock:
+            self.parado = True
+            self.falha = erro
+        with _escritores_lock:  # a próxima escrita sobe um escritor novo
+            if _escritores.get(self.db_name) is self:
+                del _escritores[self.db_name]
+        pendentes = [futuro for _, futuro in lote]
+        while True:
+            try:
+                item = self.fila.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                pendentes.append(item[1])
+        for futuro in pendentes:
+            if not futuro.done():
+                futuro.set_exception(EscritorIndisponivel(f"escritor único parou: {erro}"))
+
+    def _coletar_lote(self, primeiro):
+        lote = [primeiro]
+        prazo = time.monotonic() + ESCRITOR_JANELA_MS / 1000
+        while len(lote) < ESCRITOR_LOTE_MAX:
+            try:
+                item = self.fila.get(timeout=max(0.0, prazo - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                return lote, True
+            lote.append(item)
+        return lote, False
+
+    def _gravar_lote(self, conn, lote):
+        lote = [(funcao, futuro) for funcao, futuro in lote if futuro.set_running_or_notify_cancel()]
+        if not lote:
+            return
+
+        def gravar():
+            resultados = []
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for funcao, _ in lote:
+                    conn.execute("SAVEPOINT escrita")
+                    try:
+                        resultados.append((funcao(conn), None))
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO escrita")
+                        resultados.append((None, e))
+                    conn.execute("RELEASE escrita")
+                conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    conn.rollback()
+                raise
+            return resultados
+
+        inicio = time.perf_counter()
+        try:
+            # BEGIN/COMMIT só acham o banco ocupado por escritas de outros processos
+            resultados = repetir_se_ocupado(gravar)
+        except Exception as e:
+            print(f"Erro no Banco (lote de {len(lote)} escritas): {e}")
+            resultados = [(None, e)] * len(lote)
+        with _escritores_lock:
+            _escritor_stats['lotes'] += 1
+            _escritor_stats['escritas'] += len(lote)
+            _escritor_stats['falhas'] += sum(erro is not None for _, erro in resultados)
+            _escritor_stats['maior_lote'] = max(_escritor_stats['maior_lote'], len(lote))
+            _escritor_stats['ms_total'] += (time.perf_counter() - inicio) * 1000
+        for (_, futuro), (valor, erro) in zip(lote, resultados):
+            if erro is not None:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(valor)
+
+
+def enviar_escrita(funcao):
+    """Enfileira `funcao(conn)` no escritor do banco atual (subindo a thread na primeira vez) e retorna
+    um Future com o que a função retornar, resolvido depois do commit do lote.
+
+    Levanta EscritorIndisponivel se a thread caiu; a próxima chamada tenta subir um escritor novo.
+    """
+    while True:
+        escritor = _escritores.get(DB_NAME)
+        if escritor is None:
+            with _escritores_lock:
+                escritor = _escritores.get(DB_NAME)
+                if escritor is None:
+                    escritor = _escritores[DB_NAME] = _Escritor(DB_NAME)
+        futuro = escritor.enviar(funcao)
+        if futuro is not None:
+            return futuro
+        with _escritores_lock:
+            if _escritores.get(DB_NAME) is escritor:
+                del _escritores[DB_NAME]
+        if escritor.falha is not None or not escritor.parado:
+            raise EscritorIndisponivel(f"escritor único parou: {escritor.falha}")
+
+
+def escrever(funcao):
+    """Roda `funcao(conn)` em uma transação de escrita e retorna o resultado; exceções de `funcao` sobem
+    para quem chamou, com a escrita desfeita.
+
+    Com ESCRITOR_UNICO vai para o escritor (group commit); sem ele abre a própria transação e repete se
+    o banco estiver ocupado. `funcao` deve usar só a conexão recebida e pode rodar mais de uma vez.
+    Se o escritor caiu, grava pelo caminho direto; se ele não confirmar em ESCRITOR_TIMEOUT_S, levanta
+    EscritorIndisponivel (a escrita ainda pode ser gravada depois).
+    """
+    conn = getattr(_escritor_local, 'conn', None)
+    if conn is not None:  # chamada de dentro de um lote: já está na transação do escritor
+        return funcao(conn)
+    if ESCRITOR_UNICO:
+        try:
+            return enviar_escrita(funcao).result(timeout=ESCRITOR_TIMEOUT_S)
+        except FutureTimeout:
+            raise EscritorIndisponivel(
+                f"escritor único não confirmou a escrita em {ESCRITOR_TIMEOUT_S:g} s") from None
+        except EscritorIndisponivel as e:  # a thread caiu antes de gravar esta escrita
+            print(f"{e}; gravando sem o escritor")
+
+    def gravar():
+        with transaction() as conn:
+            return funcao(conn)
+
+    return repetir_se_ocupado(gravar)
+
+
+def parar_escritores():
+    with _escritores_lock:
+        escritores = list(_escritores.values())
+        _escritores.clear()
+    for escritor in escritores:
+        escritor.parar()
+
+
+def estatisticas_escritor():
+    """Totais do escritor único: lotes, escritas, falhas, maior lote e tempo gasto nos lotes (ms)."""
+    with _escritores_lock:
+        return dict(_escritor_stats, ativo=bool(_escritores))
+
+
 # --- BANCO DE DADOS ---
-def run_query(query, params=(), fetch=False):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+def run_query(query, params=(), fetch=False, cache=False):
+    """Executa um comando; com fetch=True retorna as linhas. cache=True usa o cache compartilhado de leituras."""
+    if fetch and cache:
+        return _consultar_com_cache(query, params)
+    if not fetch and ESCRITOR_UNICO:
+        # Quem chamou é lido aqui: na thread escritora a pilha já não mostra a tela
+        chamada = _origem_chamada(1) if PERFIL_CONSULTAS else None
+        try:
+            escrever(lambda conn: _executar(conn, query, params, fetch, chamada))
+        except sqlite3.Error as e:  # o lote inteiro falhou (BEGIN/COMMIT)
+            print(f"Erro no Banco: {e}")
+        return None
+    with get_connection() as conn:
+        return _executar(conn, query, params, fetch)
+
+
+def _executar(conn, query, params, fetch, chamada=None):
+    inicio = time.perf_counter()
+    linhas, erro = None, None
     try:
-        c.execute(query, params)
+        c = conn.execute(query, params)
         if fetch:
-            data = c.fetchall()
-            return data
-        conn.commit()
+            linhas = c.fetchall()
+        qtd = len(linhas) if fetch else c.rowcount
     except sqlite3.Error as e:
         print(f"Erro no Banco: {e}")
-    finally:
-        conn.close()
+        erro, qtd = str(e), 0
+    if PERFIL_CONSULTAS:
+        _registrar_consulta(conn, query, params, (time.perf_counter() - inicio) * 1000, qtd, erro, chamada)
+    return linhas
 
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+# --- PERFIL DE CONSULTAS ---
+# Cada comando de run_query vira um registro (SQL normalizado, duração, linhas, quem chamou) num buffer
+# circular em memória e num agregado por SQL. Comandos acima de CONSULTA_LENTA_MS guardam também o
+# EXPLAIN QUERY PLAN e, com LOJA_LOG_CONSULTAS_LENTAS, vão para um arquivo JSON Lines (sem os parâmetros,
+# que podem ter dados de clientes). Observadores extras recebem cada registro (registrar_observador).
+_RE_LITERAIS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_RE_LISTA_PARAMETROS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_ESPACOS = re.compile(r"\s+")
+_perfil_lock = threading.Lock()
+_perfil_recentes = deque(maxlen=PERFIL_BUFFER)
+_perfil_agregado = {}  # SQL normalizado -> totais
+_PERFIL_MAX_SQL = 1000
+_observadores = []
+
+
+@lru_cache(maxsize=1024)
+def _normalizar_sql(query):
+    """SQL sem literais e com espaços colapsados, para agrupar execuções do mesmo comando."""
+    sql = _RE_ESPACOS.sub(" ", _RE_LITERAIS.sub("?", query)).strip()
+    return _RE_LISTA_PARAMETROS.sub("(?, ...)", sql)
+
+
+def _origem_chamada(acima=2):
+    """(função de database.py que fez a consulta, 'arquivo:função' de quem chamou essa função)."""
+    frame = sys._getframe(acima)
+    funcao = None
+    while frame is not None and frame.f_code.co_filename == __file__:
+        funcao = frame.f_code.co_name
+        frame = frame.f_back
+    if frame is None:
+        return funcao, None
+    arquivo = frame.f_code.co_filename
+    pasta = os.path.basename(os.path.dirname(arquivo))
+    nome = f"{pasta}/{os.path.basename(arquivo)}" if pasta == "views" else os.path.basename(arquivo)
+    return funcao, f"{nome}:{frame.f_code.co_name}"
+
+
+def _plano_consulta(conn, query, params):
+    try:
+        plano = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+    except sqlite3.Error:
+        return None
+    # (id, pai, _, detalhe): indenta cada passo pela profundidade na árvore
+    profundidade = {0: -1}
+    linhas = []
+    for no_id, pai, _, detalhe in plano:
+        profundidade[no_id] = profundidade.get(pai, -1) + 1
+        linhas.append("  " * profundidade[no_id] + detalhe)
+    return linhas
+
+
+def _gravar_consulta_lenta(registro):
+    try:
+        with _perfil_lock, open(LOG_CONSULTAS_LENTAS, "a", encoding="utf-8") as f:
+            linha = dict(registro, em=datetime.fromtimestamp(registro['em']).isoformat(timespec="milliseconds"))
+            f.write(json.dumps(linha, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Log de consultas lentas indisponível: {e}")
+
+
+def _registrar_consulta(conn, query, params, ms, linhas, erro, chamada=None):
+    funcao, origem = chamada or _origem_chamada()
+    registro = {"em": time.time(), "sql": _normalizar_sql(query), "ms": ms, "linhas": linhas,
+                "funcao": funcao, "origem": origem, "erro": erro, "plano": None}
+    if ms >= CONSULTA_LENTA_MS:
+        registro['plano'] = _plano_consulta(conn, query, params)
+        if LOG_CONSULTAS_LENTAS:
+            _gravar_consulta_lenta(registro)
+
+    _perfil_recentes.append(registro)
+    with _perfil_lock:
+        agregado = _perfil_agregado.get(registro['sql'])
+        if agregado is None and len(_perfil_agregado) < _PERFIL_MAX_SQL:
+            agregado = _perfil_agregado[registro['sql']] = {
+                "chamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "linhas": 0, "erros": 0, "lentas": 0,
+                "funcao": funcao, "origens": set()}
+        if agregado is not None:
+            agregado['chamadas'] += 1
+            agregado['total_ms'] += ms
+            agregado['max_ms'] = max(agregado['max_ms'], ms)
+            agregado['linhas'] += max(linhas, 0)
+            agregado['erros'] += erro is not None
+            agregado['lentas'] += ms >= CONSULTA_LENTA_MS
+            if origem and len(agregado['origens']) < 10:
+                agregado['origens'].add(origem)
+
+    for observador in list(_observadores):
+        try:
+            observador(registro)
+        except Exception as e:
+            print(f"Observador de consultas falhou: {e}")
+
+
+def registrar_observador(funcao):
+    """Chama `funcao(registro)` a cada comando executado por run_query (o registro é um dict)."""
+    _observadores.append(funcao)
+
+
+def remover_observador(funcao):
+    if funcao in _observadores:
+        _observadores.remove(funcao)
+
+
+def consultas_recentes(limite=None, somente_lentas=False):
+    """Registros do buffer circular, do mais recente para o mais antigo."""
+    registros = [r for r in reversed(list(_perfil_recentes)) if not somente_lentas or r['plano'] is not None]
+    return registros[:limite] if limite else registros
+
+
+def consultas_mais_custosas(limite=20, ordem="total_ms"):
+    """Comandos agrupados por SQL normalizado, ordenados por `ordem` (total_ms, max_ms, media_ms, chamadas).
+
+    O p95 vem das execuções ainda presentes no buffer circular.
+    """
+    duracoes = {}
+    for registro in list(_perfil_recentes):
+        duracoes.setdefault(registro['sql'], []).append(registro['ms'])
+    with _perfil_lock:
+        linhas = [dict(agregado, sql=sql, origens=sorted(agregado['origens']),
+                       media_ms=agregado['total_ms'] / agregado['chamadas'])
+                  for sql, agregado in _perfil_agregado.items()]
+    for linha in linhas:
+        recentes = sorted(duracoes.get(linha['sql'], []))
+        linha['p95_ms'] = recentes[min(len(recentes) - 1, int(len(recentes) * 0.95))] if recentes else None
+    return sorted(linhas, key=lambda linha: linha[ordem], reverse=True)[:limite]
 
-    # Tabelas do Sistema
-    c.execute(
+
+def limpar_perfil_consultas():
+    with _perfil_lock:
+        _perfil_recentes.clear()
+        _perfil_agregado.clear()
+
+
+# --- CACHE DE CONSULTAS (compartilhado entre sessões) ---
+# Leituras feitas com run_query(..., cache=True) ficam guardadas por (banco, SQL, parâmetros) junto
+# com a geração de cada tabela lida. Triggers incrementam a geração da tabela a cada escrita
+# (migração 9) e uma conexão sentinela consulta PRAGMA data_version, que só muda quando outra
+# conexão ou processo faz commit: sem commit novo, validar uma entrada não lê tabela nenhuma.
+_RE_TABELAS = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)', re.IGNORECASE)
+_cache_lock = threading.Lock()
+_cache_consultas = OrderedDict()  # chave -> (gerações das tabelas lidas, linhas, tamanho estimado)
+_cache_bytes = 0
+_cache_stats = {"hits": 0, "misses": 0, "invalidacoes": 0, "despejos": 0}
+_sentinelas = {}
+
+
+def _geracoes_atuais(db_name):
+    """Geração de cada tabela; relê geracoes_tabelas só se houve commit desde a última leitura.
+
+    Deve ser chamada com _cache_lock.
+    """
+    sentinela = _sentinelas.get(db_name)
+    if sentinela is None:
+        conn = sqlite3.connect(db_name, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False)
+        sentinela = _sentinelas[db_name] = {"conn": conn, "data_version": None, "geracoes": {}}
+    versao = sentinela['conn'].execute("PRAGMA data_version").fetchone()[0]
+    if versao != sentinela['data_version']:
+        sentinela['geracoes'] = dict(sentinela['conn'].execute("SELECT tabela, geracao FROM geracoes_tabelas"))
+        sentinela['data_version'] = versao
+    return sentinela['geracoes']
+
+
+def _tamanho_linhas(linhas):
+    return sys.getsizeof(linhas) + sum(sys.getsizeof(linha) + sum(sys.getsizeof(v) for v in linha)
+                                       for linha in linhas)
+
+
+def _remover_do_cache(chave):
+    global _cache_bytes
+    _, _, tamanho = _cache_consultas.pop(chave)
+    _cache_bytes -= tamanho
+
+
+def _consultar_com_cache(query, params):
+    global _cache_bytes
+    tabelas = sorted({t.lower() for t in _RE_TABELAS.findall(query)})
+    if not tabelas:
+        return run_query(query, params, fetch=True)
+    chave = (DB_NAME, query, tuple(params))
+
+    with _cache_lock:
+        try:
+            geracoes = _geracoes_atuais(DB_NAME)
+        except sqlite3.Error:
+            geracoes = None  # banco ainda sem a migração 9: consulta direta
+        if geracoes is not None:
+            # Gerações lidas ANTES da consulta: uma escrita concorrente deixa a entrada velha, nunca o contrário
+            versao = tuple(geracoes.get(t, 0) for t in tabelas)
+            entrada = _cache_consultas.get(chave)
+            if entrada is not None:
+                if entrada[0] == versao:
+                    _cache_consultas.move_to_end(chave)
+                    _cache_stats['hits'] += 1
+                    return list(entrada[1])
+                _remover_do_cache(chave)
+                _cache_stats['invalidacoes'] += 1
+            _cache_stats['misses'] += 1
+
+    linhas = run_query(query, params, fetch=True)
+    if geracoes is None or linhas is None:
+        return linhas
+    tamanho = _tamanho_linhas(linhas)
+    if tamanho > QUERY_CACHE_MAX_BYTES:
+        return linhas
+
+    with _cache_lock:
+        if chave in _cache_consultas:
+            _remover_do_cache(chave)
+        _cache_consultas[chave] = (versao, linhas, tamanho)
+        _cache_bytes += tamanho
+        # LRU: descarta as entradas usadas há mais tempo até caber nos limites
+        while len(_cache_consultas) > QUERY_CACHE_MAX_ENTRIES or _cache_bytes > QUERY_CACHE_MAX_BYTES:
+            _remover_do_cache(next(iter(_cache_consultas)))
+            _cache_stats['despejos'] += 1
+    return list(linhas)
+
+
+def limpar_cache_consultas():
+    global _cache_bytes
+    with _cache_lock:
+        _cache_consultas.clear()
+        _cache_bytes = 0
+
+
+def estatisticas_cache():
+    """Acertos, faltas, invalidações, despejos, entradas e bytes estimados do cache de consultas."""
+    with _cache_lock:
+        return dict(_cache_stats, entradas=len(_cache_consultas), bytes=_cache_bytes)
+
+
+def _fechar_sentinelas():
+    with _cache_lock:
+        for sentinela in _sentinelas.values():
+            sentinela['conn'].close()
+        _sentinelas.clear()
+
+
+# --- MIGRAÇÕES DE SCHEMA ---
+# Cada migração roda uma única vez; a versão aplicada fica gravada em PRAGMA user_version.
+# Para alterar o schema, adicione uma nova entrada no FINAL da lista (nunca edite as antigas).
+def _colunas(conn, tabela):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+
+
+def _migracao_tabelas_base(conn):
+    conn.execute(
         '''CREATE TABLE IF NOT EXISTS produtos (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, preco REAL, quantidade INTEGER, minimo_alerta INTEGER DEFAULT 5)''')
-    c.execute(
+    conn.execute(
         '''CREATE TABLE IF NOT EXISTS vendas (id INTEGER PRIMARY KEY AUTOINCREMENT, produto_id INTEGER, produto_nome TEXT, cliente_nome TEXT, qtd_vendida INTEGER, total REAL, valor_pago REAL DEFAULT 0, tipo_pagamento TEXT, data_venda DATE, data_recebimento DATE, status TEXT)''')
-    c.execute(
+    conn.execute(
         '''CREATE TABLE IF NOT EXISTS clientes (id INTEGER PRIMARY KEY AUTOINCREMENT, nome TEXT, telefone TEXT, cpf TEXT, endereco TEXT)''')
-    c.execute(
+    conn.execute(
         '''CREATE TABLE IF NOT EXISTS caixa_movimentos (id INTEGER PRIMARY KEY AUTOINCREMENT, data DATE, tipo TEXT, descricao TEXT, valor REAL)''')
-
-    # Tabela de Usuários
-    c.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS usuarios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT NOT NULL UNIQUE,
@@ -58,37 +654,499 @@ def init_db():
         )
     ''')
 
-    conn.commit()
-    conn.close()
+    # Bancos antigos foram criados sem estas colunas
+    colunas_faltando = {
+        'usuarios': [("nome_real", "TEXT"), ("permissoes", "TEXT"), ("mudar_senha", "INTEGER DEFAULT 0")],
+        'vendas': [("cliente_nome", "TEXT"), ("valor_pago", "REAL DEFAULT 0")],
+    }
+    for tabela, colunas in colunas_faltando.items():
+        existentes = _colunas(conn, tabela)
+        for coluna, tipo in colunas:
+            if coluna not in existentes:
+                conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
 
-    # --- MIGRAÇÃO E CORREÇÃO (Onde estava o erro) ---
-    try:
-        run_query("ALTER TABLE usuarios ADD COLUMN nome_real TEXT")
-    except:
-        pass
-    try:
-        run_query("ALTER TABLE usuarios ADD COLUMN permissoes TEXT")
-    except:
-        pass
-    try:
-        run_query("ALTER TABLE usuarios ADD COLUMN mudar_senha INTEGER DEFAULT 0")
-    except:
-        pass
 
-    # 1. Verifica se Admin existe
-    users = run_query("SELECT * FROM usuarios WHERE username = 'admin'", fetch=True)
+def _sql_somar_resumo(ref, sinal, chave):
+    """UPSERT que soma (sinal=+1) ou subtrai (sinal=-1) a linha `ref` (NEW/OLD) do resumo do cliente."""
+    return f'''
+        INSERT INTO resumo_clientes ({chave}, total_comprado, total_pago, saldo_aberto)
+        SELECT {ref}.{chave},
+               {sinal} * COALESCE({ref}.total, 0),
+               {sinal} * COALESCE({ref}.valor_pago, 0),
+               {sinal} * CASE WHEN {ref}.status = 'Pendente'
+                              THEN COALESCE({ref}.total, 0) - COALESCE({ref}.valor_pago, 0) ELSE 0 END
+        WHERE {ref}.{chave} IS NOT NULL
+        ON CONFLICT({chave}) DO UPDATE SET
+            total_comprado = ROUND(total_comprado + excluded.total_comprado, 2),
+            total_pago = ROUND(total_pago + excluded.total_pago, 2),
+            saldo_aberto = ROUND(saldo_aberto + excluded.saldo_aberto, 2);
+    '''
+
+
+def _sql_atualizar_datas_resumo(ref, chave):
+    # Datas via índices (cliente, data_venda) e parcial de pendentes: O(log n), não varre o histórico
+    return f'''
+        UPDATE resumo_clientes SET
+            ultima_compra = (SELECT MAX(data_venda) FROM vendas WHERE {chave} = {ref}.{chave}),
+            vencimento_mais_antigo = (SELECT MIN(data_recebimento) FROM vendas
+                                      WHERE status = 'Pendente' AND {chave} = {ref}.{chave}
+                                        AND total - valor_pago > 0.01)
+        WHERE {chave} = {ref}.{chave};
+    '''
+
+
+def _criar_resumo_clientes(conn, chave, tipo_chave):
+    """Cria, preenche e liga os triggers de resumo_clientes usando a coluna `chave` de vendas."""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS resumo_clientes (
+            {chave} {tipo_chave} PRIMARY KEY,
+            total_comprado REAL DEFAULT 0,
+            total_pago REAL DEFAULT 0,
+            saldo_aberto REAL DEFAULT 0,
+            ultima_compra DATE,
+            vencimento_mais_antigo DATE
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_resumo_clientes_devedores ON resumo_clientes(vencimento_mais_antigo) "
+                 "WHERE saldo_aberto > 0.01")
+
+    conn.execute(f'''
+        INSERT OR REPLACE INTO resumo_clientes
+            ({chave}, total_comprado, total_pago, saldo_aberto, ultima_compra, vencimento_mais_antigo)
+        SELECT {chave},
+               ROUND(SUM(COALESCE(total, 0)), 2),
+               ROUND(SUM(COALESCE(valor_pago, 0)), 2),
+               ROUND(SUM(CASE WHEN status = 'Pendente' THEN COALESCE(total, 0) - COALESCE(valor_pago, 0) ELSE 0 END), 2),
+               MAX(data_venda),
+               MIN(CASE WHEN status = 'Pendente' AND total - valor_pago > 0.01 THEN data_recebimento END)
+        FROM vendas WHERE {chave} IS NOT NULL GROUP BY {chave}
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_resumo_ins AFTER INSERT ON vendas
+        WHEN NEW.{chave} IS NOT NULL
+        BEGIN
+            {_sql_somar_resumo('NEW', 1, chave)}
+            {_sql_atualizar_datas_resumo('NEW', chave)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_resumo_upd
+        AFTER UPDATE OF {chave}, total, valor_pago, status, data_venda, data_recebimento ON vendas
+        BEGIN
+            {_sql_somar_resumo('OLD', -1, chave)}
+            {_sql_somar_resumo('NEW', 1, chave)}
+            {_sql_atualizar_datas_resumo('OLD', chave)}
+            {_sql_atualizar_datas_resumo('NEW', chave)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_resumo_del AFTER DELETE ON vendas
+        WHEN OLD.{chave} IS NOT NULL
+        BEGIN
+            {_sql_somar_resumo('OLD', -1, chave)}
+            {_sql_atualizar_datas_resumo('OLD', chave)}
+        END
+    ''')
+
+
+def _migracao_resumo_clientes(conn):
+    # (cliente_nome, data_venda) atende o histórico do cliente e a última compra
+    conn.execute("DROP INDEX IF EXISTS idx_vendas_cliente_nome")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_cliente_data ON vendas(cliente_nome, data_venda)")
+    _criar_resumo_clientes(conn, 'cliente_nome', 'TEXT')
+
+
+def _migracao_pedidos(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pedidos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER REFERENCES clientes(id),
+            cliente_nome TEXT,
+            tipo_pagamento TEXT,
+            data_venda DATE,
+            data_vencimento DATE,
+            total REAL,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    existentes = _colunas(conn, 'vendas')
+    if 'pedido_id' not in existentes:
+        conn.execute("ALTER TABLE vendas ADD COLUMN pedido_id INTEGER REFERENCES pedidos(id)")
+    if 'cliente_id' not in existentes:
+        conn.execute("ALTER TABLE vendas ADD COLUMN cliente_id INTEGER REFERENCES clientes(id)")
+    if 'cliente_id' not in _colunas(conn, 'pagamentos_clientes'):
+        conn.execute("ALTER TABLE pagamentos_clientes ADD COLUMN cliente_id INTEGER REFERENCES clientes(id)")
+
+    # O resumo passa a ser por cliente_id: remove a versão por nome antes de mexer em vendas
+    for trigger in ("trg_vendas_resumo_ins", "trg_vendas_resumo_upd", "trg_vendas_resumo_del"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS resumo_clientes")
+
+    # Nomes de vendas antigas sem cadastro ganham um cliente, para toda venda identificada ter cliente_id
+    conn.execute('''
+        INSERT INTO clientes (nome)
+        SELECT DISTINCT cliente_nome FROM vendas
+        WHERE cliente_nome IS NOT NULL AND cliente_nome <> 'Consumidor Final'
+          AND cliente_nome NOT IN (SELECT nome FROM clientes WHERE nome IS NOT NULL)
+    ''')
+    conn.execute('''
+        UPDATE vendas SET cliente_id = (SELECT MIN(c.id) FROM clientes c WHERE c.nome = vendas.cliente_nome)
+        WHERE cliente_id IS NULL AND cliente_nome <> 'Consumidor Final'
+    ''')
+    conn.execute('''
+        UPDATE pagamentos_clientes
+        SET cliente_id = (SELECT MIN(c.id) FROM clientes c WHERE c.nome = pagamentos_clientes.cliente_nome)
+        WHERE cliente_id IS NULL
+    ''')
+
+    # Vendas antigas não têm número de pedido: linhas consecutivas do mesmo cliente, forma de
+    # pagamento e data são agrupadas em um pedido
+    linhas = conn.execute('''
+        SELECT id, cliente_id, cliente_nome, tipo_pagamento, data_venda, data_recebimento, total
+        FROM vendas WHERE pedido_id IS NULL ORDER BY id
+    ''').fetchall()
+    grupos = []
+    for venda_id, cliente_id, cliente_nome, tipo, data_venda, data_receb, total in linhas:
+        chave = (cliente_nome, tipo, data_venda)
+        if not grupos or grupos[-1]['chave'] != chave:
+            grupos.append({"chave": chave, "cliente_id": cliente_id, "vencimento": data_receb, "total": 0.0,
+                           "ids": []})
+        grupos[-1]['total'] += total or 0.0
+        grupos[-1]['ids'].append(venda_id)
+    for grupo in grupos:
+        cliente_nome, tipo, data_venda = grupo['chave']
+        cursor = conn.execute(
+            "INSERT INTO pedidos (cliente_id, cliente_nome, tipo_pagamento, data_venda, data_vencimento, total) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (grupo['cliente_id'], cliente_nome, tipo, data_venda, grupo['vencimento'], round(grupo['total'], 2)))
+        conn.executemany("UPDATE vendas SET pedido_id = ? WHERE id = ?",
+                         [(cursor.lastrowid, venda_id) for venda_id in grupo['ids']])
+
+    # Índices por chave inteira substituem os índices por nome
+    conn.execute("DROP INDEX IF EXISTS idx_vendas_cliente_data")
+    conn.execute("DROP INDEX IF EXISTS idx_vendas_pendentes")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_pedido ON vendas(pedido_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_cliente_id_data ON vendas(cliente_id, data_venda)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_pendentes_cliente "
+                 "ON vendas(cliente_id, data_recebimento, total, valor_pago) WHERE status = 'Pendente'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_cliente ON pedidos(cliente_id, data_venda)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pedidos_data ON pedidos(data_venda)")
+    conn.execute("DROP INDEX IF EXISTS idx_pagamentos_clientes_cliente")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pagamentos_clientes_cliente ON pagamentos_clientes(cliente_id, data)")
+
+    _criar_resumo_clientes(conn, 'cliente_id', 'INTEGER')
+
+
+def _sql_somar_vendas_diarias(ref, sinal):
+    """UPSERTs que somam (sinal=+1) ou subtraem (sinal=-1) a linha `ref` de vendas nos consolidados do dia."""
+    return f'''
+        INSERT INTO vendas_diarias (data, total, itens, linhas)
+        SELECT {ref}.data_venda, {sinal} * COALESCE({ref}.total, 0), {sinal} * COALESCE({ref}.qtd_vendida, 0), {sinal}
+        WHERE {ref}.data_venda IS NOT NULL
+        ON CONFLICT(data) DO UPDATE SET
+            total = ROUND(total + excluded.total, 2),
+            itens = itens + excluded.itens,
+            linhas = linhas + excluded.linhas;
+        INSERT INTO vendas_diarias_produto (data, produto_id, produto_nome, total, quantidade)
+        SELECT {ref}.data_venda, COALESCE({ref}.produto_id, 0), {ref}.produto_nome,
+               {sinal} * COALESCE({ref}.total, 0), {sinal} * COALESCE({ref}.qtd_vendida, 0)
+        WHERE {ref}.data_venda IS NOT NULL
+        ON CONFLICT(data, produto_id) DO UPDATE SET
+            produto_nome = COALESCE(excluded.produto_nome, produto_nome),
+            total = ROUND(total + excluded.total, 2),
+            quantidade = quantidade + excluded.quantidade;
+    '''
+
+
+def _sql_somar_pedidos_diarios(ref, sinal):
+    return f'''
+        INSERT INTO vendas_diarias (data, pedidos) SELECT {ref}.data_venda, {sinal}
+        WHERE {ref}.data_venda IS NOT NULL
+        ON CONFLICT(data) DO UPDATE SET pedidos = pedidos + excluded.pedidos;
+    '''
+
+
+def _migracao_vendas_diarias(conn):
+    # Consolidados por dia e por dia x produto: o painel lê no máximo um registro por dia do período,
+    # não importa quantos anos de vendas existam
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_diarias (
+            data DATE PRIMARY KEY,
+            total REAL NOT NULL DEFAULT 0,
+            itens INTEGER NOT NULL DEFAULT 0,
+            linhas INTEGER NOT NULL DEFAULT 0,
+            pedidos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_diarias_produto (
+            data DATE NOT NULL,
+            produto_id INTEGER NOT NULL,
+            produto_nome TEXT,
+            total REAL NOT NULL DEFAULT 0,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (data, produto_id)
+        ) WITHOUT ROWID
+    ''')
+
+    conn.execute('''
+        INSERT OR REPLACE INTO vendas_diarias (data, total, itens, linhas, pedidos)
+        SELECT v.data_venda, ROUND(SUM(COALESCE(v.total, 0)), 2), SUM(COALESCE(v.qtd_vendida, 0)), COUNT(*),
+               (SELECT COUNT(*) FROM pedidos p WHERE p.data_venda = v.data_venda)
+        FROM vendas v WHERE v.data_venda IS NOT NULL GROUP BY v.data_venda
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO vendas_diarias_produto (data, produto_id, produto_nome, total, quantidade)
+        SELECT data_venda, COALESCE(produto_id, 0), MAX(produto_nome), ROUND(SUM(COALESCE(total, 0)), 2),
+               SUM(COALESCE(qtd_vendida, 0))
+        FROM vendas WHERE data_venda IS NOT NULL GROUP BY data_venda, COALESCE(produto_id, 0)
+    ''')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_diarias_ins AFTER INSERT ON vendas
+        BEGIN
+            {_sql_somar_vendas_diarias('NEW', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_diarias_upd
+        AFTER UPDATE OF data_venda, produto_id, produto_nome, qtd_vendida, total ON vendas
+        BEGIN
+            {_sql_somar_vendas_diarias('OLD', -1)}
+            {_sql_somar_vendas_diarias('NEW', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_diarias_del AFTER DELETE ON vendas
+        BEGIN
+            {_sql_somar_vendas_diarias('OLD', -1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_pedidos_diarios_ins AFTER INSERT ON pedidos
+        BEGIN
+            {_sql_somar_pedidos_diarios('NEW', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_pedidos_diarios_upd AFTER UPDATE OF data_venda ON pedidos
+        BEGIN
+            {_sql_somar_pedidos_diarios('OLD', -1)}
+            {_sql_somar_pedidos_diarios('NEW', 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_pedidos_diarios_del AFTER DELETE ON pedidos
+        BEGIN
+            {_sql_somar_pedidos_diarios('OLD', -1)}
+        END
+    ''')
+
 
-    if not users:
-        # Se não existe, cria do zero
+def _migracao_versao_resumo_clientes(conn):
+    # Versão por cliente: muda a cada venda/pagamento do cliente ou alteração do cadastro, e serve
+    # de chave para documentos gerados a partir desses dados (extratos em PDF)
+    if 'versao' not in _colunas(conn, 'resumo_clientes'):
+        conn.execute("ALTER TABLE resumo_clientes ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_versao_cliente_ins AFTER INSERT ON vendas
+        WHEN NEW.cliente_id IS NOT NULL
+        BEGIN
+            UPDATE resumo_clientes SET versao = versao + 1 WHERE cliente_id = NEW.cliente_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_versao_cliente_upd AFTER UPDATE ON vendas
+        BEGIN
+            UPDATE resumo_clientes SET versao = versao + 1 WHERE cliente_id IN (OLD.cliente_id, NEW.cliente_id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_vendas_versao_cliente_del AFTER DELETE ON vendas
+        WHEN OLD.cliente_id IS NOT NULL
+        BEGIN
+            UPDATE resumo_clientes SET versao = versao + 1 WHERE cliente_id = OLD.cliente_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_clientes_versao_upd AFTER UPDATE ON clientes
+        BEGIN
+            UPDATE resumo_clientes SET versao = versao + 1 WHERE cliente_id = NEW.id;
+        END
+    ''')
+
+
+# Tabelas cujas escritas invalidam o cache de consultas. Tabela nova em migração futura: chame
+# _vigiar_tabela para ela na própria migração.
+_TABELAS_VIGIADAS = ["produtos", "vendas", "clientes", "caixa_movimentos", "usuarios", "recebimentos",
+                     "fechamentos_caixa", "pagamentos_clientes", "resumo_clientes", "pedidos", "vendas_diarias",
+                     "vendas_diarias_produto"]
+
+
+def _vigiar_tabela(conn, tabela):
+    for operacao in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_geracao_{tabela}_{operacao.lower()} AFTER {operacao} ON {tabela}
+            BEGIN
+                INSERT INTO geracoes_tabelas (tabela, geracao) VALUES ('{tabela}', 1)
+                ON CONFLICT(tabela) DO UPDATE SET geracao = geracao + 1;
+            END
+        ''')
+
+
+def _migracao_geracoes_tabelas(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geracoes_tabelas (
+            tabela TEXT PRIMARY KEY,
+            geracao INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    for tabela in _TABELAS_VIGIADAS:
+        _vigiar_tabela(conn, tabela)
+
+
+def _migracao_fila_emails(conn):
+    # Caixa de saída: o e-mail é gravado aqui e enviado em segundo plano (fila_emails.py).
+    # A senha SMTP nunca é gravada: fica só na memória do processo que envia.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS emails_pendentes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remetente TEXT NOT NULL,
+            destinatario TEXT NOT NULL,
+            assunto TEXT,
+            corpo TEXT,
+            anexo BLOB,
+            anexo_nome TEXT,
+            status TEXT NOT NULL DEFAULT 'Pendente',
+            tentativas INTEGER NOT NULL DEFAULT 0,
+            proxima_tentativa TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_erro TEXT,
+            criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            enviado_em TIMESTAMP
+        )
+    ''')
+    # Parcial: só o que ainda está na fila, na ordem em que deve sair
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_emails_pendentes_fila ON emails_pendentes(proxima_tentativa) "
+                 "WHERE status = 'Pendente'")
+    _vigiar_tabela(conn, "emails_pendentes")
+
+
+MIGRACOES = [
+    (1, "Tabelas base e colunas legadas", _migracao_tabelas_base),
+    (2, "Índices de vendas e estoque", [
+        "CREATE INDEX IF NOT EXISTS idx_vendas_data_venda ON vendas(data_venda)",
+        "CREATE INDEX IF NOT EXISTS idx_vendas_cliente_nome ON vendas(cliente_nome)",
+        # Parcial e cobrindo: só as vendas em aberto (fiado), já com os valores para somar o saldo
+        "CREATE INDEX IF NOT EXISTS idx_vendas_pendentes ON vendas(cliente_nome, data_recebimento, total, valor_pago) "
+        "WHERE status = 'Pendente'",
+        # Parcial: contém apenas os produtos abaixo do mínimo (alerta de reposição)
+        "CREATE INDEX IF NOT EXISTS idx_produtos_estoque_baixo ON produtos(id) WHERE quantidade <= minimo_alerta",
+        "ANALYZE",
+    ]),
+    (3, "Livro de recebimentos e fechamento de caixa", [
+        # Cada alteração de valor_pago vira uma linha no livro (append-only), datada do dia em que ocorreu
+        "CREATE TABLE IF NOT EXISTS recebimentos (id INTEGER PRIMARY KEY AUTOINCREMENT, venda_id INTEGER, data DATE, valor REAL)",
+        '''INSERT INTO recebimentos (venda_id, data, valor)
+           SELECT id, CASE WHEN tipo_pagamento = 'À Vista' THEN data_venda ELSE COALESCE(data_recebimento, data_venda) END,
+                  valor_pago
+           FROM vendas WHERE valor_pago > 0 ORDER BY id''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_vendas_recebimento_ins AFTER INSERT ON vendas
+           WHEN NEW.valor_pago > 0
+           BEGIN
+               INSERT INTO recebimentos (venda_id, data, valor) VALUES (NEW.id, date('now', 'localtime'), NEW.valor_pago);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_vendas_recebimento_upd AFTER UPDATE OF valor_pago ON vendas
+           WHEN NEW.valor_pago IS NOT OLD.valor_pago
+           BEGIN
+               INSERT INTO recebimentos (venda_id, data, valor)
+               VALUES (NEW.id, date('now', 'localtime'), COALESCE(NEW.valor_pago, 0) - COALESCE(OLD.valor_pago, 0));
+           END''',
+        # Fechamento diário: valores do período + acumulados + marcas d'água (último id de cada livro)
+        '''CREATE TABLE IF NOT EXISTS fechamentos_caixa (
+               data DATE PRIMARY KEY,
+               receitas REAL, suprimentos REAL, sangrias REAL,
+               receita_acumulada REAL, suprimentos_acumulados REAL, sangrias_acumuladas REAL,
+               saldo REAL, a_receber REAL,
+               ultimo_recebimento_id INTEGER, ultimo_movimento_id INTEGER,
+               fechado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_fechamentos_sem_update BEFORE UPDATE ON fechamentos_caixa
+           BEGIN SELECT RAISE(ABORT, 'Fechamento de caixa não pode ser alterado'); END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_fechamentos_sem_delete BEFORE DELETE ON fechamentos_caixa
+           BEGIN SELECT RAISE(ABORT, 'Fechamento de caixa não pode ser excluído'); END''',
+    ]),
+    (4, "Índices por data para o extrato", [
+        "CREATE INDEX IF NOT EXISTS idx_caixa_movimentos_data ON caixa_movimentos(data)",
+        "CREATE INDEX IF NOT EXISTS idx_recebimentos_data ON recebimentos(data)",
+    ]),
+    (5, "Registro de pagamentos de clientes", [
+        '''CREATE TABLE IF NOT EXISTS pagamentos_clientes (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               cliente_nome TEXT, data DATE, valor REAL, valor_aplicado REAL, vendas_afetadas INTEGER,
+               registrado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        "CREATE INDEX IF NOT EXISTS idx_pagamentos_clientes_cliente ON pagamentos_clientes(cliente_nome, data)",
+    ]),
+    (6, "Resumo financeiro por cliente mantido por triggers", _migracao_resumo_clientes),
+    (7, "Pedidos (cabeçalho) e vendas ligadas por cliente_id", _migracao_pedidos),
+    (8, "Consolidados de vendas por dia e por produto", _migracao_vendas_diarias),
+    (9, "Gerações por tabela para invalidar o cache de consultas", _migracao_geracoes_tabelas),
+    (10, "Versão dos dados de cada cliente", _migracao_versao_resumo_clientes),
+    (11, "Caixa de saída de e-mails", _migracao_fila_emails),
+]
+
+SCHEMA_VERSION = MIGRACOES[-1][0]
+
+
+def get_schema_version():
+    return run_query("PRAGMA user_version", fetch=True)[0][0]
+
+
+def migrate():
+    """Aplica, em ordem, as migrações ainda não registradas em PRAGMA user_version.
+
+    Retorna a lista de migrações aplicadas (vazia quando o banco já está atualizado).
+    """
+    if get_schema_version() >= SCHEMA_VERSION:
+        return []
+
+    aplicadas = []
+    # BEGIN IMMEDIATE: se dois processos subirem juntos, o segundo espera e relê a versão
+    with transaction() as conn:
+        versao_atual = conn.execute("PRAGMA user_version").fetchone()[0]
+        for numero, descricao, passo in MIGRACOES:
+            if numero <= versao_atual:
+                continue
+            if callable(passo):
+                passo(conn)
+            else:
+                for sql in passo:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {numero}")
+            aplicadas.append((numero, descricao))
+    return aplicadas
+
+
+def garantir_admin():
+    # Só escreve quando o admin não existe ou está com permissões/nome incorretos
+    admin = run_query("SELECT permissoes, nome_real FROM usuarios WHERE username = 'admin'", fetch=True)
+
+    if not admin:
         senha_hash = make_hashes("123")
         run_query(
             "INSERT INTO usuarios (username, password, nome_real, permissoes, mudar_senha) VALUES (?, ?, ?, ?, ?)",
             ("admin", senha_hash, "Administrador", "admin", 0))
-    else:
-        # CORREÇÃO: Se já existe, FORÇA a permissão correta para garantir que não fique NULL
+    elif admin[0] != ('admin', 'Administrador'):
+        # CORREÇÃO: FORÇA a permissão correta para garantir que não fique NULL
         run_query("UPDATE usuarios SET permissoes = 'admin', nome_real = 'Administrador' WHERE username = 'admin'")
 
 
+def init_db():
+    migrate()
+    garantir_admin()
+
+
 def get_user_data(username):
     return run_query("SELECT password, nome_real, permissoes, mudar_senha FROM usuarios WHERE username = ?",
                      (username,), fetch=True)
@@ -96,4 +1154,544 @@ def get_user_data(username):
 
 def update_user_password(username, new_password):
     new_hash = make_hashes(new_password)
-    run_query("UPDATE usuarios SET password = ?, mudar_senha = 0 WHERE username = ?", (new_hash, username))
\ No newline at end of file
+    run_query("UPDATE usuarios SET password = ?, mudar_senha = 0 WHERE username = ?", (new_hash, username))
+
+
+# --- PRODUTOS ---
+def listar_produtos():
+    """Todos os produtos: (id, nome, preco, quantidade, minimo_alerta)."""
+    return run_query("SELECT id, nome, preco, quantidade, minimo_alerta FROM produtos", fetch=True, cache=True) or []
+
+
+def contar_produtos_em_alerta():
+    """Quantos produtos estão com estoque no mínimo ou abaixo (índice parcial idx_produtos_estoque_baixo)."""
+    return run_query("SELECT COUNT(*) FROM produtos WHERE quantidade <= minimo_alerta", fetch=True, cache=True)[0][0]
+
+
+def cadastrar_produto(nome, preco, quantidade, minimo_alerta):
+    run_query("INSERT INTO produtos (nome, preco, quantidade, minimo_alerta) VALUES (?, ?, ?, ?)",
+              (nome, preco, quantidade, minimo_alerta))
+
+
+def atualizar_produto(produto_id, nome, preco, quantidade, minimo_alerta):
+    run_query("UPDATE produtos SET nome=?, preco=?, quantidade=?, minimo_alerta=? WHERE id=?",
+              (nome, preco, quantidade, minimo_alerta, produto_id))
+
+
+# --- CLIENTES ---
+def listar_clientes():
+    """Todos os clientes: (id, nome, telefone, cpf, endereco)."""
+    return run_query("SELECT id, nome, telefone, cpf, endereco FROM clientes", fetch=True, cache=True) or []
+
+
+def contar_clientes():
+    return run_query("SELECT COUNT(*) FROM clientes", fetch=True, cache=True)[0][0]
+
+
+def buscar_cliente(cliente_id):
+    """Cadastro do cliente (dict com nome, telefone, cpf, endereco) pela PK, ou None."""
+    dados = run_query("SELECT nome, telefone, cpf, endereco FROM clientes WHERE id = ?", (cliente_id,), fetch=True)
+    return dict(zip(["nome", "telefone", "cpf", "endereco"], dados[0])) if dados else None
+
+
+def cadastrar_cliente(nome, telefone, cpf, endereco):
+    run_query("INSERT INTO clientes (nome, telefone, cpf, endereco) VALUES (?, ?, ?, ?)",
+              (nome, telefone, cpf, endereco))
+
+
+def atualizar_cliente(cliente_id, nome, telefone, cpf, endereco):
+    run_query("UPDATE clientes SET nome=?, telefone=?, cpf=?, endereco=? WHERE id=?",
+              (nome, telefone, cpf, endereco, cliente_id))
+
+
+# --- VENDAS ---
+class EstoqueInsuficiente(Exception):
+    """Algum item do carrinho não tinha estoque no momento da venda; nada foi gravado.
+
+    `itens` traz o resultado de cada linha do carrinho: dict com indice, id, nome, qtd, disponivel
+    (estoque lido na hora; None se o produto não existe mais) e aceito.
+    """
+
+    def __init__(self, itens):
+        self.itens = itens
+        super().__init__("; ".join(f"{i['nome']}: pedido {i['qtd']}, disponível {i['disponivel']}"
+                                   for i in itens if not i['aceito']))
+
+
+def _reservar_estoque(conn, itens):
+    """Baixa o estoque linha a linha só onde há saldo (WHERE quantidade >= ?); retorna o resultado de cada linha.
+
+    Roda dentro da transação da venda: com BEGIN IMMEDIATE nenhum outro caixa escreve entre a conferência
+    e a baixa, e o rollback desfaz as linhas aceitas se alguma for recusada.
+    """
+    resultado = []
+    for indice, item in enumerate(itens):
+        linha = conn.execute("UPDATE produtos SET quantidade = quantidade - ? WHERE id = ? AND quantidade >= ? "
+                             "RETURNING quantidade", (item['qtd'], item['id'], item['qtd'])).fetchone()
+        if linha is not None:
+            disponivel = linha[0] + item['qtd']
+        else:
+            atual = conn.execute("SELECT quantidade FROM produtos WHERE id = ?", (item['id'],)).fetchone()
+            disponivel = atual[0] if atual else None
+        resultado.append({"indice": indice, "id": item['id'], "nome": item['nome'], "qtd": item['qtd'],
+                          "disponivel": disponivel, "aceito": linha is not None})
+    return resultado
+
+
+def registrar_venda(itens, cliente_id, cliente_nome, tipo_pagamento, data_venda, data_recebimento):
+    """Grava o pedido, todos os itens do carrinho e baixa o estoque em uma única transação.
+
+    `cliente_id` é None para "Consumidor Final". Retorna (id do pedido, ids criados em `vendas`).
+    Levanta EstoqueInsuficiente (com o resultado de cada linha) se algum item não tiver saldo:
+    a venda é tudo ou nada. A gravação passa por escrever() (escritor único, se ligado).
+    """
+    if not itens:
+        return None, []
+    a_vista = tipo_pagamento == "À Vista"
+    status = "Recebido" if a_vista else "Pendente"
+    total_pedido = round(sum(item['total_item'] for item in itens), 2)
+
+    def gravar(conn):
+        reserva = _reservar_estoque(conn, itens)
+        if not all(linha['aceito'] for linha in reserva):
+            raise EstoqueInsuficiente(reserva)
+
+        pedido_id = conn.execute(
+            "INSERT INTO pedidos (cliente_id, cliente_nome, tipo_pagamento, data_venda, data_vencimento, total) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (cliente_id, cliente_nome, tipo_pagamento, data_venda, data_recebimento, total_pedido)).lastrowid
+        linhas = [(pedido_id, item['id'], item['nome'], cliente_id, cliente_nome, item['qtd'], item['total_item'],
+                   item['total_item'] if a_vista else 0.0, tipo_pagamento, data_venda, data_recebimento, status)
+                  for item in itens]
+        conn.executemany(
+            '''INSERT INTO vendas (pedido_id, produto_id, produto_nome, cliente_id, cliente_nome, qtd_vendida, total, valor_pago, tipo_pagamento, data_venda, data_recebimento, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            linhas)
+        # Com o lock de escrita e AUTOINCREMENT os ids do lote são consecutivos
+        ultimo_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return pedido_id, list(range(ultimo_id - len(linhas) + 1, ultimo_id + 1))
+
+    return escrever(gravar)
+
+
+def buscar_pedido(pedido_id):
+    """Cabeçalho (dict) e itens de um pedido, ambos por chave; None se o pedido não existir."""
+    cabecalho = run_query('''
+        SELECT p.id, COALESCE(c.nome, p.cliente_nome), p.tipo_pagamento, p.data_venda, p.data_vencimento, p.total
+        FROM pedidos p LEFT JOIN clientes c ON c.id = p.cliente_id
+        WHERE p.id = ?
+    ''', (pedido_id,), fetch=True)
+    if not cabecalho:
+        return None
+    pedido = dict(zip(["id", "cliente", "tipo_pagamento", "data_venda", "data_vencimento", "total"], cabecalho[0]))
+    pedido['itens'] = [
+        {"nome": nome, "qtd": qtd, "preco": total / qtd if qtd else total, "total_item": total}
+        for nome, qtd, total in run_query(
+            "SELECT produto_nome, qtd_vendida, total FROM vendas WHERE pedido_id = ? ORDER BY id",
+            (pedido_id,), fetch=True)
+    ]
+    return pedido
+
+
+def buscar_vendas(data_inicio, data_fim, busca=None):
+    """Linhas de venda do período (pedido, data, cliente, produto, qtd, total, status), das mais novas para
+    as mais antigas; `busca` filtra por trecho do nome do cliente ou do produto.
+
+    O cliente sai com o nome atual do cadastro (a venda guarda o nome da época; Consumidor Final não tem id).
+    """
+    query = ("SELECT v.pedido_id, v.data_venda, COALESCE(c.nome, v.cliente_nome), v.produto_nome, v.qtd_vendida, "
+             "v.total, v.status FROM vendas v LEFT JOIN clientes c ON c.id = v.cliente_id "
+             "WHERE v.data_venda BETWEEN ? AND ?")
+    params = [data_inicio, data_fim]
+    if busca:
+        query += " AND (COALESCE(c.nome, v.cliente_nome) LIKE ? OR v.produto_nome LIKE ?)"
+        params.extend([f"%{busca}%", f"%{busca}%"])
+    return run_query(query + " ORDER BY v.id DESC", tuple(params), fetch=True)
+
+
+def ultimas_vendas(limite=5):
+    """Últimas linhas de venda lançadas: (cliente, total, status), com o nome atual do cliente."""
+    return run_query("SELECT COALESCE(c.nome, v.cliente_nome), v.total, v.status "
+                     "FROM vendas v LEFT JOIN clientes c ON c.id = v.cliente_id ORDER BY v.id DESC LIMIT ?",
+                     (limite,), fetch=True, cache=True)
+
+
+# --- PAINEL (consolidados diários) ---
+# Chave do balde para cada agrupamento; semanas começam na segunda-feira
+_BALDES_PERIODO = {
+    "dia": "data",
+    "semana": "date(data, 'weekday 0', '-6 days')",
+    "mes": "strftime('%Y-%m-01', data)",
+}
+
+
+def vendas_do_dia(dia=None):
+    """Total vendido, pedidos e itens do dia (padrão: hoje) em uma busca pela PK de vendas_diarias."""
+    dados = run_query("SELECT total, pedidos, itens FROM vendas_diarias WHERE data = ?",
+                      (dia or date.today(),), fetch=True, cache=True)
+    total, pedidos, itens = dados[0] if dados else (0.0, 0, 0)
+    return {"total": total, "pedidos": pedidos, "itens": itens}
+
+
+def vendas_por_periodo(data_inicio, data_fim, agrupamento="dia"):
+    """Lista (início do balde, total, pedidos) entre as datas, agrupada por 'dia', 'semana' ou 'mes'.
+
+    Lê só os consolidados do intervalo (no máximo um registro por dia), independente do histórico.
+    """
+    balde = _BALDES_PERIODO[agrupamento]
+    return run_query(f'''
+        SELECT {balde} AS balde, ROUND(SUM(total), 2), SUM(pedidos)
+        FROM vendas_diarias WHERE data BETWEEN ? AND ?
+        GROUP BY balde ORDER BY balde
+    ''', (data_inicio, data_fim), fetch=True, cache=True)
+
+
+def produtos_mais_vendidos(data_inicio, data_fim, limite=5):
+    """Lista (produto, quantidade, total) dos produtos que mais faturaram no intervalo."""
+    return run_query('''
+        SELECT MAX(produto_nome), SUM(quantidade), ROUND(SUM(total), 2)
+        FROM vendas_diarias_produto WHERE data BETWEEN ? AND ?
+        GROUP BY produto_id HAVING SUM(quantidade) > 0
+        ORDER BY SUM(total) DESC LIMIT ?
+    ''', (data_inicio, data_fim, limite), fetch=True, cache=True)
+
+
+# --- FINANCEIRO ---
+_COLUNAS_FECHAMENTO = ["data", "receitas", "suprimentos", "sangrias", "receita_acumulada", "suprimentos_acumulados",
+                       "sangrias_acumuladas", "saldo", "a_receber", "ultimo_recebimento_id", "ultimo_movimento_id",
+                       "fechado_em"]
+
+
+def _ultimo_fechamento(conn, ate=None):
+    sql = f"SELECT {', '.join(_COLUNAS_FECHAMENTO)} FROM fechamentos_caixa"
+    params = ()
+    if ate is not None:
+        sql += " WHERE data <= ?"
+        params = (ate,)
+    row = conn.execute(sql + " ORDER BY data DESC LIMIT 1", params).fetchone()
+    return dict(zip(_COLUNAS_FECHAMENTO, row)) if row else None
+
+
+def _movimento_desde(conn, fechamento):
+    """Soma apenas o que entrou nos livros depois das marcas d'água do fechamento (busca por rowid)."""
+    ultimo_rec = fechamento['ultimo_recebimento_id'] if fechamento else 0
+    ultimo_mov = fechamento['ultimo_movimento_id'] if fechamento else 0
+    receitas, suprimentos, sangrias, max_rec, max_mov = conn.execute('''
+        SELECT
+            (SELECT COALESCE(SUM(valor), 0) FROM recebimentos WHERE id > ?),
+            (SELECT COALESCE(SUM(valor), 0) FROM caixa_movimentos WHERE id > ? AND tipo = 'Entrada'),
+            (SELECT COALESCE(SUM(valor), 0) FROM caixa_movimentos WHERE id > ? AND tipo = 'Saida'),
+            (SELECT COALESCE(MAX(id), 0) FROM recebimentos),
+            (SELECT COALESCE(MAX(id), 0) FROM caixa_movimentos)
+    ''', (ultimo_rec, ultimo_mov, ultimo_mov)).fetchone()
+    return {"receitas": receitas, "suprimentos": suprimentos, "sangrias": sangrias,
+            "ultimo_recebimento_id": max_rec, "ultimo_movimento_id": max_mov}
+
+
+def _total_a_receber(conn):
+    return conn.execute('''
+        SELECT COALESCE(SUM(total - valor_pago), 0) FROM vendas
+        WHERE status = 'Pendente' AND total - valor_pago > 0.001
+    ''').fetchone()[0]
+
+
+def resumo_financeiro():
+    """KPIs do caixa: último fechamento + movimento posterior a ele (sem reler o histórico)."""
+    with transaction(immediate=False) as conn:
+        fechamento = _ultimo_fechamento(conn)
+        delta = _movimento_desde(conn, fechamento)
+        a_receber = _total_a_receber(conn)
+
+    receita = delta['receitas'] + (fechamento['receita_acumulada'] if fechamento else 0.0)
+    suprimentos = delta['suprimentos'] + (fechamento['suprimentos_acumulados'] if fechamento else 0.0)
+    sangrias = delta['sangrias'] + (fechamento['sangrias_acumuladas'] if fechamento else 0.0)
+    return {
+        "receita_vendas": receita,
+        "total_a_receber": a_receber,
+        "total_sup": suprimentos,
+        "total_san": sangrias,
+        "saldo_atual": (receita + suprimentos) - sangrias,
+    }
+
+
+def total_a_receber():
+    """Soma do que os clientes ainda devem (vendas pendentes)."""
+    return run_query('''
+        SELECT COALESCE(SUM(total - valor_pago), 0) FROM vendas
+        WHERE status = 'Pendente' AND total - valor_pago > 0.001
+    ''', fetch=True, cache=True)[0][0]
+
+
+def lancar_movimento_caixa(tipo, descricao, valor, data=None):
+    """Lança um suprimento (`tipo` 'Entrada') ou sangria ('Saida') manual no caixa."""
+    run_query("INSERT INTO caixa_movimentos (data, tipo, descricao, valor) VALUES (?, ?, ?, ?)",
+              (data or date.today(), tipo, descricao, valor))
+
+
+def fechar_caixa(dia=None):
+    """Grava o fechamento imutável do dia (padrão: hoje) e retorna a linha gravada.
+
+    O fechamento cobre tudo que entrou nos livros desde o fechamento anterior. Lançamentos feitos
+    depois do fechamento entram no próximo. Levanta ValueError se o dia já (ou um dia posterior) foi fechado.
+    A gravação passa por escrever() (escritor único, se ligado).
+    """
+    dia = (dia or date.today()).isoformat()
+
+    def gravar(conn):
+        anterior = _ultimo_fechamento(conn)
+        if anterior and anterior['data'] >= dia:
+            raise ValueError(f"O caixa já foi fechado em {anterior['data']}.")
+
+        delta = _movimento_desde(conn, anterior)
+        receita_acum = delta['receitas'] + (anterior['receita_acumulada'] if anterior else 0.0)
+        sup_acum = delta['suprimentos'] + (anterior['suprimentos_acumulados'] if anterior else 0.0)
+        san_acum = delta['sangrias'] + (anterior['sangrias_acumuladas'] if anterior else 0.0)
+
+        conn.execute(f'''
+            INSERT INTO fechamentos_caixa ({', '.join(_COLUNAS_FECHAMENTO[:-1])})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (dia, delta['receitas'], delta['suprimentos'], delta['sangrias'], receita_acum, sup_acum, san_acum,
+              (receita_acum + sup_acum) - san_acum, _total_a_receber(conn),
+              delta['ultimo_recebimento_id'], delta['ultimo_movimento_id']))
+        return _ultimo_fechamento(conn)
+
+    return escrever(gravar)
+
+
+def saldo_em(dia):
+    """Fechamento vigente em `dia` (o mais recente até essa data) ou None. Consulta única pela PK."""
+    with get_connection() as conn:
+        return _ultimo_fechamento(conn, ate=dia)
+
+
+def listar_fechamentos(limite=30):
+    return run_query(f"SELECT {', '.join(_COLUNAS_FECHAMENTO[:9])} FROM fechamentos_caixa ORDER BY data DESC LIMIT ?",
+                     (limite,), fetch=True)
+
+
+def listar_pendencias(cliente_id=None):
+    # Usa o índice parcial idx_vendas_pendentes_cliente (filtrando pelo cliente quando informado)
+    query = ("SELECT v.id, v.produto_nome, COALESCE(c.nome, v.cliente_nome), v.total, v.valor_pago, "
+             "v.data_recebimento FROM vendas v LEFT JOIN clientes c ON c.id = v.cliente_id "
+             "WHERE v.status = 'Pendente' AND v.total - v.valor_pago > 0.01")
+    params = ()
+    if cliente_id is not None:
+        query += " AND v.cliente_id = ?"
+        params = (cliente_id,)
+    return run_query(query + " ORDER BY v.data_recebimento, v.id", params, fetch=True)
+
+
+def listar_devedores():
+    """Clientes com saldo em aberto (id, nome, saldo, vencimento mais antigo), do vencimento mais antigo
+    para o mais novo (tabela resumo_clientes)."""
+    return run_query(
+        "SELECT r.cliente_id, c.nome, r.saldo_aberto, r.vencimento_mais_antigo "
+        "FROM resumo_clientes r JOIN clientes c ON c.id = r.cliente_id "
+        "WHERE r.saldo_aberto > 0.01 ORDER BY r.vencimento_mais_antigo",
+        fetch=True, cache=True)
+
+
+def listar_dividas_devedores():
+    """Cadastro e vendas em aberto de todos os devedores, ordenados por cliente e data, em uma consulta.
+
+    Cada linha: (cliente_id, nome, telefone, cpf, endereco, venda_id, produto, total, pago, data_venda, status).
+    """
+    return run_query('''
+        SELECT c.id, c.nome, c.telefone, c.cpf, c.endereco,
+               v.id, v.produto_nome, v.total, v.valor_pago, v.data_venda, v.status
+        FROM resumo_clientes r
+        JOIN clientes c ON c.id = r.cliente_id
+        JOIN vendas v ON v.cliente_id = r.cliente_id AND v.status = 'Pendente' AND v.total - v.valor_pago > 0.01
+        WHERE r.saldo_aberto > 0.01
+        ORDER BY c.nome, c.id, v.data_venda, v.id
+    ''', fetch=True) or []
+
+
+def resumo_cliente(cliente_id):
+    """Totais do cliente (comprado, pago, em aberto, última compra, vencimento mais antigo) e a versão
+    dos seus dados, em uma busca pela PK."""
+    dados = run_query(
+        "SELECT total_comprado, total_pago, saldo_aberto, ultima_compra, vencimento_mais_antigo, versao "
+        "FROM resumo_clientes WHERE cliente_id = ?",
+        (cliente_id,), fetch=True, cache=True)
+    if not dados:
+        return None
+    return dict(zip(["total_comprado", "total_pago", "saldo_aberto", "ultima_compra", "vencimento_mais_antigo",
+                     "versao"], dados[0]))
+
+
+def historico_cliente(cliente_id, limite=None):
+    """Vendas do cliente (id, produto, total, pago, data, status), da mais recente para a mais antiga.
+
+    Percorre o índice (cliente_id, data_venda) de trás para frente; com `limite` lê só as últimas linhas.
+    """
+    query = ("SELECT id, produto_nome, total, valor_pago, data_venda, status FROM vendas "
+             "WHERE cliente_id = ? ORDER BY data_venda DESC, id DESC")
+    params = (cliente_id,)
+    if limite is not None:
+        query += " LIMIT ?"
+        params += (limite,)
+    return run_query(query, params, fetch=True)
+
+
+def baixar_pagamento_cliente(cliente_id, valor, data=None):
+    """Abate um pagamento das dívidas do cliente em ordem de vencimento (FIFO), em uma única transação.
+
+    Os saldos são relidos dentro do BEGIN IMMEDIATE, então dois operadores dando baixa no mesmo
+    cliente não trabalham sobre dados desatualizados. O pagamento fica registrado em
+    `pagamentos_clientes`. Retorna um dict com o id do pagamento, o valor aplicado e o que sobrou.
+    Levanta ValueError se o cliente não existe (nada é gravado). A gravação passa por escrever()
+    (escritor único, se ligado).
+    """
+    data = data or date.today()
+
+    def gravar(conn):
+        # Sem o cliente não há como registrar o pagamento: não abate dívida sem a linha de auditoria
+        cliente = conn.execute("SELECT nome FROM clientes WHERE id = ?", (cliente_id,)).fetchone()
+        if cliente is None:
+            raise ValueError(f"Cliente {cliente_id} não encontrado.")
+
+        dividas = conn.execute(
+            "SELECT id, total, valor_pago FROM vendas "
+            "WHERE status = 'Pendente' AND cliente_id = ? AND total - valor_pago > 0.01 "
+            "ORDER BY data_recebimento, id",
+            (cliente_id,)).fetchall()
+
+        valor_restante = round(valor, 2)
+        atualizacoes = []
+        for venda_id, total, pago in dividas:
+            if valor_restante <= 0:
+                break
+            divida_atual = round(total - pago, 2)
+            if valor_restante >= divida_atual:
+                atualizacoes.append((total, 'Recebido', data, venda_id))
+                valor_restante = round(valor_restante - divida_atual, 2)
+            else:
+                atualizacoes.append((pago + valor_restante, 'Pendente', data, venda_id))
+                valor_restante = 0.0
+
+        conn.executemany("UPDATE vendas SET valor_pago = ?, status = ?, data_recebimento = ? WHERE id = ?",
+                         atualizacoes)
+        valor_aplicado = round(valor - valor_restante, 2)
+        cursor = conn.execute(
+            "INSERT INTO pagamentos_clientes "
+            "(cliente_id, cliente_nome, data, valor, valor_aplicado, vendas_afetadas) VALUES (?, ?, ?, ?, ?, ?)",
+            (cliente_id, cliente[0], data, valor, valor_aplicado, len(atualizacoes)))
+
+        return {"pagamento_id": cursor.lastrowid, "valor_aplicado": valor_aplicado, "valor_restante": valor_restante,
+                "vendas_afetadas": len(atualizacoes)}
+
+    return escrever(gravar)
+
+
+# --- EXTRATO ---
+# Movimentos manuais + recebimentos de vendas em uma única consulta, já ordenada e paginada no SQL.
+# `origem`/`ordem_id` desempatam lançamentos do mesmo dia para a paginação ser estável.
+_SQL_EXTRATO = '''
+    SELECT data, descricao, valor, ref FROM (
+        SELECT m.data AS data,
+               UPPER(m.tipo) || ': ' || COALESCE(m.descricao, '') AS descricao,
+               CASE WHEN m.tipo = 'Saida' THEN -m.valor ELSE m.valor END AS valor,
+               'Manual' AS ref, 0 AS origem, m.id AS ordem_id
+        FROM caixa_movimentos m
+        WHERE m.data BETWEEN :inicio AND :fim
+        UNION ALL
+        SELECT r.data,
+               'RECEBIMENTO: ' || COALESCE(v.produto_nome, '') || ' (' || COALESCE(c.nome, v.cliente_nome, '') || ')',
+               r.valor, 'Venda', 1, r.id
+        FROM recebimentos r
+        JOIN vendas v ON v.id = r.venda_id
+        LEFT JOIN clientes c ON c.id = v.cliente_id
+        WHERE r.data BETWEEN :inicio AND :fim
+    )
+    ORDER BY data DESC, origem DESC, ordem_id DESC
+'''
+
+
+def extrato_financeiro(data_inicio, data_fim, limite=50, offset=0):
+    """Uma página do extrato unificado (Data, Descrição, Valor, Ref), do mais recente para o mais antigo."""
+    return run_query(_SQL_EXTRATO + " LIMIT :limite OFFSET :offset",
+                     {"inicio": data_inicio, "fim": data_fim, "limite": limite, "offset": offset}, fetch=True)
+
+
+def resumo_extrato(data_inicio, data_fim):
+    """Quantidade de lançamentos, entradas e saídas do período (para paginação e totais)."""
+    return run_query('''
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN valor > 0 THEN valor END), 0),
+               COALESCE(SUM(CASE WHEN valor < 0 THEN -valor END), 0)
+        FROM (
+            SELECT CASE WHEN tipo = 'Saida' THEN -valor ELSE valor END AS valor
+            FROM caixa_movimentos WHERE data BETWEEN :inicio AND :fim
+            UNION ALL
+            SELECT valor FROM recebimentos WHERE data BETWEEN :inicio AND :fim
+        )
+    ''', {"inicio": data_inicio, "fim": data_fim}, fetch=True)[0]
+
+
+def iterar_extrato(data_inicio, data_fim, tamanho_lote=5000):
+    """Percorre o extrato do período em lotes (fetchmany), sem materializar tudo na memória."""
+    with transaction(immediate=False) as conn:
+        cursor = conn.execute(_SQL_EXTRATO, {"inicio": data_inicio, "fim": data_fim})
+        while True:
+            lote = cursor.fetchmany(tamanho_lote)
+            if not lote:
+                break
+            yield lote
+
+
+# --- FILA DE E-MAILS ---
+_COLUNAS_EMAIL = ["id", "remetente", "destinatario", "assunto", "corpo", "anexo", "anexo_nome", "tentativas"]
+
+
+def enfileirar_email(remetente, destinatario, assunto, corpo, anexo=None, anexo_nome=None):
+    """Grava o e-mail na caixa de saída e retorna o id; o envio é feito pelo worker de fila_emails."""
+    return escrever(lambda conn: conn.execute(
+        "INSERT INTO emails_pendentes (remetente, destinatario, assunto, corpo, anexo, anexo_nome) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (remetente, destinatario, assunto, corpo, anexo, anexo_nome)).lastrowid)
+
+
+def reservar_emails(remetentes, limite=20):
+    """Marca como 'Enviando' e retorna (dicts) os e-mails vencidos dos remetentes informados.
+
+    A reserva é atômica (UPDATE ... RETURNING), então dois workers nunca pegam o mesmo e-mail.
+    """
+    if not remetentes:
+        return []
+    marcadores = ", ".join("?" for _ in remetentes)
+    linhas = escrever(lambda conn: conn.execute(f'''
+        UPDATE emails_pendentes SET status = 'Enviando'
+        WHERE id IN (SELECT id FROM emails_pendentes
+                     WHERE status = 'Pendente' AND proxima_tentativa <= CURRENT_TIMESTAMP
+                       AND remetente IN ({marcadores})
+                     ORDER BY proxima_tentativa, id LIMIT ?)
+        RETURNING {", ".join(_COLUNAS_EMAIL)}
+    ''', (*remetentes, limite)).fetchall())
+    return sorted((dict(zip(_COLUNAS_EMAIL, linha)) for linha in linhas), key=lambda email: email['id'])
+
+
+def marcar_email_enviado(email_id):
+    run_query("UPDATE emails_pendentes SET status = 'Enviado', tentativas = tentativas + 1, ultimo_erro = NULL, "
+              "enviado_em = CURRENT_TIMESTAMP, anexo = NULL WHERE id = ?", (email_id,))
+
+
+def marcar_email_falha(email_id, erro, espera_segundos=None):
+    """Registra a falha; com `espera_segundos` o e-mail volta para a fila, sem ele fica como 'Falhou'."""
+    if espera_segundos is None:
+        run_query("UPDATE emails_pendentes SET status = 'Falhou', tentativas = tentativas + 1, ultimo_erro = ? "
+                  "WHERE id = ?", (erro, email_id))
+    else:
+        run_query("UPDATE emails_pendentes SET status = 'Pendente', tentativas = tentativas + 1, ultimo_erro = ?, "
+                  "proxima_tentativa = datetime('now', ?) WHERE id = ?",
+                  (erro, f"+{int(espera_segundos)} seconds", email_id))
+
+
+def devolver_emails_em_envio():
+    """Volta para a fila o que ficou 'Enviando' quando o processo anterior parou no meio do envio."""
+    run_query("UPDATE emails_pendentes SET status = 'Pendente' WHERE status = 'Enviando'")
+
+
+def listar_emails(limite=10):
+    """Últimos e-mails da caixa de saída: (id, destinatário, assunto, status, tentativas, erro, criado, enviado)."""
+    return run_query(
+        "SELECT id, destinatario, assunto, status, tentativas, ultimo_erro, criado_em, enviado_em "
+        "FROM emails_pendentes ORDER BY id DESC LIMIT ?", (limite,), fetch=True)
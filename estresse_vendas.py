@@ -0,0 +1,162 @@
+# estresse_vendas.py
+"""Teste de estresse do checkout: vários caixas concluindo vendas ao mesmo tempo no mesmo banco.
+
+Uso:
+    python estresse_vendas.py                           # 2 processos x 8 caixas, 200 vendas por caixa
+    python estresse_vendas.py --processos 4 --caixas 4 --estoque 20
+    python estresse_vendas.py --escritor                # mesmas vendas pelo escritor único (group commit)
+
+Com pouco estoque por produto os caixas disputam as últimas unidades. Ao final confere, produto a
+produto, que o estoque nunca ficou negativo e que estoque inicial - vendido = estoque atual, e mede
+a vazão. Sai com código 1 se alguma conferência falhar. Roda sobre um banco temporário (--banco).
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import database
+
+
+def preparar_banco(caminho, produtos, estoque):
+    database.close_all_connections()
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    database.DB_NAME = caminho
+    database.init_db()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO produtos (id, nome, preco, quantidade, minimo_alerta) VALUES (?, ?, ?, ?, 0)",
+                         [(i, f"Produto {i}", 10.0, estoque) for i in range(1, produtos + 1)])
+        conn.execute("INSERT INTO clientes (id, nome) VALUES (1, 'Cliente Estresse')")
+    database.close_all_connections()
+
+
+def _caixa(numero, vendas, produtos, semente, largada, resultados):
+    rng = random.Random(semente * 1000 + numero)
+    largada.wait()
+    for _ in range(vendas):
+        itens = []
+        for _ in range(rng.randint(1, 3)):
+            produto_id = rng.randint(1, produtos)
+            qtd = rng.randint(1, 3)
+            itens.append({'id': produto_id, 'nome': f"Produto {produto_id}", 'qtd': qtd, 'total_item': qtd * 10.0})
+        a_prazo = rng.random() < 0.3
+        inicio = time.perf_counter()
+        try:
+            database.registrar_venda(itens, 1 if a_prazo else None, "Cliente Estresse" if a_prazo else
+                                     "Consumidor Final", "A Prazo" if a_prazo else "À Vista", date.today(),
+                                     date.today())
+            resultado = "ok"
+        except database.EstoqueInsuficiente:
+            resultado = "recusada"
+        except sqlite3.Error as e:
+            resultado = f"erro: {e}"
+        resultados.append((resultado, (time.perf_counter() - inicio) * 1000))
+
+
+def rodar_processo(caminho, primeiro_caixa, caixas, vendas, produtos, semente, escritor=False):
+    """Roda `caixas` threads (caixas) neste processo; retorna ([(resultado, ms)] de todas as tentativas,
+    estatísticas do escritor único)."""
+    database.DB_NAME = caminho
+    database.ESCRITOR_UNICO = escritor
+    largada = threading.Barrier(caixas)
+    resultados = []
+    threads = [threading.Thread(target=_caixa, args=(primeiro_caixa + i, vendas, produtos, semente, largada,
+                                                     resultados))
+               for i in range(caixas)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    database.close_all_connections()
+    return resultados, database.estatisticas_escritor()
+
+
+def conferir(caminho, estoque):
+    """Lista de problemas encontrados (vazia = estoque consistente)."""
+    conn = sqlite3.connect(caminho)
+    problemas = []
+    for produto_id, quantidade, vendido in conn.execute('''
+        SELECT p.id, p.quantidade, COALESCE(SUM(v.qtd_vendida), 0)
+        FROM produtos p LEFT JOIN vendas v ON v.produto_id = p.id
+        GROUP BY p.id
+    '''):
+        if quantidade < 0:
+            problemas.append(f"produto {produto_id} com estoque negativo ({quantidade})")
+        if estoque - vendido != quantidade:
+            problemas.append(f"produto {produto_id}: {estoque} - {vendido} vendidos != {quantidade} em estoque")
+    sem_pedido = conn.execute("SELECT COUNT(*) FROM vendas WHERE pedido_id IS NULL").fetchone()[0]
+    if sem_pedido:
+        problemas.append(f"{sem_pedido} linhas de venda sem pedido")
+    conn.close()
+    return problemas
+
+
+def percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))] if ordenados else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estresse de vendas concorrentes sobre o mesmo estoque.")
+    parser.add_argument("--banco", default=os.path.join(tempfile.gettempdir(), "loja_estresse.db"))
+    parser.add_argument("--processos", type=int, default=2)
+    parser.add_argument("--caixas", type=int, default=8, help="threads (caixas) por processo")
+    parser.add_argument("--vendas", type=int, default=200, help="vendas tentadas por caixa")
+    parser.add_argument("--produtos", type=int, default=10)
+    parser.add_argument("--estoque", type=int, default=100, help="estoque inicial de cada produto")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--escritor", action="store_true", help="grava pelo escritor único (LOJA_ESCRITOR_UNICO)")
+    args = parser.parse_args(argv)
+
+    if os.path.abspath(args.banco) == os.path.abspath(database.DB_NAME):
+        parser.error("o estresse não roda sobre o banco da loja; escolha outro --banco")
+    preparar_banco(args.banco, args.produtos, args.estoque)
+
+    inicio = time.perf_counter()
+    with ProcessPoolExecutor(args.processos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = [pool.submit(rodar_processo, args.banco, p * args.caixas, args.caixas, args.vendas, args.produtos,
+                               args.semente, args.escritor)
+                   for p in range(args.processos)]
+        retornos = [futuro.result() for futuro in futuros]
+    resultados = [r for resultados_processo, _ in retornos for r in resultados_processo]
+    duracao = time.perf_counter() - inicio
+
+    contagem = {}
+    for resultado, _ in resultados:
+        chave = "erro" if resultado.startswith("erro") else resultado
+        contagem[chave] = contagem.get(chave, 0) + 1
+    erros = sorted({r for r, _ in resultados if r.startswith("erro")})
+    tempos = sorted(ms for _, ms in resultados)
+
+    print(f"{args.processos} processos x {args.caixas} caixas, {len(resultados)} tentativas em {duracao:.2f} s")
+    print(f"concluídas: {contagem.get('ok', 0)}  recusadas por estoque: {contagem.get('recusada', 0)}  "
+          f"erros: {contagem.get('erro', 0)}")
+    print(f"vazão: {len(resultados) / duracao:.0f} tentativas/s, {contagem.get('ok', 0) / duracao:.0f} vendas/s")
+    print(f"latência (ms): p50 {percentil(tempos, 50):.1f}  p95 {percentil(tempos, 95):.1f}  "
+          f"p99 {percentil(tempos, 99):.1f}  máx {tempos[-1] if tempos else 0:.1f}")
+    if args.escritor:
+        lotes = sum(stats['lotes'] for _, stats in retornos)
+        escritas = sum(stats['escritas'] for _, stats in retornos)
+        print(f"escritor único: {escritas} escritas em {lotes} transações "
+              f"(média {escritas / max(lotes, 1):.1f} por lote, maior {max(s['maior_lote'] for _, s in retornos)})")
+    for erro in erros[:5]:
+        print(f"  {erro}")
+
+    problemas = conferir(args.banco, args.estoque)
+    for problema in problemas:
+        print(f"[FALHA] {problema}")
+    if not problemas:
+        print("estoque consistente: nenhum produto negativo e vendido = baixado")
+    return 1 if problemas or erros else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# fila_emails.py
+import os
+import smtplib
+import threading
+import time
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from database import (enfileirar_email, reservar_emails, marcar_email_enviado, marcar_email_falha,
+                      devolver_emails_em_envio)
+
+# --- CONFIGURAÇÃO (ajustável por variável de ambiente) ---
+SMTP_HOST = os.environ.get('LOJA_SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.environ.get('LOJA_SMTP_PORT', 587))
+SMTP_STARTTLS = os.environ.get('LOJA_SMTP_STARTTLS', '1') == '1'
+SMTP_TIMEOUT = float(os.environ.get('LOJA_SMTP_TIMEOUT', 30))
+SMTP_OCIOSO_SEGUNDOS = float(os.environ.get('LOJA_SMTP_OCIOSO', 120))  # fecha a conexão parada há mais tempo
+FILA_INTERVALO_SEGUNDOS = float(os.environ.get('LOJA_FILA_INTERVALO', 15))
+FILA_LOTE = int(os.environ.get('LOJA_FILA_LOTE', 20))
+FILA_MAX_TENTATIVAS = int(os.environ.get('LOJA_FILA_MAX_TENTATIVAS', 6))
+FILA_ESPERA_BASE_SEGUNDOS = float(os.environ.get('LOJA_FILA_ESPERA_BASE', 30))  # 30 s, 60 s, 2 min, 4 min...
+FILA_ESPERA_MAX_SEGUNDOS = float(os.environ.get('LOJA_FILA_ESPERA_MAX', 3600))
+
+# --- ESTADO DO WORKER ---
+# Um worker por processo, compartilhado por todas as sessões do Streamlit.
+# As senhas ficam só aqui (memória); a caixa de saída no banco guarda apenas as mensagens.
+# As conexões SMTP só são usadas pela thread do worker.
+_credenciais = {}
+_conexoes = {}  # remetente -> [smtplib.SMTP, senha usada no login, último uso]
+_lock = threading.Lock()
+_acordar = threading.Event()
+_parar = threading.Event()
+_worker = None
+
+
+def configurar_remetente(email, senha):
+    """Registra (em memória) a senha de app usada para enviar os e-mails de `email`."""
+    with _lock:
+        _credenciais[email] = senha
+    _acordar.set()
+
+
+def enviar_em_segundo_plano(remetente, destinatario, assunto, corpo, anexo=None, anexo_nome=None):
+    """Coloca o e-mail na caixa de saída e acorda o worker; retorna na hora com o id do e-mail."""
+    email_id = enfileirar_email(remetente, destinatario, assunto, corpo, anexo, anexo_nome)
+    iniciar_worker()
+    _acordar.set()
+    return email_id
+
+
+def iniciar_worker():
+    global _worker
+    with _lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        # O que ficou 'Enviando' quando o processo anterior parou volta para a fila
+        devolver_emails_em_envio()
+        _parar.clear()
+        _worker = threading.Thread(target=_loop_worker, name="fila-emails", daemon=True)
+        _worker.start()
+
+
+def parar_worker(timeout=10):
+    _parar.set()
+    _acordar.set()
+    if _worker is not None:
+        _worker.join(timeout)
+    for remetente in list(_conexoes):
+        _descartar_conexao(remetente)
+
+
+# --- ENVIO ---
+def _montar_mensagem(email):
+    msg = MIMEMultipart()
+    msg['From'] = email['remetente']
+    msg['To'] = email['destinatario']
+    msg['Subject'] = email['assunto']
+    msg.attach(MIMEText(email['corpo'] or "", 'plain'))
+    if email['anexo'] is not None:
+        part = MIMEBase('application', "octet-stream")
+        part.set_payload(email['anexo'])
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename="{email["anexo_nome"] or "anexo"}"')
+        msg.attach(part)
+    return msg
+
+
+def _abrir_conexao(remetente, senha):
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    if SMTP_STARTTLS:
+        server.starttls()
+    if senha:
+        server.login(remetente, senha)
+    return server
+
+
+def _descartar_conexao(remetente):
+    conexao = _conexoes.pop(remetente, None)
+    if conexao is not None:
+        try:
+            conexao[0].quit()
+        except (smtplib.SMTPException, OSError):
+            conexao[0].close()
+
+
+def _conexao(remetente):
+    # Reaproveita a conexão já autenticada (sem novo STARTTLS + login a cada e-mail);
+    # se a senha do remetente mudou, refaz o login
+    with _lock:
+        senha = _credenciais.get(remetente)
+    conexao = _conexoes.get(remetente)
+    if conexao is not None and conexao[1] != senha:
+        _descartar_conexao(remetente)
+        conexao = None
+    if conexao is None:
+        conexao = _conexoes[remetente] = [_abrir_conexao(remetente, senha), senha, None]
+    conexao[2] = time.monotonic()
+    return conexao[0]
+
+
+def _enviar(email):
+    msg = _montar_mensagem(email)
+    try:
+        _conexao(email['remetente']).send_message(msg)
+    except smtplib.SMTPServerDisconnected:
+        # Servidor fechou a conexão ociosa: reconecta uma vez
+        _descartar_conexao(email['remetente'])
+        _conexao(email['remetente']).send_message(msg)
+
+
+def _espera(tentativas):
+    return min(FILA_ESPERA_BASE_SEGUNDOS * 2 ** tentativas, FILA_ESPERA_MAX_SEGUNDOS)
+
+
+def processar_fila(limite=FILA_LOTE):
+    """Tenta enviar os e-mails vencidos dos remetentes configurados; retorna quantos foram processados.
+
+    Só deve ser chamada pela thread do worker (ou em testes, com o worker parado).
+    """
+    with _lock:
+        remetentes = list(_credenciais)
+    emails = reservar_emails(remetentes, limite)
+    for email in emails:
+        try:
+            _enviar(email)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+            # Endereço recusado: tentar de novo não resolve
+            marcar_email_falha(email['id'], str(e))
+        except smtplib.SMTPResponseException as e:
+            _descartar_conexao(email['remetente'])
+            # Respostas 5xx são definitivas; a de autenticação volta para a fila (a senha pode ser corrigida)
+            if e.smtp_code >= 500 and not isinstance(e, smtplib.SMTPAuthenticationError) \
+                    or email['tentativas'] + 1 >= FILA_MAX_TENTATIVAS:
+                marcar_email_falha(email['id'], str(e))
+            else:
+                marcar_email_falha(email['id'], str(e), _espera(email['tentativas']))
+        except (smtplib.SMTPException, OSError) as e:
+            _descartar_conexao(email['remetente'])
+            if email['tentativas'] + 1 >= FILA_MAX_TENTATIVAS:
+                marcar_email_falha(email['id'], str(e))
+            else:
+                marcar_email_falha(email['id'], str(e), _espera(email['tentativas']))
+        except Exception as e:
+            # Mensagem malformada (cabeçalho, anexo...): não melhora tentando de novo, e não pode deixar
+            # este e-mail e o resto do lote presos em 'Enviando'
+            _descartar_conexao(email['remetente'])
+            marcar_email_falha(email['id'], f"{type(e).__name__}: {e}")
+        else:
+            marcar_email_enviado(email['id'])
+    return len(emails)
+
+
+def _fechar_conexoes_ociosas():
+    agora = time.monotonic()
+    for remetente, (_, _, ultimo_uso) in list(_conexoes.items()):
+        if agora - ultimo_uso > SMTP_OCIOSO_SEGUNDOS:
+            _descartar_conexao(remetente)
+
+
+def _loop_worker():
+    while not _parar.is_set():
+        # Limpa o aviso antes de processar: um e-mail enfileirado durante o envio não espera o intervalo
+        _acordar.clear()
+        try:
+            # Lote cheio: pode haver mais na fila, continua sem esperar
+            if processar_fila() >= FILA_LOTE:
+                continue
+        except Exception as e:
+            print(f"Erro na fila de e-mails: {e}")
+        _fechar_conexoes_ociosas()
+        _acordar.wait(FILA_INTERVALO_SEGUNDOS)
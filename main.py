@@ -1,18 +1,12 @@
 # main.py
 import streamlit as st
-from streamlit_option_menu import option_menu
-from streamlit_lottie import st_lottie
-import requests
 import time
-from database import init_db
-from views import home, vendas, estoque, financeiro, clientes, login, usuarios
-@st.cache_data(show_spinner=False)
-def load_lottieurl(url):
-    try:
-        r = requests.get(url, timeout=2)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
+from animacoes import exibir_animacao
+from database import init_db, get_schema_version
+from telas import TELAS, telas_permitidas, carregar_tela, importar, subtela_atual
+from metricas import medir_render, iniciar_exportador, registrar_bootstrap
+from perfilador import agendar_captura, cancelar_captura, capturas_pendentes, capturar_se_pedido
+
 # Config
 st.set_page_config(page_title="Cerrado Tereré 67", layout="wide", page_icon="🌿")
 
@@ -25,67 +19,47 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Função Loader (Segura)
-def load_lottieurl(url):
-    try:
-        r = requests.get(url, timeout=3)
-        return r.json() if r.status_code == 200 else None
-    except:
-        return None
+# Bootstrap do banco: roda uma vez por processo (não a cada rerun/interação)
+@st.cache_resource(show_spinner=False)
+def bootstrap_db():
+    inicio = time.perf_counter()
+    init_db()
+    dados = {"duracao_ms": (time.perf_counter() - inicio) * 1000, "schema_version": get_schema_version()}
+    registrar_bootstrap(dados['duracao_ms'], dados['schema_version'])  # Prometheus e tela de Diagnóstico
+    print(f"[bootstrap] banco pronto em {dados['duracao_ms']:.1f} ms (schema v{dados['schema_version']})")
+    return dados
 
 
-init_db()
+bootstrap_db()
+iniciar_exportador()  # endpoint /metrics só se LOJA_METRICAS_PORTA estiver definida
 
 # --- ESTADOS ---
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
-if 'logout_anim' not in st.session_state:
-    st.session_state.logout_anim = False
 
 # --- LÓGICA ---
+# Entrada e saída não bloqueiam: a animação aparece na tela seguinte, sem sleep
 
-# 1. SAÍDA (LOGOUT)
-if st.session_state.logout_anim:
-    anim_bye = load_lottieurl("https://lottie.host/020050df-d035-4303-8854-9725d2222238/v1G8Y2X20n.json")
-
-    placeholder = st.empty()
-    with placeholder.container():
-        col1, col2, col3 = st.columns([1, 1, 1])
-        with col2:
-            st.markdown("<br><br>", unsafe_allow_html=True)
-            if anim_bye:
-                st_lottie(anim_bye, height=200, key="bye_anim")
-            else:
-                st.markdown("# 👋")
-            st.markdown(
-                f"<h2 style='text-align: center; color: #2E8B57;'>Até logo, {st.session_state.get('user_nome')}!</h2>",
-                unsafe_allow_html=True)
-
-    time.sleep(2.5)
-    st.session_state.logged_in = False
-    st.session_state.logout_anim = False
-    st.rerun()
-
-# 2. LOGIN (Se não logado)
-elif not st.session_state.logged_in:
-    login.render_login()
+# 1. LOGIN (Se não logado; após sair, mostra a despedida acima do formulário)
+if not st.session_state.logged_in:
+    with medir_render("Login"):
+        importar("views.login").render_login()
 
-# 3. SISTEMA (Se logado)
+# 2. SISTEMA (Se logado)
 else:
-    perms = st.session_state.get('permissoes', [])
-    is_admin = 'admin' in perms
+    from streamlit_option_menu import option_menu
 
-    opcoes_menu = ["Início"]
-    icones_menu = ["house-fill"]
+    perms = st.session_state.get('permissoes', [])
 
-    if is_admin or 'vendas' in perms: opcoes_menu.append("Vendas"); icones_menu.append("cart4")
-    if is_admin or 'clientes' in perms: opcoes_menu.append("Clientes"); icones_menu.append("people-fill")
-    if is_admin or 'estoque' in perms: opcoes_menu.append("Estoque"); icones_menu.append("box-seam-fill")
-    if is_admin or 'financeiro' in perms: opcoes_menu.append("Financeiro"); icones_menu.append("graph-up-arrow")
-    if is_admin or 'usuarios' in perms: opcoes_menu.append("Usuários"); icones_menu.append("person-badge-fill")
+    # Menu montado a partir do registro de telas (telas.py); o módulo da tela só é importado ao abrir
+    opcoes_menu = telas_permitidas(perms)
+    icones_menu = [TELAS[nome][2] for nome in opcoes_menu]
 
     with st.sidebar:
         st.markdown('<div class="sidebar-title">🌿 Cerrado Tereré 67</div>', unsafe_allow_html=True)
+        if st.session_state.pop('boas_vindas', False):
+            exibir_animacao("sucesso", height=80, key="win_anim")
+            st.toast(f"Bem-vindo, {st.session_state.get('user_nome', 'Usuário')}!", icon="🎉")
         st.success(f"👤 {st.session_state.get('user_nome', 'Usuário')}")
 
         selected = option_menu(
@@ -102,20 +76,31 @@ else:
             }
         )
 
+        # Admin: perfila (cProfile + tracemalloc) os próximos reruns desta sessão; resultados no Diagnóstico
+        if 'admin' in perms:
+            with st.expander("🔬 Perfilar esta sessão"):
+                pendentes = capturas_pendentes(st.session_state)
+                if pendentes:
+                    st.caption(f"Próximos {pendentes} rerun(s) serão perfilados.")
+                    if st.button("Cancelar", use_container_width=True):
+                        cancelar_captura(st.session_state)
+                        st.rerun()
+                else:
+                    qtd_reruns = st.number_input("Reruns", min_value=1, max_value=20, value=3, step=1)
+                    if st.button("▶️ Perfilar", use_container_width=True):
+                        agendar_captura(st.session_state, qtd_reruns)
+                        st.toast(f"Perfilando os próximos {qtd_reruns} reruns.", icon="🔬")
+
         st.markdown("---")
         if st.button("🔒 Sair", use_container_width=True):
-            st.session_state.logout_anim = True
+            st.session_state.logged_in = False
+            st.session_state.despedida = st.session_state.get('user_nome')
             st.rerun()
 
-    if selected == "Início":
-        home.render_home()
-    elif selected == "Vendas" and (is_admin or 'vendas' in perms):
-        vendas.render_vendas()
-    elif selected == "Clientes" and (is_admin or 'clientes' in perms):
-        clientes.render_clientes()
-    elif selected == "Estoque" and (is_admin or 'estoque' in perms):
-        estoque.render_estoque()
-    elif selected == "Financeiro" and (is_admin or 'financeiro' in perms):
-        financeiro.render_financeiro()
-    elif selected == "Usuários" and (is_admin or 'usuarios' in perms):
-        usuarios.render_usuarios()
\ No newline at end of file
+    if selected in opcoes_menu:
+        # Tempo de cada rerun por tela/subtela (histogramas em metricas.py) e perfil sob demanda (perfilador.py).
+        # Reruns capturados ficam fora dos histogramas: o custo do perfil distorceria o p95 da tela investigada.
+        subtela = subtela_atual(selected, st.session_state)
+        with capturar_se_pedido(st.session_state, selected, subtela) as capturando, \
+                medir_render(selected, subtela, registrar=not capturando):
+            carregar_tela(selected)()
@@ -0,0 +1,241 @@
+# metricas.py
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from database import estatisticas_cache, estatisticas_escritor
+
+# --- CONFIGURAÇÃO (ajustável por variável de ambiente) ---
+# Limites superiores (segundos) dos baldes do histograma de renderização
+BALDES = tuple(float(b) for b in os.environ.get(
+    'LOJA_METRICAS_BALDES', '0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10').split(','))
+# Arquivo no formato texto do Prometheus (ex.: diretório do textfile collector do node_exporter); vazio = não grava
+METRICAS_ARQUIVO = os.environ.get('LOJA_METRICAS_ARQUIVO', '')
+METRICAS_INTERVALO = float(os.environ.get('LOJA_METRICAS_INTERVALO', 10))  # segundos entre gravações do arquivo
+# Endpoint HTTP /metrics para um coletor local; 0 = desligado
+METRICAS_PORTA = int(os.environ.get('LOJA_METRICAS_PORTA', 0))
+METRICAS_HOST = os.environ.get('LOJA_METRICAS_HOST', '127.0.0.1')
+
+# (tela, subtela) -> {"baldes": [contagem por balde], "soma", "contagem", "max", "erros"}
+_series = {}
+_lock = threading.Lock()
+_ultima_gravacao = 0.0
+_servidor = None
+_bootstrap = {}  # {"duracao_ms", "schema_version", "em"} da inicialização do banco neste processo
+
+
+# --- MEDIÇÃO ---
+def _nova_serie():
+    return {"baldes": [0] * len(BALDES), "soma": 0.0, "contagem": 0, "max": 0.0, "erros": 0}
+
+
+def observar_render(tela, subtela, segundos, erro=False):
+    """Soma uma renderização de `tela`/`subtela` ao histograma."""
+    with _lock:
+        serie = _series.get((tela, subtela))
+        if serie is None:
+            serie = _series[(tela, subtela)] = _nova_serie()
+        for i, limite in enumerate(BALDES):
+            if segundos <= limite:
+                serie['baldes'][i] += 1
+                break
+        serie['soma'] += segundos
+        serie['contagem'] += 1
+        serie['max'] = max(serie['max'], segundos)
+        serie['erros'] += erro
+    if METRICAS_ARQUIVO:
+        _gravar_arquivo_se_preciso()
+
+
+@contextmanager
+def medir_render(tela, subtela="-", registrar=True):
+    """Mede o bloco como uma renderização de `tela`/`subtela`.
+
+    st.rerun()/st.stop() interrompem o script com exceções de controle do Streamlit: contam como
+    renderização normal, não como erro. registrar=False não mede (rerun com cProfile/tracemalloc ligados).
+    """
+    if not registrar:
+        yield
+        return
+    inicio = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except BaseException as e:
+        erro = type(e).__name__ not in ("RerunException", "StopException")
+        raise
+    finally:
+        observar_render(tela, subtela, time.perf_counter() - inicio, erro)
+
+
+def _percentil(serie, q):
+    """Limite superior do balde onde cai o quantil `q` (estimativa do histograma, como no Prometheus)."""
+    alvo = q * serie['contagem']
+    acumulado = 0
+    for limite, contagem in zip(BALDES, serie['baldes']):
+        acumulado += contagem
+        if acumulado >= alvo:
+            return limite
+    return serie['max']
+
+
+def resumo_renders():
+    """Por tela/subtela: renderizações, média, p50, p95 (pelos baldes), máximo e erros, em ms."""
+    with _lock:
+        series = {chave: dict(serie, baldes=list(serie['baldes'])) for chave, serie in _series.items()}
+    return sorted(({"tela": tela, "subtela": subtela, "contagem": s['contagem'],
+                    "media_ms": s['soma'] / s['contagem'] * 1000, "p50_ms": _percentil(s, 0.5) * 1000,
+                    "p95_ms": _percentil(s, 0.95) * 1000, "max_ms": s['max'] * 1000, "erros": s['erros']}
+                   for (tela, subtela), s in series.items() if s['contagem']),
+                  key=lambda linha: linha['media_ms'] * linha['contagem'], reverse=True)
+
+
+def limpar_metricas():
+    with _lock:
+        _series.clear()
+
+
+def registrar_bootstrap(duracao_ms, schema_version):
+    """Guarda quanto a inicialização do banco (init_db + migrações) levou neste processo."""
+    with _lock:
+        _bootstrap.update(duracao_ms=duracao_ms, schema_version=schema_version, em=time.time())
+
+
+def dados_bootstrap():
+    """Dados da inicialização do banco neste processo ({} se ainda não rodou)."""
+    with _lock:
+        return dict(_bootstrap)
+
+
+# --- EXPORTAÇÃO (formato texto do Prometheus) ---
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items()) + "}"
+
+
+def texto_prometheus():
+    """Todas as métricas no formato de exposição em texto do Prometheus."""
+    with _lock:
+        series = sorted((chave, dict(serie, baldes=list(serie['baldes']))) for chave, serie in _series.items())
+
+    linhas = ["# HELP loja_render_segundos Tempo de renderização de cada tela por rerun.",
+              "# TYPE loja_render_segundos histogram"]
+    for (tela, subtela), serie in series:
+        acumulado = 0
+        for limite, contagem in zip(BALDES, serie['baldes']):
+            acumulado += contagem
+            linhas.append(f"loja_render_segundos_bucket{_rotulos(tela=tela, subtela=subtela, le=f'{limite:g}')} "
+                          f"{acumulado}")
+        linhas.append(f"loja_render_segundos_bucket{_rotulos(tela=tela, subtela=subtela, le='+Inf')} "
+                      f"{serie['contagem']}")
+        linhas.append(f"loja_render_segundos_sum{_rotulos(tela=tela, subtela=subtela)} {serie['soma']:.6f}")
+        linhas.append(f"loja_render_segundos_count{_rotulos(tela=tela, subtela=subtela)} {serie['contagem']}")
+
+    linhas += ["# HELP loja_render_max_segundos Renderização mais lenta desde o início do processo.",
+               "# TYPE loja_render_max_segundos gauge"]
+    linhas += [f"loja_render_max_segundos{_rotulos(tela=tela, subtela=subtela)} {serie['max']:.6f}"
+               for (tela, subtela), serie in series]
+    linhas += ["# HELP loja_render_erros_total Renderizações interrompidas por exceção.",
+               "# TYPE loja_render_erros_total counter"]
+    linhas += [f"loja_render_erros_total{_rotulos(tela=tela, subtela=subtela)} {serie['erros']}"
+               for (tela, subtela), serie in series]
+
+    bootstrap = dados_bootstrap()
+    if bootstrap:
+        linhas += ["# HELP loja_bootstrap_ms Duração da inicialização do banco (init_db + migrações) neste processo.",
+                   "# TYPE loja_bootstrap_ms gauge",
+                   f"loja_bootstrap_ms {bootstrap['duracao_ms']:.3f}",
+                   "# HELP loja_schema_versao Versão do schema do banco após a inicialização.",
+                   "# TYPE loja_schema_versao gauge",
+                   f"loja_schema_versao {bootstrap['schema_version']}"]
+
+    cache = estatisticas_cache()
+    for nome, chave, descricao in (("acertos", "hits", "Leituras servidas pelo cache de consultas."),
+                                   ("faltas", "misses", "Leituras que foram ao banco."),
+                                   ("invalidacoes", "invalidacoes", "Entradas descartadas por escrita nas tabelas."),
+                                   ("despejos", "despejos", "Entradas descartadas pelo limite do cache.")):
+        linhas += [f"# HELP loja_cache_consultas_{nome}_total {descricao}",
+                   f"# TYPE loja_cache_consultas_{nome}_total counter",
+                   f"loja_cache_consultas_{nome}_total {cache[chave]}"]
+    linhas += ["# HELP loja_cache_consultas_bytes Memória estimada do cache de consultas.",
+               "# TYPE loja_cache_consultas_bytes gauge",
+               f"loja_cache_consultas_bytes {cache['bytes']}"]
+
+    escritor = estatisticas_escritor()
+    for nome, chave, descricao in (("lotes", "lotes", "Transações gravadas pelo escritor único."),
+                                   ("escritas", "escritas", "Escritas gravadas pelo escritor único."),
+                                   ("falhas", "falhas", "Escritas do escritor único desfeitas por erro.")):
+        linhas += [f"# HELP loja_escritor_{nome}_total {descricao}",
+                   f"# TYPE loja_escritor_{nome}_total counter",
+                   f"loja_escritor_{nome}_total {escritor[chave]}"]
+    return "\n".join(linhas) + "\n"
+
+
+def gravar_arquivo(caminho=None):
+    """Grava as métricas em `caminho` (padrão: LOJA_METRICAS_ARQUIVO) trocando o arquivo de uma vez,
+    para o coletor nunca ler um arquivo pela metade."""
+    caminho = caminho or METRICAS_ARQUIVO
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(texto_prometheus())
+        os.replace(temporario, caminho)
+    except OSError as e:
+        print(f"Não foi possível gravar as métricas em {caminho}: {e}")
+
+
+def _gravar_arquivo_se_preciso():
+    global _ultima_gravacao
+    agora = time.monotonic()
+    with _lock:
+        if agora - _ultima_gravacao < METRICAS_INTERVALO:
+            return
+        _ultima_gravacao = agora
+    gravar_arquivo()
+
+
+class _MetricasHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        corpo = texto_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, formato, *args):
+        pass  # um acesso por coleta: não polui o log do Streamlit
+
+
+def iniciar_exportador(porta=None, host=None):
+    """Sobe (uma vez por processo) o endpoint /metrics em uma thread daemon; retorna a porta ou None."""
+    global _servidor
+    porta = METRICAS_PORTA if porta is None else porta
+    if not porta:
+        return None
+    with _lock:
+        if _servidor is None:
+            try:
+                _servidor = ThreadingHTTPServer((host or METRICAS_HOST, porta), _MetricasHandler)
+            except OSError as e:
+                print(f"[metricas] endpoint não iniciado na porta {porta}: {e}")
+                return None
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, name="metricas-http", daemon=True).start()
+            print(f"[metricas] http://{_servidor.server_address[0]}:{_servidor.server_address[1]}/metrics")
+    return _servidor.server_address[1]
+
+
+def parar_exportador():
+    global _servidor
+    with _lock:
+        if _servidor is not None:
+            _servidor.shutdown()
+            _servidor.server_close()
+            _servidor = None
@@ -0,0 +1,210 @@
+# perfilador.py
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# --- CONFIGURAÇÃO (ajustável por variável de ambiente) ---
+PASTA_PERFIS = Path(os.environ.get('LOJA_PASTA_PERFIS', Path.home() / ".cache" / "cerrado_terere" / "perfis"))
+PERFIS_MAX = int(os.environ.get('LOJA_PERFIS_MAX', 50))  # capturas mantidas em disco; as mais antigas são apagadas
+TRACEMALLOC_QUADROS = int(os.environ.get('LOJA_TRACEMALLOC_QUADROS', 10))
+
+# Chave em session_state com as capturas pendentes desta sessão
+CHAVE_CAPTURA = '_captura_perfil'
+
+# tracemalloc vale para o processo todo: fica ligado enquanto houver alguma captura em andamento
+_tracemalloc_lock = threading.Lock()
+_capturas_ativas = 0
+
+
+# --- AGENDAMENTO (por sessão) ---
+def agendar_captura(estado, reruns):
+    """Marca os próximos `reruns` desta sessão para serem perfilados."""
+    estado[CHAVE_CAPTURA] = {"restantes": int(reruns), "total": int(reruns)}
+
+
+def cancelar_captura(estado):
+    estado.pop(CHAVE_CAPTURA, None)
+
+
+def capturas_pendentes(estado):
+    pendente = estado.get(CHAVE_CAPTURA)
+    return pendente['restantes'] if pendente else 0
+
+
+# --- TAMANHO DO SESSION_STATE ---
+def _tamanho_profundo(obj, vistos):
+    if id(obj) in vistos:
+        return 0
+    vistos.add(id(obj))
+    if hasattr(obj, "memory_usage") and hasattr(obj, "columns"):  # DataFrame
+        try:
+            return int(obj.memory_usage(deep=True).sum())
+        except (TypeError, ValueError):
+            pass
+    tamanho = sys.getsizeof(obj, 0)
+    if isinstance(obj, dict):
+        tamanho += sum(_tamanho_profundo(k, vistos) + _tamanho_profundo(v, vistos) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        tamanho += sum(_tamanho_profundo(item, vistos) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        tamanho += _tamanho_profundo(vars(obj), vistos)
+    return tamanho
+
+
+def tamanho_session_state(estado):
+    """Lista (chave, tipo, bytes estimados) de cada item do session_state, do maior para o menor."""
+    linhas = []
+    for chave in list(estado.keys()):
+        try:
+            valor = estado[chave]
+        except KeyError:
+            continue
+        linhas.append((str(chave), type(valor).__name__, _tamanho_profundo(valor, set())))
+    return sorted(linhas, key=lambda linha: linha[2], reverse=True)
+
+
+# --- CAPTURA ---
+def _iniciar_tracemalloc():
+    global _capturas_ativas
+    with _tracemalloc_lock:
+        _capturas_ativas += 1
+        if _capturas_ativas == 1 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_QUADROS)
+        tracemalloc.reset_peak()
+
+
+def _parar_tracemalloc():
+    """Snapshot e pico do tracemalloc; desliga quando não há mais capturas em andamento."""
+    global _capturas_ativas
+    with _tracemalloc_lock:
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        pico = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        _capturas_ativas -= 1
+        if _capturas_ativas == 0:
+            tracemalloc.stop()
+    return snapshot, pico
+
+
+def _nome_seguro(texto):
+    """Trecho de nome de arquivo só com ASCII ("Início" -> "Inicio")."""
+    ascii_ = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', ascii_).strip('-')
+
+
+def _relatorio(cabecalho, perfil, snapshot, pico, estado):
+    saida = io.StringIO()
+    for chave, valor in cabecalho.items():
+        saida.write(f"{chave}: {valor}\n")
+
+    saida.write("\n=== cProfile (thread desta sessão), 40 funções por tempo acumulado ===\n")
+    if perfil is not None:
+        pstats.Stats(perfil, stream=saida).strip_dirs().sort_stats("cumulative").print_stats(40)
+    else:
+        saida.write("(outro profiler já estava ativo nesta thread)\n")
+
+    saida.write(f"\n=== tracemalloc (processo todo), pico {pico / 2 ** 20:.1f} MB, 25 linhas que mais alocaram ===\n")
+    if snapshot is not None:
+        filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>")]
+        for estatistica in snapshot.filter_traces(filtros).statistics("lineno")[:25]:
+            saida.write(f"{estatistica.size / 1024:10.1f} KiB {estatistica.count:8d} blocos  "
+                        f"{estatistica.traceback[0]}\n")
+
+    saida.write("\n=== session_state (bytes estimados) ===\n")
+    for chave, tipo, tamanho in tamanho_session_state(estado):
+        saida.write(f"{tamanho / 1024:10.1f} KiB  {chave} ({tipo})\n")
+    return saida.getvalue()
+
+
+def _limpar_antigos():
+    relatorios = sorted(PASTA_PERFIS.glob("*.txt"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for antigo in relatorios[PERFIS_MAX:]:
+        antigo.unlink(missing_ok=True)
+        antigo.with_suffix(".prof").unlink(missing_ok=True)
+
+
+@contextmanager
+def capturar_se_pedido(estado, tela, subtela="-"):
+    """Envolve o bloco em cProfile + tracemalloc se esta sessão tem capturas pendentes.
+
+    Grava <data>_<usuário>_<tela>_<subtela>.prof (pstats, abre no snakeviz) e .txt (resumo legível,
+    com o tamanho do session_state) em PASTA_PERFIS. Entrega True se este rerun está sendo capturado.
+    """
+    pendente = estado.get(CHAVE_CAPTURA)
+    if not pendente or pendente['restantes'] <= 0:
+        yield False
+        return
+    pendente['restantes'] -= 1
+    numero = pendente['total'] - pendente['restantes']
+    if pendente['restantes'] <= 0:
+        estado.pop(CHAVE_CAPTURA, None)
+
+    perfil = cProfile.Profile()
+    try:
+        perfil.enable()
+    except ValueError:
+        perfil = None
+    _iniciar_tracemalloc()
+    inicio = time.perf_counter()
+    try:
+        yield True
+    finally:
+        duracao = time.perf_counter() - inicio
+        if perfil is not None:
+            perfil.disable()
+        snapshot, pico = _parar_tracemalloc()
+        agora = datetime.now()
+        usuario = estado.get('username', 'anonimo')
+        cabecalho = {"capturado_em": agora.isoformat(timespec="seconds"), "usuario": usuario, "tela": tela,
+                     "subtela": subtela, "rerun": f"{numero}/{pendente['total']}",
+                     "duracao_ms": f"{duracao * 1000:.1f}"}
+        partes = [f"{agora:%Y%m%d-%H%M%S-%f}", _nome_seguro(usuario), _nome_seguro(tela), _nome_seguro(subtela)]
+        base = "_".join(parte for parte in partes if parte)
+        try:
+            PASTA_PERFIS.mkdir(parents=True, exist_ok=True)
+            if perfil is not None:
+                perfil.dump_stats(PASTA_PERFIS / f"{base}.prof")
+            (PASTA_PERFIS / f"{base}.txt").write_text(_relatorio(cabecalho, perfil, snapshot, pico, estado),
+                                                      encoding="utf-8")
+            _limpar_antigos()
+        except OSError as e:
+            print(f"[perfil] não foi possível gravar a captura: {e}")
+        else:
+            print(f"[perfil] {base} ({duracao * 1000:.0f} ms)")
+
+
+# --- LISTAGEM ---
+def listar_capturas():
+    """Capturas em disco, da mais recente para a mais antiga: dicts com nome, cabeçalho e caminhos."""
+    if not PASTA_PERFIS.exists():
+        return []
+    capturas = []
+    for relatorio in sorted(PASTA_PERFIS.glob("*.txt"), key=lambda p: p.stat().st_mtime, reverse=True):
+        cabecalho = {}
+        try:
+            with open(relatorio, encoding="utf-8") as f:
+                for linha in f:
+                    if not linha.strip():
+                        break
+                    chave, _, valor = linha.partition(": ")
+                    cabecalho[chave] = valor.strip()
+        except OSError:
+            continue
+        prof = relatorio.with_suffix(".prof")
+        capturas.append({"nome": relatorio.stem, "cabecalho": cabecalho, "relatorio": relatorio,
+                         "prof": prof if prof.exists() else None})
+    return capturas
+
+
+def apagar_capturas():
+    for arquivo in list(PASTA_PERFIS.glob("*.txt")) + list(PASTA_PERFIS.glob("*.prof")):
+        arquivo.unlink(missing_ok=True)
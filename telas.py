@@ -0,0 +1,73 @@
+# telas.py
+import importlib
+import sys
+import threading
+import time
+
+# --- REGISTRO DE TELAS ---
+# O módulo de cada tela só é importado quando o item do menu é aberto pela primeira vez no processo,
+# então o login e a partida do container não pagam pandas/fpdf/smtplib das telas que ninguém abriu.
+# nome no menu -> (módulo, função que desenha a tela, ícone, permissão exigida; None = todos)
+TELAS = {
+    "Início": ("views.home", "render_home", "house-fill", None),
+    "Vendas": ("views.vendas", "render_vendas", "cart4", "vendas"),
+    "Clientes": ("views.clientes", "render_clientes", "people-fill", "clientes"),
+    "Estoque": ("views.estoque", "render_estoque", "box-seam-fill", "estoque"),
+    "Financeiro": ("views.financeiro", "render_financeiro", "graph-up-arrow", "financeiro"),
+    "Usuários": ("views.usuarios", "render_usuarios", "person-badge-fill", "usuarios"),
+    "Diagnóstico": ("views.diagnostico", "render_diagnostico", "speedometer2", "admin"),
+}
+# Chave de session_state que guarda a subtela de cada tela (as telas começam em 'menu')
+SUBTELAS = {
+    "Vendas": "tela_vendas",
+    "Clientes": "tela_clientes",
+    "Estoque": "tela_estoque",
+    "Financeiro": "tela_fin",
+}
+
+_importacoes = {}  # módulo -> {"ms", "modulos_novos", "em"}
+_lock = threading.Lock()
+
+
+def telas_permitidas(permissoes):
+    """Nomes das telas que o usuário pode abrir, na ordem do menu."""
+    is_admin = 'admin' in permissoes
+    return [nome for nome, (_, _, _, perm) in TELAS.items() if perm is None or is_admin or perm in permissoes]
+
+
+def importar(modulo):
+    """Importa `modulo` (uma vez por processo) registrando quanto tempo a importação levou.
+
+    Sempre passa por importlib.import_module: o módulo entra em sys.modules antes de terminar de executar,
+    e só o lock de importação do interpretador garante que outra sessão não receba um módulo pela metade.
+    """
+    carregados = len(sys.modules)
+    ausente = modulo not in sys.modules
+    inicio = time.perf_counter()
+    mod = importlib.import_module(modulo)
+    if ausente:
+        ms = (time.perf_counter() - inicio) * 1000
+        with _lock:
+            if modulo not in _importacoes:
+                _importacoes[modulo] = {"ms": ms, "modulos_novos": len(sys.modules) - carregados, "em": time.time()}
+                print(f"[import] {modulo} em {ms:.1f} ms ({_importacoes[modulo]['modulos_novos']} módulos novos)")
+    return mod
+
+
+def subtela_atual(nome, estado):
+    """Subtela que a tela `nome` vai desenhar neste rerun ('-' para telas sem subtelas)."""
+    chave = SUBTELAS.get(nome)
+    return estado.get(chave, 'menu') if chave else '-'
+
+
+def carregar_tela(nome):
+    """Função de renderização da tela `nome`, importando o módulo dela na primeira vez."""
+    modulo, funcao, _, _ = TELAS[nome]
+    return getattr(importar(modulo), funcao)
+
+
+def relatorio_importacao():
+    """Importações feitas por este registro: lista de (módulo, ms, módulos novos), da mais lenta para a mais rápida."""
+    with _lock:
+        return sorted(((modulo, dados['ms'], dados['modulos_novos']) for modulo, dados in _importacoes.items()),
+                      key=lambda linha: linha[1], reverse=True)
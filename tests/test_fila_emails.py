@@ -0,0 +1,159 @@
+# tests/test_fila_emails.py
+import socketserver
+import threading
+from email import message_from_bytes
+
+import pytest
+
+import database
+import fila_emails
+
+REMETENTE = "loja@teste.local"
+
+
+# --- SERVIDOR SMTP LOCAL ---
+# Responde pelo destinatário: recusado@ -> 550 no RCPT, rejeitado@ -> 554 no fim do DATA,
+# temporario@ -> 451 no fim do DATA; qualquer outro é aceito e guardado em `recebidas`.
+class _SessaoSMTP(socketserver.StreamRequestHandler):
+    def responder(self, linha):
+        self.wfile.write(linha.encode() + b"\r\n")
+
+    def handle(self):
+        self.responder("220 teste.local ESMTP")
+        destinatario = None
+        while True:
+            linha = self.rfile.readline().decode().rstrip("\r\n")
+            if not linha:
+                return
+            comando = linha.split(" ", 1)[0].upper()
+            if comando == "EHLO":
+                self.responder("250-teste.local")
+                self.responder("250 8BITMIME")
+            elif comando == "RCPT":
+                destinatario = linha.split("<", 1)[1].rstrip(">")
+                if destinatario.startswith("recusado@"):
+                    self.responder("550 5.1.1 caixa inexistente")
+                else:
+                    self.responder("250 OK")
+            elif comando == "DATA":
+                self.responder("354 fim com <CRLF>.<CRLF>")
+                dados = []
+                while (linha_dados := self.rfile.readline()) != b".\r\n":
+                    dados.append(linha_dados)
+                if destinatario.startswith("rejeitado@"):
+                    self.responder("554 5.7.1 mensagem rejeitada")
+                elif destinatario.startswith("temporario@"):
+                    self.responder("451 4.3.0 tente mais tarde")
+                else:
+                    self.server.recebidas.append(message_from_bytes(b"".join(dados)))
+                    self.responder("250 OK")
+            elif comando == "QUIT":
+                self.responder("221 tchau")
+                return
+            else:  # HELO, MAIL, RSET, NOOP
+                self.responder("250 OK")
+
+
+@pytest.fixture
+def smtp(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "loja.db"))
+    database.init_db()
+
+    servidor = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SessaoSMTP)
+    servidor.daemon_threads = True
+    servidor.recebidas = []
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    monkeypatch.setattr(fila_emails, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(fila_emails, "SMTP_PORT", servidor.server_address[1])
+    monkeypatch.setattr(fila_emails, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(fila_emails, "_credenciais", {})
+    monkeypatch.setattr(fila_emails, "_conexoes", {})
+    # A fila é drenada pelo teste com processar_fila(), sem a thread do worker
+    monkeypatch.setattr(fila_emails, "iniciar_worker", lambda: None)
+    fila_emails.configurar_remetente(REMETENTE, "")  # sem senha: o servidor local não pede login
+    yield servidor
+
+    for remetente in list(fila_emails._conexoes):
+        fila_emails._descartar_conexao(remetente)
+    servidor.shutdown()
+    servidor.server_close()
+    database.close_all_connections()
+
+
+def _estado(email_id):
+    status, tentativas, atrasado, erro = database.run_query(
+        "SELECT status, tentativas, proxima_tentativa > CURRENT_TIMESTAMP, ultimo_erro FROM emails_pendentes "
+        "WHERE id = ?", (email_id,), fetch=True)[0]
+    return {"status": status, "tentativas": tentativas, "atrasado": bool(atrasado), "erro": erro}
+
+
+def test_envio_com_anexo(smtp):
+    email_id = fila_emails.enviar_em_segundo_plano(REMETENTE, "cliente@teste.local", "Orçamento", "Segue.",
+                                                   b"%PDF-1.4", "orcamento.pdf")
+
+    assert fila_emails.processar_fila() == 1
+
+    assert _estado(email_id)['status'] == "Enviado"
+    assert len(smtp.recebidas) == 1
+    recebida = smtp.recebidas[0]
+    assert recebida['To'] == "cliente@teste.local"
+    anexo = [parte for parte in recebida.walk() if parte.get_filename()][0]
+    assert anexo.get_filename() == "orcamento.pdf"
+    assert anexo.get_payload(decode=True) == b"%PDF-1.4"
+
+
+def test_destinatario_recusado_falha_sem_nova_tentativa(smtp):
+    email_id = fila_emails.enviar_em_segundo_plano(REMETENTE, "recusado@teste.local", "Oi", "corpo")
+
+    fila_emails.processar_fila()
+
+    estado = _estado(email_id)
+    assert estado['status'] == "Falhou"
+    assert "caixa inexistente" in estado['erro']
+
+
+def test_resposta_5xx_e_definitiva(smtp):
+    email_id = fila_emails.enviar_em_segundo_plano(REMETENTE, "rejeitado@teste.local", "Oi", "corpo")
+
+    fila_emails.processar_fila()
+
+    estado = _estado(email_id)
+    assert (estado['status'], estado['tentativas']) == ("Falhou", 1)
+    assert "554" in estado['erro']
+
+
+def test_resposta_4xx_volta_para_a_fila_com_espera(smtp):
+    email_id = fila_emails.enviar_em_segundo_plano(REMETENTE, "temporario@teste.local", "Oi", "corpo")
+
+    fila_emails.processar_fila()
+
+    estado = _estado(email_id)
+    assert (estado['status'], estado['tentativas'], estado['atrasado']) == ("Pendente", 1, True)
+    # Ainda dentro da espera: a próxima passada não tenta de novo
+    assert fila_emails.processar_fila() == 0
+
+
+def test_falha_definitiva_ao_atingir_max_tentativas(smtp, monkeypatch):
+    monkeypatch.setattr(fila_emails, "FILA_MAX_TENTATIVAS", 3)
+    monkeypatch.setattr(fila_emails, "FILA_ESPERA_BASE_SEGUNDOS", 0)
+    email_id = fila_emails.enviar_em_segundo_plano(REMETENTE, "temporario@teste.local", "Oi", "corpo")
+
+    for tentativa in range(1, 4):
+        assert fila_emails.processar_fila() == 1
+        assert _estado(email_id)['tentativas'] == tentativa
+
+    assert _estado(email_id)['status'] == "Falhou"
+    assert fila_emails.processar_fila() == 0
+
+
+def test_mensagem_malformada_nao_prende_o_lote(smtp):
+    # Anexo que não é bytes: a montagem da mensagem levanta TypeError
+    ruim = fila_emails.enviar_em_segundo_plano(REMETENTE, "cliente@teste.local", "Oi", "corpo", 123, "x.bin")
+    boa = fila_emails.enviar_em_segundo_plano(REMETENTE, "cliente@teste.local", "Oi", "corpo")
+
+    assert fila_emails.processar_fila() == 2
+
+    assert _estado(ruim)['status'] == "Falhou"
+    assert _estado(boa)['status'] == "Enviado"
+    assert database.run_query("SELECT COUNT(*) FROM emails_pendentes WHERE status = 'Enviando'", fetch=True)[0][0] == 0
@@ -0,0 +1,34 @@
+# tests/test_financeiro.py
+import csv
+import gzip
+import io
+from datetime import date
+
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+import database
+from views.financeiro import exportar_extrato_csv
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "loja.db"))
+    database.init_db()
+    database.lancar_movimento_caixa("Entrada", "troco", 100.0, date(2026, 1, 10))
+    database.lancar_movimento_caixa("Saida", "luz", 30.0, date(2026, 1, 11))
+    yield
+    database.close_all_connections()
+
+
+@pytest.mark.parametrize("compactar", [False, True])
+def test_extrato_aceito_pelo_download_button(banco, compactar):
+    dados = exportar_extrato_csv(date(2026, 1, 1), date(2026, 1, 31), compactar)
+
+    conteudo, _ = convert_data_to_bytes_and_infer_mime(dados, RuntimeError("tipo não suportado"))
+
+    if compactar:
+        conteudo = gzip.decompress(conteudo)
+    linhas = list(csv.reader(io.StringIO(conteudo.decode("utf-8"))))
+    assert linhas[0] == ["Data", "Descrição", "Valor", "Ref"]
+    assert [linha[1] for linha in linhas[1:]] == ["SAIDA: luz", "ENTRADA: troco"]
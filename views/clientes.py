@@ -1,16 +1,28 @@
 # views/clientes.py
 import streamlit as st
 import pandas as pd
-from database import run_query
+from database import listar_clientes, contar_clientes, buscar_cliente, cadastrar_cliente, atualizar_cliente, \
+    resumo_cliente, historico_cliente, listar_dividas_devedores
 from fpdf import FPDF
-import base64
 from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+import io
+import multiprocessing
+import os
 import time
+import zipfile
 
 
 # --- 1. FUNÇÃO GERAR RELATÓRIO PDF (Mantida igual) ---
 def gerar_relatorio_cliente(dados_cliente, df_vendas, tipo_relatorio="Geral"):
     pdf = FPDF()
+    _desenhar_relatorio_cliente(pdf, dados_cliente, df_vendas, tipo_relatorio)
+    return pdf.output(dest='S').encode('latin-1', 'replace')
+
+
+def _desenhar_relatorio_cliente(pdf, dados_cliente, df_vendas, tipo_relatorio):
+    # Desenha o relatório em uma página nova de `pdf` (também usado no PDF único do lote)
     pdf.add_page()
 
     # Cabeçalho
@@ -69,19 +81,92 @@ def gerar_relatorio_cliente(dados_cliente, df_vendas, tipo_relatorio="Geral"):
 
     pdf.cell(190, 8, txt=f"TOTAL EM ABERTO: R$ {total_divida_relatorio:.2f}", ln=True, align='R')
 
+
+COLUNAS_HISTORICO = ["ID", "Produto", "Total", "Pago", "Data Venda", "Status"]
+
+
+# --- Extrato em PDF, gerado só quando pedido ---
+@st.cache_data(show_spinner=False, max_entries=128)
+def extrato_cliente_pdf(cliente_id, versao, tipo_relatorio, emissao):
+    # `versao` muda a cada venda/pagamento/edição do cliente e `emissao` a cada dia: com os mesmos
+    # valores o PDF anterior continua válido
+    cadastro = buscar_cliente(cliente_id)
+    dados_cliente = dict(zip(["Nome", "Telefone", "CPF", "Endereço"], cadastro.values()))
+    df_vendas = pd.DataFrame(historico_cliente(cliente_id), columns=COLUNAS_HISTORICO)
+    # Documento em ordem cronológica
+    return gerar_relatorio_cliente(dados_cliente, df_vendas.iloc[::-1], tipo_relatorio)
+
+
+# --- Relatórios de dívidas em lote (todos os devedores) ---
+def _relatorio_divida_lote(tarefa):
+    # Roda em um processo do pool: recebe só dados simples (picklable) e devolve o PDF pronto
+    dados_cliente, linhas = tarefa
+    df_vendas = pd.DataFrame(linhas, columns=COLUNAS_HISTORICO)
+    return dados_cliente['Nome'], gerar_relatorio_cliente(dados_cliente, df_vendas, "Dividas")
+
+
+def _relatorio_divida_mesclado(tarefas):
+    pdf = FPDF()
+    for dados_cliente, linhas in tarefas:
+        _desenhar_relatorio_cliente(pdf, dados_cliente, pd.DataFrame(linhas, columns=COLUNAS_HISTORICO), "Dividas")
     return pdf.output(dest='S').encode('latin-1', 'replace')
 
 
-# --- Helper para Botão de Download Estilizado ---
-def criar_botao_download(pdf_bytes, nome_arquivo, label):
-    b64 = base64.b64encode(pdf_bytes).decode()
-    style_btn = """
-        text-decoration: none; display: flex; justify-content: center; align-items: center; 
-        height: 100%; width: 100%; border: 1px solid rgba(49, 51, 63, 0.2); 
-        background-color: white; color: rgb(49, 51, 63); padding: 0.25rem 0.75rem; 
-        border-radius: 0.5rem; font-family: 'Source Sans Pro', sans-serif; font-size: 14px;
+def _nome_arquivo(nome, usados):
+    base = "".join(ch if ch.isalnum() or ch in " -_" else "_" for ch in nome).strip().replace(" ", "_") or "cliente"
+    nome_final, n = base, 1
+    while nome_final in usados:
+        n += 1
+        nome_final = f"{base}_{n}"
+    usados.add(nome_final)
+    return f"Dividas_{nome_final}.pdf"
+
+
+def gerar_dividas_em_lote(destino, mesclar=False, processos=None, progresso=None):
+    """Gera o "Relatório de Dívidas" de todos os clientes com saldo em aberto, em paralelo, dentro de um ZIP.
+
+    `destino` é um arquivo binário aberto (ou caminho) onde o ZIP é gravado à medida que os PDFs ficam
+    prontos. Com `mesclar=True` o ZIP traz também um PDF único com todos os relatórios. `progresso`,
+    se informado, é chamado com (concluídos, total). Retorna um dict com quantidade, tempo e vazão.
     """
-    return f'<div style="height: 40px; display: flex; align-items: center; margin-bottom: 5px;"><a href="data:application/octet-stream;base64,{b64}" download="{nome_arquivo}.pdf" style="{style_btn}">📄 {label}</a></div>'
+    inicio = time.perf_counter()
+    # Uma única consulta (índice parcial de pendentes) para todos os devedores
+    tarefas = []
+    for (cliente_id, nome, telefone, cpf, endereco), linhas in groupby(listar_dividas_devedores(),
+                                                                        key=lambda linha: linha[:5]):
+        dados_cliente = {"Nome": nome, "Telefone": telefone, "CPF": cpf, "Endereço": endereco}
+        tarefas.append((dados_cliente, [linha[5:] for linha in linhas]))
+
+    processos = max(1, min(processos or os.cpu_count() or 1, len(tarefas) or 1))
+    usados = set()
+    total_bytes = 0
+    # Com um processo só, gera aqui mesmo (subir o pool custaria mais que o ganho).
+    # "spawn": fork a partir do servidor do Streamlit (multithread) não é seguro
+    pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) \
+        if processos > 1 else None
+    try:
+        with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_STORED) as arquivo_zip:
+            futuro_mesclado = pool.submit(_relatorio_divida_mesclado, tarefas) if pool and mesclar else None
+            if pool:
+                pdfs = pool.map(_relatorio_divida_lote, tarefas, chunksize=max(1, len(tarefas) // (processos * 4)))
+            else:
+                pdfs = map(_relatorio_divida_lote, tarefas)
+            for concluidos, (nome, pdf_bytes) in enumerate(pdfs, start=1):
+                arquivo_zip.writestr(_nome_arquivo(nome, usados), pdf_bytes)
+                total_bytes += len(pdf_bytes)
+                if progresso:
+                    progresso(concluidos, len(tarefas))
+            if mesclar and tarefas:
+                pdf_unico = futuro_mesclado.result() if futuro_mesclado else _relatorio_divida_mesclado(tarefas)
+                arquivo_zip.writestr("Dividas_Todos_Clientes.pdf", pdf_unico)
+                total_bytes += len(pdf_unico)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    segundos = time.perf_counter() - inicio
+    return {"relatorios": len(tarefas), "processos": processos, "segundos": segundos,
+            "por_segundo": len(tarefas) / segundos if segundos else 0.0, "bytes": total_bytes}
 
 
 # --- 2. RENDERIZAÇÃO DA TELA ---
@@ -97,7 +182,7 @@ def render_clientes():
         st.header("👥 Gestão de Clientes")
 
         # Recupera total de clientes para mostrar KPI
-        total_cli = run_query("SELECT COUNT(*) FROM clientes", fetch=True)[0][0]
+        total_cli = contar_clientes()
 
         st.markdown("---")
 
@@ -122,6 +207,15 @@ def render_clientes():
                     st.session_state.tela_clientes = 'novo'
                     st.rerun()
 
+            st.write("")
+
+            with st.container(border=True):
+                st.markdown("### 📦 Dívidas em Lote")
+                st.write("Relatório de Dívidas de todos os devedores em um ZIP.")
+                if st.button("GERAR EM LOTE", use_container_width=True):
+                    st.session_state.tela_clientes = 'lote'
+                    st.rerun()
+
     # =======================================================
     # TELA 2: CONSULTAR E GERENCIAR (Ficha Completa)
     # =======================================================
@@ -135,7 +229,7 @@ def render_clientes():
         with c_tit:
             st.subheader("Carteira de Clientes")
 
-        clientes_db = run_query("SELECT id, nome, telefone, cpf, endereco FROM clientes", fetch=True)
+        clientes_db = listar_clientes()
 
         if clientes_db:
             df_clientes = pd.DataFrame(clientes_db, columns=["ID", "Nome", "Telefone", "CPF", "Endereço"])
@@ -163,6 +257,10 @@ def render_clientes():
             # --- FICHA DO CLIENTE ---
             if cliente_selecionado:
                 dados_cli = df_filtrado[df_filtrado['Nome'] == cliente_selecionado].iloc[0]
+                cliente_id = int(dados_cli['ID'])
+
+                # Totais e versão mantidos incrementalmente em resumo_clientes (busca pela PK)
+                resumo = resumo_cliente(cliente_id)
 
                 st.write("")  # Espaço
 
@@ -181,26 +279,21 @@ def render_clientes():
                         st.markdown("---")
                         st.markdown("**Documentos**")
 
-                        vendas_db = run_query(
-                            "SELECT id, produto_nome, total, valor_pago, data_venda, status FROM vendas WHERE cliente_nome = ?",
-                            (cliente_selecionado,), fetch=True)
-                        if vendas_db:
-                            df_hist = pd.DataFrame(vendas_db,
-                                                   columns=["ID", "Produto", "Total", "Pago", "Data Venda", "Status"])
-
-                            # Botão Histórico Completo
-                            pdf_completo = gerar_relatorio_cliente(dados_cli, df_hist, "Geral")
-                            html_btn1 = criar_botao_download(pdf_completo, f"Historico_{cliente_selecionado}",
-                                                             "Histórico Completo")
-                            st.markdown(html_btn1, unsafe_allow_html=True)
-
-                            # Botão Dívidas
-                            dividas = df_hist[(df_hist['Total'] - df_hist['Pago']) > 0.01]
-                            if not dividas.empty:
-                                pdf_dividas = gerar_relatorio_cliente(dados_cli, df_hist, "Dividas")
-                                html_btn2 = criar_botao_download(pdf_dividas, f"Dividas_{cliente_selecionado}",
-                                                                 "Relatório de Dívidas")
-                                st.markdown(html_btn2, unsafe_allow_html=True)
+                        # PDFs gerados só no clique, em cache por (cliente, versão dos dados, tipo, dia)
+                        if resumo:
+                            st.download_button("📄 Histórico Completo",
+                                               data=lambda: extrato_cliente_pdf(cliente_id, resumo['versao'], "Geral",
+                                                                                date.today()),
+                                               file_name=f"Historico_{cliente_selecionado}.pdf",
+                                               mime="application/pdf", on_click="ignore", use_container_width=True)
+
+                            if resumo['saldo_aberto'] > 0.01:
+                                st.download_button("📄 Relatório de Dívidas",
+                                                   data=lambda: extrato_cliente_pdf(cliente_id, resumo['versao'],
+                                                                                    "Dividas", date.today()),
+                                                   file_name=f"Dividas_{cliente_selecionado}.pdf",
+                                                   mime="application/pdf", on_click="ignore",
+                                                   use_container_width=True)
                             else:
                                 st.success("Nada em aberto! ✅")
                         else:
@@ -215,11 +308,7 @@ def render_clientes():
                             novo_end = st.text_area("Endereço", value=dados_cli['Endereço'])
 
                             if st.form_submit_button("💾 Salvar Alterações", use_container_width=True):
-                                run_query("UPDATE clientes SET nome=?, telefone=?, cpf=?, endereco=? WHERE id=?",
-                                          (novo_nome, novo_tel, novo_cpf, novo_end, int(dados_cli['ID'])))
-                                if novo_nome != dados_cli['Nome']:
-                                    run_query("UPDATE vendas SET cliente_nome=? WHERE cliente_nome=?",
-                                              (novo_nome, dados_cli['Nome']))
+                                atualizar_cliente(cliente_id, novo_nome, novo_tel, novo_cpf, novo_end)
                                 st.toast("Cadastro atualizado!", icon="✅")
                                 time.sleep(1)
                                 st.rerun()
@@ -229,10 +318,10 @@ def render_clientes():
                     with st.container(border=True):
                         st.markdown("#### 📊 Score Financeiro")
 
-                        if vendas_db:
-                            total_comprado = df_hist['Total'].sum()
-                            total_pago = df_hist['Pago'].sum()
-                            saldo_devedor = total_comprado - total_pago
+                        if resumo:
+                            total_comprado = resumo['total_comprado']
+                            total_pago = resumo['total_pago']
+                            saldo_devedor = resumo['saldo_aberto']
 
                             m1, m2, m3 = st.columns(3)
                             m1.metric("Total Gasto", f"R$ {total_comprado:.2f}")
@@ -242,7 +331,7 @@ def render_clientes():
                             st.divider()
                             st.markdown("**📜 Últimas Movimentações**")
 
-                            df_show = df_hist.copy()
+                            df_show = pd.DataFrame(historico_cliente(cliente_id, limite=50), columns=COLUNAS_HISTORICO)
                             df_show['Saldo'] = df_show['Total'] - df_show['Pago']
                             df_show['Data Venda'] = pd.to_datetime(df_show['Data Venda']).dt.strftime('%d/%m/%Y')
 
@@ -288,10 +377,50 @@ def render_clientes():
                     if not nome:
                         st.error("O campo Nome é obrigatório!")
                     else:
-                        run_query("INSERT INTO clientes (nome, telefone, cpf, endereco) VALUES (?, ?, ?, ?)",
-                                  (nome, telefone, cpf, endereco))
+                        cadastrar_cliente(nome, telefone, cpf, endereco)
                         st.balloons()
                         st.toast(f"Cliente {nome} cadastrado com sucesso!", icon="👤")
                         time.sleep(1.5)
                         st.session_state.tela_clientes = 'menu'  # Volta pro menu
-                        st.rerun()
\ No newline at end of file
+                        st.rerun()
+
+    # =======================================================
+    # TELA 4: RELATÓRIOS DE DÍVIDAS EM LOTE
+    # =======================================================
+    elif st.session_state.tela_clientes == 'lote':
+        c_back, c_tit = st.columns([1, 6])
+        with c_back:
+            if st.button("⬅️ Voltar"):
+                st.session_state.tela_clientes = 'menu'
+                st.session_state.pop('lote_dividas', None)
+                st.rerun()
+        with c_tit:
+            st.subheader("Relatórios de Dívidas em Lote")
+
+        with st.container(border=True):
+            st.write("Gera o Relatório de Dívidas de todos os clientes com saldo em aberto, em um único ZIP.")
+            mesclar = st.checkbox("Incluir também um PDF único com todos os relatórios (para impressão)")
+            if st.button("📦 GERAR RELATÓRIOS", type="primary", use_container_width=True):
+                barra = st.progress(0.0, text="Gerando relatórios...")
+                arquivo = io.BytesIO()
+                stats = gerar_dividas_em_lote(
+                    arquivo, mesclar=mesclar,
+                    progresso=lambda feitos, total: barra.progress(feitos / total, text=f"{feitos}/{total} relatórios"))
+                barra.empty()
+                st.session_state.lote_dividas = {"zip": arquivo.getvalue(), "stats": stats}
+
+        resultado = st.session_state.get('lote_dividas')
+        if resultado:
+            stats = resultado['stats']
+            if not stats['relatorios']:
+                st.success("Nenhum cliente com saldo em aberto! 🎉")
+            else:
+                with st.container(border=True):
+                    m1, m2, m3, m4 = st.columns(4)
+                    m1.metric("Relatórios", stats['relatorios'])
+                    m2.metric("Tempo", f"{stats['segundos']:.1f} s")
+                    m3.metric("Vazão", f"{stats['por_segundo']:.1f} /s")
+                    m4.metric("Processos", stats['processos'])
+                    st.download_button("📥 Baixar ZIP", data=resultado['zip'],
+                                       file_name=f"Dividas_{date.today().strftime('%Y-%m-%d')}.zip",
+                                       mime="application/zip", on_click="ignore", use_container_width=True)
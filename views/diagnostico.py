@@ -0,0 +1,171 @@
+# views/diagnostico.py
+import streamlit as st
+import pandas as pd
+from datetime import datetime
+import database
+from database import (consultas_mais_custosas, consultas_recentes, limpar_perfil_consultas, estatisticas_cache,
+                      estatisticas_escritor)
+from telas import relatorio_importacao
+from metricas import resumo_renders, dados_bootstrap, BALDES
+from perfilador import listar_capturas, apagar_capturas, tamanho_session_state, PASTA_PERFIS
+
+# Rótulo -> campo usado para ordenar as consultas mais custosas
+ORDENS = {"Tempo total": "total_ms", "Pior caso": "max_ms", "Média": "media_ms", "Chamadas": "chamadas"}
+
+
+def render_diagnostico():
+    # Só administradores: mostra SQL e pontos do código
+    perms = st.session_state.get('permissoes', [])
+    if 'admin' not in perms:
+        st.error("⛔ Acesso Negado. Apenas administradores podem ver o diagnóstico.")
+        return
+
+    c_tit, c_btn = st.columns([4, 1])
+    with c_tit:
+        st.header("🩺 Diagnóstico")
+    with c_btn:
+        st.write("")
+        if st.button("🧹 Limpar estatísticas", use_container_width=True):
+            limpar_perfil_consultas()
+            st.rerun()
+
+    # Só as abas de consultas dependem do perfil; telas, perfis e cache continuam valendo sem ele
+    aviso_perfil = "Perfil de consultas desligado (LOJA_PERFIL_CONSULTAS=0)."
+
+    # --- KPIs ---
+    recentes = consultas_recentes()
+    lentas = [r for r in recentes if r['plano'] is not None]
+    cache = estatisticas_cache()
+    leituras_cache = cache['hits'] + cache['misses']
+    with st.container(border=True):
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("Comandos no buffer", f"{len(recentes)}", help=f"Últimos {database.PERFIL_BUFFER} comandos")
+        k2.metric("Tempo no banco", f"{sum(r['ms'] for r in recentes) / 1000:.2f} s")
+        k3.metric("Lentas", f"{len(lentas)}", help=f"Acima de {database.CONSULTA_LENTA_MS:.0f} ms")
+        k4.metric("Acertos do cache", f"{cache['hits'] / leituras_cache:.0%}" if leituras_cache else "—")
+        if database.PERFIL_CONSULTAS:
+            st.caption(f"Log em disco: {database.LOG_CONSULTAS_LENTAS or 'desligado (LOJA_LOG_CONSULTAS_LENTAS)'}")
+        else:
+            st.caption(aviso_perfil)
+
+    tab_telas, tab_custo, tab_lentas, tab_perfis, tab_sistema = st.tabs(
+        ["🖥️ Telas", "🐢 Mais Custosas", "⏱️ Lentas (com plano)", "🔬 Perfis", "🧠 Cache e Importações"])
+
+    # --- TEMPO DE RENDERIZAÇÃO POR TELA ---
+    with tab_telas:
+        renders = resumo_renders()
+        if renders:
+            df = pd.DataFrame(renders).rename(columns={
+                "tela": "Tela", "subtela": "Subtela", "contagem": "Reruns", "media_ms": "Média (ms)",
+                "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "max_ms": "Máx (ms)", "erros": "Erros"})
+            formato_ms = st.column_config.NumberColumn(format="%.0f")
+            st.dataframe(df, use_container_width=True, hide_index=True,
+                         column_config={c: formato_ms for c in ["Média (ms)", "p50 (ms)", "p95 (ms)", "Máx (ms)"]})
+            st.caption(f"p50/p95 estimados pelos baldes do histograma ({', '.join(f'{b:g}' for b in BALDES)} s). "
+                       "Exportação: LOJA_METRICAS_ARQUIVO e LOJA_METRICAS_PORTA.")
+        else:
+            st.info("Nenhuma renderização medida ainda.")
+
+    # --- MAIS CUSTOSAS ---
+    with tab_custo:
+        ordem = st.selectbox("Ordenar por", list(ORDENS), disabled=not database.PERFIL_CONSULTAS)
+        custosas = consultas_mais_custosas(limite=30, ordem=ORDENS[ordem])
+        if not database.PERFIL_CONSULTAS:
+            st.warning(aviso_perfil)
+        elif custosas:
+            df = pd.DataFrame([{
+                "SQL": c['sql'], "Função": c['funcao'], "Chamada por": ", ".join(c['origens']),
+                "Chamadas": c['chamadas'], "Total (ms)": c['total_ms'], "Média (ms)": c['media_ms'],
+                "p95 (ms)": c['p95_ms'], "Máx (ms)": c['max_ms'], "Linhas": c['linhas'],
+                "Lentas": c['lentas'], "Erros": c['erros'],
+            } for c in custosas])
+            formato_ms = st.column_config.NumberColumn(format="%.2f")
+            st.dataframe(df, use_container_width=True, hide_index=True,
+                         column_config={"Total (ms)": formato_ms, "Média (ms)": formato_ms, "p95 (ms)": formato_ms,
+                                        "Máx (ms)": formato_ms})
+        else:
+            st.info("Nenhuma consulta registrada ainda.")
+
+    # --- LENTAS ---
+    with tab_lentas:
+        if not database.PERFIL_CONSULTAS:
+            st.warning(aviso_perfil)
+        elif lentas:
+            for registro in lentas[:20]:
+                hora = datetime.fromtimestamp(registro['em']).strftime('%d/%m %H:%M:%S')
+                with st.expander(f"{registro['ms']:.0f} ms — {registro['funcao']} ({hora})"):
+                    st.caption(f"Chamada por {registro['origem']} · {registro['linhas']} linhas")
+                    st.code(registro['sql'], language="sql")
+                    st.code("\n".join(registro['plano'] or ["(plano indisponível)"]), language="text")
+        else:
+            st.success(f"Nenhuma consulta acima de {database.CONSULTA_LENTA_MS:.0f} ms no buffer.")
+
+    # --- PERFIS (cProfile + tracemalloc) ---
+    with tab_perfis:
+        st.caption(f"Ative em \"🔬 Perfilar esta sessão\" na barra lateral e repita a ação lenta. Pasta: {PASTA_PERFIS}")
+        capturas = listar_capturas()
+        if capturas:
+            for captura in capturas[:20]:
+                cab = captura['cabecalho']
+                with st.container(border=True):
+                    c_info, c_txt, c_prof = st.columns([3, 1, 1])
+                    c_info.markdown(f"**{cab.get('tela', '?')} / {cab.get('subtela', '-')}** — "
+                                    f"{cab.get('duracao_ms', '?')} ms")
+                    c_info.caption(f"{cab.get('usuario', '?')} · {cab.get('capturado_em', '')} · "
+                                   f"rerun {cab.get('rerun', '')}")
+                    # Arquivos lidos só no clique
+                    c_txt.download_button("📄 Resumo", data=lambda p=captura['relatorio']: p.read_bytes(),
+                                          file_name=captura['relatorio'].name, mime="text/plain",
+                                          on_click="ignore", key=f"txt_{captura['nome']}", use_container_width=True)
+                    if captura['prof']:
+                        c_prof.download_button("📊 .prof", data=lambda p=captura['prof']: p.read_bytes(),
+                                               file_name=captura['prof'].name, mime="application/octet-stream",
+                                               on_click="ignore", key=f"prof_{captura['nome']}",
+                                               use_container_width=True)
+            if st.button("🗑️ Apagar capturas"):
+                apagar_capturas()
+                st.rerun()
+        else:
+            st.info("Nenhuma captura em disco.")
+
+        st.markdown("**session_state desta sessão**")
+        st.dataframe(pd.DataFrame(tamanho_session_state(st.session_state), columns=["Chave", "Tipo", "Bytes"]),
+                     use_container_width=True, hide_index=True)
+
+    # --- CACHE E IMPORTAÇÕES ---
+    with tab_sistema:
+        st.markdown("**Inicialização do banco**")
+        bootstrap = dados_bootstrap()
+        if bootstrap:
+            b1, b2, b3 = st.columns(3)
+            b1.metric("Bootstrap", f"{bootstrap['duracao_ms']:.1f} ms", help="init_db + migrações, uma vez por processo")
+            b2.metric("Versão do schema", f"v{bootstrap['schema_version']}")
+            b3.metric("Processo iniciado", datetime.fromtimestamp(bootstrap['em']).strftime('%d/%m %H:%M:%S'))
+        else:
+            st.caption("O bootstrap ainda não rodou neste processo.")
+
+        st.markdown("**Cache de consultas**")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Entradas", cache['entradas'])
+        c2.metric("Memória", f"{cache['bytes'] / 2 ** 20:.1f} MB")
+        c3.metric("Invalidações", cache['invalidacoes'])
+        c4.metric("Despejos", cache['despejos'])
+
+        st.markdown("**Escritor único (group commit)**")
+        escritor = estatisticas_escritor()
+        if escritor['lotes']:
+            e1, e2, e3, e4 = st.columns(4)
+            e1.metric("Transações", escritor['lotes'])
+            e2.metric("Escritas por transação", f"{escritor['escritas'] / escritor['lotes']:.1f}",
+                      help=f"Maior lote: {escritor['maior_lote']}")
+            e3.metric("Tempo por transação", f"{escritor['ms_total'] / escritor['lotes']:.1f} ms")
+            e4.metric("Escritas com erro", escritor['falhas'])
+        else:
+            st.caption("Ligado" if database.ESCRITOR_UNICO else "Desligado (LOJA_ESCRITOR_UNICO=1 para ligar)")
+
+        st.markdown("**Importação das telas**")
+        importacoes = relatorio_importacao()
+        if importacoes:
+            st.dataframe(pd.DataFrame(importacoes, columns=["Módulo", "Tempo (ms)", "Módulos novos"]),
+                         use_container_width=True, hide_index=True,
+                         column_config={"Tempo (ms)": st.column_config.NumberColumn(format="%.1f")})
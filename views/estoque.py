@@ -1,7 +1,7 @@
 # views/estoque.py
 import streamlit as st
 import pandas as pd
-from database import run_query
+from database import listar_produtos, cadastrar_produto, atualizar_produto
 import time
 
 
@@ -12,7 +12,7 @@ def render_estoque():
 
     # --- 1. CARREGAMENTO DE DADOS (Global) ---
     # Buscamos os dados aqui para alimentar tanto os KPIs do Menu quanto a Tabela de Visualização
-    dados = run_query("SELECT id, nome, preco, quantidade, minimo_alerta FROM produtos", fetch=True)
+    dados = listar_produtos()
     df_produtos = pd.DataFrame(dados,
                                columns=["ID", "Nome", "Preço", "Qtd", "Alerta Mínimo"]) if dados else pd.DataFrame()
 
@@ -151,10 +151,7 @@ def render_estoque():
                     if not nome:
                         st.error("O nome do produto é obrigatório!")
                     else:
-                        run_query(
-                            "INSERT INTO produtos (nome, preco, quantidade, minimo_alerta) VALUES (?, ?, ?, ?)",
-                            (nome, preco, qtd, alerta)
-                        )
+                        cadastrar_produto(nome, preco, qtd, alerta)
                         st.toast(f"Produto '{nome}' cadastrado!", icon="📦")
                         time.sleep(1)
                         # Aqui optamos por NÃO voltar ao menu automaticamente para permitir cadastros em série.
@@ -202,10 +199,7 @@ def render_estoque():
                     novo_alerta = st.number_input("Alerta Mínimo", value=int(dados_atuais['Alerta Mínimo']))
 
                     if st.form_submit_button("💾 ATUALIZAR DADOS", use_container_width=True):
-                        run_query(
-                            "UPDATE produtos SET nome=?, preco=?, quantidade=?, minimo_alerta=? WHERE id=?",
-                            (novo_nome, novo_preco, nova_qtd, novo_alerta, id_sel)
-                        )
+                        atualizar_produto(id_sel, novo_nome, novo_preco, nova_qtd, novo_alerta)
                         st.success("Produto atualizado com sucesso!")
                         time.sleep(1)
                         st.session_state.tela_estoque = 'menu'  # Volta pro menu após editar
@@ -1,47 +1,48 @@
 # views/financeiro.py
 import streamlit as st
 import pandas as pd
-from datetime import date
-from database import run_query
+from datetime import date, timedelta
+from database import resumo_financeiro, listar_pendencias, fechar_caixa, listar_fechamentos, saldo_em, \
+    extrato_financeiro, resumo_extrato, iterar_extrato, baixar_pagamento_cliente, \
+    listar_devedores, lancar_movimento_caixa
+import csv
+import gzip
+import io
 import time
 
 
+# --- FUNÇÕES AUXILIARES ---
+def exportar_extrato_csv(data_ini, data_fim, compactar=False):
+    """Gera o CSV do extrato do período em lotes, direto do banco, e retorna os bytes (gzip se `compactar`).
+
+    Chamada só quando o usuário clica em baixar (download diferido do Streamlit).
+    """
+    buffer = io.BytesIO()
+    destino = gzip.GzipFile(fileobj=buffer, mode='wb') if compactar else buffer
+    texto = io.TextIOWrapper(destino, encoding='utf-8', newline='')
+    escritor = csv.writer(texto)
+    escritor.writerow(["Data", "Descrição", "Valor", "Ref"])
+    for lote in iterar_extrato(data_ini, data_fim):
+        escritor.writerows(lote)
+    texto.flush()
+    texto.detach()
+    if compactar:
+        destino.close()  # Finaliza o gzip (não fecha o buffer)
+    return buffer.getvalue()
+
+
 def render_financeiro():
     # Inicializa estado de navegação
     if 'tela_fin' not in st.session_state:
         st.session_state.tela_fin = 'menu'
 
-    # --- 1. CARREGAMENTO DE DADOS (Global para todas as telas) ---
-    dados_vendas = run_query(
-        "SELECT id, produto_nome, cliente_nome, total, valor_pago, tipo_pagamento, data_venda, data_recebimento, status FROM vendas",
-        fetch=True)
-    df_vendas = pd.DataFrame(dados_vendas,
-                             columns=["ID", "Produto", "Cliente", "Total", "Pago", "Tipo", "Data Venda", "Vencimento",
-                                      "Status"]) if dados_vendas else pd.DataFrame()
-
-    dados_mov = run_query("SELECT id, data, tipo, descricao, valor FROM caixa_movimentos", fetch=True)
-    df_mov = pd.DataFrame(dados_mov,
-                          columns=["ID", "Data", "Tipo", "Descricao", "Valor"]) if dados_mov else pd.DataFrame()
-
-    # --- 2. CÁLCULOS DE SALDO (KPIs) ---
-    if not df_vendas.empty:
-        df_vendas['Falta Pagar'] = df_vendas['Total'] - df_vendas['Pago']
-        receita_vendas = df_vendas['Pago'].sum()
-        # Filtro de segurança (> 0.001)
-        total_a_receber = df_vendas[(df_vendas['Status'] == 'Pendente') & (df_vendas['Falta Pagar'] > 0.001)][
-            'Falta Pagar'].sum()
-    else:
-        receita_vendas = 0.0
-        total_a_receber = 0.0
-
-    if not df_mov.empty:
-        total_sup = df_mov[df_mov['Tipo'] == 'Entrada']['Valor'].sum()
-        total_san = df_mov[df_mov['Tipo'] == 'Saida']['Valor'].sum()
-    else:
-        total_sup = 0.0
-        total_san = 0.0
-
-    saldo_atual = (receita_vendas + total_sup) - total_san
+    # --- 1. KPIs (agregados no SQL; só as telas que exibem saldo fazem a consulta) ---
+    if st.session_state.tela_fin in ('menu', 'caixa'):
+        resumo = resumo_financeiro()
+        saldo_atual = resumo['saldo_atual']
+        total_san = resumo['total_san']
+        receita_vendas = resumo['receita_vendas']
+        total_a_receber = resumo['total_a_receber']
 
     # =======================================================
     # TELA 1: MENU DASHBOARD (Visão Geral)
@@ -77,8 +78,8 @@ def render_financeiro():
                     st.session_state.tela_fin = 'receber'
                     st.rerun()
 
-        # OUTRAS AÇÕES: Caixa e Extrato (Lado a lado)
-        c_caixa, c_extrato = st.columns(2)
+        # OUTRAS AÇÕES: Caixa, Extrato e Fechamento (Lado a lado)
+        c_caixa, c_extrato, c_fechamento = st.columns(3)
 
         with c_caixa:
             with st.container(border=True):
@@ -96,6 +97,14 @@ def render_financeiro():
                     st.session_state.tela_fin = 'extrato'
                     st.rerun()
 
+        with c_fechamento:
+            with st.container(border=True):
+                st.markdown("### 🔐 Fechamento de Caixa")
+                st.write("Feche o dia e consulte saldos de datas anteriores.")
+                if st.button("FECHAR CAIXA", use_container_width=True):
+                    st.session_state.tela_fin = 'fechamento'
+                    st.rerun()
+
     # =======================================================
     # TELA 2: CONTAS A RECEBER (Baixa Inteligente)
     # =======================================================
@@ -109,75 +118,61 @@ def render_financeiro():
         with c_tit:
             st.subheader("Contas a Receber (Baixa)")
 
-        if not df_vendas.empty:
-            # Filtro de segurança para pendências reais
-            pendentes = df_vendas[(df_vendas['Status'] == 'Pendente') & (df_vendas['Falta Pagar'] > 0.01)].copy()
+        # Lista de devedores vem do resumo por cliente; só as dívidas do cliente escolhido são carregadas
+        devedores = {d[0]: d[1] for d in listar_devedores() or []}
 
-            if not pendentes.empty:
-                with st.container(border=True):
-                    # 1. Selecionar Cliente
-                    devedores = pendentes['Cliente'].unique()
-                    cliente_sel = st.selectbox("Selecione o Cliente:", devedores)
-
-                    # Filtra e Ordena
-                    dividas_cli = pendentes[pendentes['Cliente'] == cliente_sel].sort_values('Vencimento')
-                    total_devido = round(dividas_cli['Falta Pagar'].sum(), 2)
+        if devedores:
+            with st.container(border=True):
+                # 1. Selecionar Cliente
+                cliente_sel = st.selectbox("Selecione o Cliente:", list(devedores), format_func=devedores.get)
 
-                    st.info(f"💰 Dívida Total de **{cliente_sel}**: **R$ {total_devido:.2f}**")
+                # Dívidas do cliente, já ordenadas por vencimento (filtro de segurança > 0.01 no SQL)
+                dividas_cli = pd.DataFrame(listar_pendencias(cliente_sel),
+                                           columns=["ID", "Produto", "Cliente", "Total", "Pago", "Vencimento"])
+                dividas_cli['Falta Pagar'] = dividas_cli['Total'] - dividas_cli['Pago']
+                total_devido = round(dividas_cli['Falta Pagar'].sum(), 2)
 
-                    # Tabela detalhada
-                    st.dataframe(dividas_cli[['Vencimento', 'Produto', 'Total', 'Pago', 'Falta Pagar']],
-                                 use_container_width=True, hide_index=True)
+                st.info(f"💰 Dívida Total de **{devedores[cliente_sel]}**: **R$ {total_devido:.2f}**")
 
-                st.write("")
+                # Tabela detalhada
+                st.dataframe(dividas_cli[['Vencimento', 'Produto', 'Total', 'Pago', 'Falta Pagar']],
+                             use_container_width=True, hide_index=True)
 
-                # 2. Área de Pagamento
-                with st.container(border=True):
-                    st.markdown("#### 💸 Realizar Pagamento")
+            st.write("")
 
-                    if total_devido <= 0.01:
-                        st.success("Tudo pago!")
-                    else:
-                        c_pay1, c_pay2 = st.columns([1, 1])
-                        with c_pay1:
-                            valor_seguro = max(total_devido, 0.01)
-                            valor_pagamento = st.number_input("Valor Recebido (R$)", min_value=0.01,
-                                                              max_value=valor_seguro, value=valor_seguro, step=10.0)
-
-                        with c_pay2:
-                            st.write("")  # Espaço visual
-                            st.write("")
-                            if st.button("✅ CONFIRMAR BAIXA", type="primary", use_container_width=True):
-                                valor_restante = valor_pagamento
-
-                                # Loop FIFO
-                                for index, row in dividas_cli.iterrows():
-                                    if valor_restante <= 0: break
-
-                                    divida_atual = row['Falta Pagar']
-
-                                    if valor_restante >= divida_atual:
-                                        novo_pago = row['Total']
-                                        novo_status = 'Recebido'
-                                        valor_usado = divida_atual
-                                    else:
-                                        novo_pago = row['Pago'] + valor_restante
-                                        novo_status = 'Pendente'
-                                        valor_usado = valor_restante
-
-                                    run_query(
-                                        "UPDATE vendas SET valor_pago = ?, status = ?, data_recebimento = ? WHERE id = ?",
-                                        (novo_pago, novo_status, date.today(), row['ID']))
-                                    valor_restante -= valor_usado
+            # 2. Área de Pagamento
+            with st.container(border=True):
+                st.markdown("#### 💸 Realizar Pagamento")
+
+                if total_devido <= 0.01:
+                    st.success("Tudo pago!")
+                else:
+                    c_pay1, c_pay2 = st.columns([1, 1])
+                    with c_pay1:
+                        valor_seguro = max(total_devido, 0.01)
+                        valor_pagamento = st.number_input("Valor Recebido (R$)", min_value=0.01,
+                                                          max_value=valor_seguro, value=valor_seguro, step=10.0)
+
+                    with c_pay2:
+                        st.write("")  # Espaço visual
+                        st.write("")
+                        if st.button("✅ CONFIRMAR BAIXA", type="primary", use_container_width=True):
+                            # Baixa FIFO feita no banco, em uma transação, sobre os saldos atuais
+                            try:
+                                resultado = baixar_pagamento_cliente(cliente_sel, valor_pagamento)
+                            except ValueError as e:  # cliente excluído enquanto a tela estava aberta
+                                st.error(str(e))
+                            else:
+                                if resultado['valor_restante'] > 0.01:
+                                    st.toast(f"R$ {resultado['valor_restante']:.2f} não foram usados: "
+                                             "a dívida mudou desde que a tela foi aberta.", icon="⚠️")
 
                                 st.balloons()
                                 st.toast("Pagamento registrado com sucesso!", icon="✅")
                                 time.sleep(1.5)
                                 st.rerun()
-            else:
-                st.container(border=True).success("Nenhuma conta pendente no sistema! 🎉")
         else:
-            st.info("Nenhuma venda registrada.")
+            st.container(border=True).success("Nenhuma conta pendente no sistema! 🎉")
 
     # =======================================================
     # TELA 3: MOVIMENTAR CAIXA (Sangria/Suprimento)
@@ -202,8 +197,7 @@ def render_financeiro():
                     v_sup = st.number_input("Valor (R$)", min_value=0.01, step=10.0)
                     d_sup = st.text_input("Motivo (Ex: Troco inicial)")
                     if st.form_submit_button("Confirmar Entrada"):
-                        run_query("INSERT INTO caixa_movimentos (data, tipo, descricao, valor) VALUES (?, ?, ?, ?)",
-                                  (date.today(), 'Entrada', d_sup, v_sup))
+                        lancar_movimento_caixa('Entrada', d_sup, v_sup)
                         st.toast("Suprimento realizado!", icon="✅")
                         time.sleep(1)
                         st.rerun()
@@ -221,8 +215,7 @@ def render_financeiro():
                         if v_san > saldo_atual:
                             st.error("Saldo insuficiente!")
                         else:
-                            run_query("INSERT INTO caixa_movimentos (data, tipo, descricao, valor) VALUES (?, ?, ?, ?)",
-                                      (date.today(), 'Saida', d_san, v_san))
+                            lancar_movimento_caixa('Saida', d_san, v_san)
                             st.toast("Sangria realizada!", icon="💸")
                             time.sleep(1)
                             st.rerun()
@@ -239,31 +232,31 @@ def render_financeiro():
         with c_tit:
             st.subheader("Extrato Financeiro Unificado")
 
-        historico = []
-        if not df_mov.empty:
-            for _, row in df_mov.iterrows():
-                historico.append({
-                    "Data": row['Data'],
-                    "Descrição": f"{row['Tipo'].upper()}: {row['Descricao']}",
-                    "Valor": row['Valor'] * (-1 if row['Tipo'] == 'Saida' else 1),
-                    "Ref": "Manual"
-                })
-
-        if not df_vendas.empty:
-            for _, row in df_vendas.iterrows():
-                if row['Pago'] > 0:
-                    historico.append({
-                        "Data": row['Data Venda'],
-                        "Descrição": f"RECEBIMENTO: {row['Produto']} ({row['Cliente']})",
-                        "Valor": row['Pago'],
-                        "Ref": "Venda"
-                    })
+        EXTRATO_POR_PAGINA = 50
+
+        with st.container(border=True):
+            c1, c2 = st.columns(2)
+            with c1: data_ini = st.date_input("De:", value=date.today() - timedelta(days=30), format="DD/MM/YYYY")
+            with c2: data_fim = st.date_input("Até:", value=date.today(), format="DD/MM/YYYY")
+
+        qtd_lancamentos, total_entradas, total_saidas = resumo_extrato(data_ini, data_fim)
 
         with st.container(border=True):
-            if historico:
-                df_hist = pd.DataFrame(historico)
+            if qtd_lancamentos:
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Lançamentos", f"{qtd_lancamentos}")
+                k2.metric("Entradas", f"R$ {total_entradas:.2f}")
+                k3.metric("Saídas", f"R$ {total_saidas:.2f}")
+
+                total_paginas = (qtd_lancamentos - 1) // EXTRATO_POR_PAGINA + 1
+                pagina = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas,
+                                         value=1, step=1)
+
+                # Só a página visível sai do banco (UNION ALL + ORDER BY + LIMIT/OFFSET no SQL)
+                dados = extrato_financeiro(data_ini, data_fim, limite=EXTRATO_POR_PAGINA,
+                                           offset=(pagina - 1) * EXTRATO_POR_PAGINA)
+                df_hist = pd.DataFrame(dados, columns=["Data", "Descrição", "Valor", "Ref"])
                 df_hist['Data'] = pd.to_datetime(df_hist['Data'])
-                df_hist = df_hist.sort_values(by='Data', ascending=False)
 
                 # Formatação visual na tabela
                 st.dataframe(
@@ -276,9 +269,79 @@ def render_financeiro():
                     }
                 )
 
-                # Opção de Download
-                csv = df_hist.to_csv(index=False).encode('utf-8')
-                st.download_button("📥 Baixar Extrato (CSV)", data=csv, file_name="extrato_financeiro.csv",
-                                   mime="text/csv")
+                # Opção de Download: o arquivo só é gerado quando o botão é clicado
+                c_gz, c_down = st.columns([1, 2])
+                with c_gz:
+                    compactar = st.checkbox("Compactar (.gz)")
+                with c_down:
+                    nome_arquivo = f"extrato_{data_ini:%Y%m%d}_{data_fim:%Y%m%d}.csv" + (".gz" if compactar else "")
+                    st.download_button("📥 Baixar Extrato (CSV)",
+                                       data=lambda: exportar_extrato_csv(data_ini, data_fim, compactar),
+                                       file_name=nome_arquivo,
+                                       mime="application/gzip" if compactar else "text/csv",
+                                       on_click="ignore")
             else:
-                st.info("Nenhuma movimentação registrada no período.")
\ No newline at end of file
+                st.info("Nenhuma movimentação registrada no período.")
+
+    # =======================================================
+    # TELA 5: FECHAMENTO DE CAIXA (Snapshots diários)
+    # =======================================================
+    elif st.session_state.tela_fin == 'fechamento':
+        c_back, c_tit = st.columns([1, 6])
+        with c_back:
+            if st.button("⬅️ Voltar"):
+                st.session_state.tela_fin = 'menu'
+                st.rerun()
+        with c_tit:
+            st.subheader("Fechamento de Caixa")
+
+        col_fechar, col_consulta = st.columns(2)
+
+        with col_fechar:
+            with st.container(border=True):
+                st.markdown("### 🔐 Fechar o Dia")
+                st.write("Grava o saldo, recebimentos, sangrias e suprimentos do dia. O fechamento não pode ser alterado.")
+                if st.button(f"FECHAR CAIXA DE {date.today().strftime('%d/%m/%Y')}", type="primary",
+                             use_container_width=True):
+                    try:
+                        fechamento = fechar_caixa()
+                    except ValueError as e:
+                        st.warning(str(e))
+                    else:
+                        st.toast(f"Caixa fechado! Saldo: R$ {fechamento['saldo']:.2f}", icon="🔐")
+                        time.sleep(1)
+                        st.rerun()
+
+        with col_consulta:
+            with st.container(border=True):
+                st.markdown("### 🔎 Saldo em uma Data")
+                data_consulta = st.date_input("Data:", value=date.today(), format="DD/MM/YYYY")
+                fechamento = saldo_em(data_consulta)
+                if fechamento:
+                    st.metric(f"Saldo no fechamento de {pd.to_datetime(fechamento['data']).strftime('%d/%m/%Y')}",
+                              f"R$ {fechamento['saldo']:.2f}")
+                else:
+                    st.info("Nenhum fechamento até esta data.")
+
+        st.markdown("##### 📅 Últimos Fechamentos")
+        dados_fech = listar_fechamentos()
+        if dados_fech:
+            df_fech = pd.DataFrame(dados_fech, columns=["Data", "Recebimentos", "Suprimentos", "Sangrias",
+                                                        "Receita Acum.", "Suprimentos Acum.", "Sangrias Acum.",
+                                                        "Saldo", "A Receber"])
+            df_fech['Data'] = pd.to_datetime(df_fech['Data'])
+            st.dataframe(
+                df_fech[["Data", "Recebimentos", "Suprimentos", "Sangrias", "Saldo", "A Receber"]],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                    "Recebimentos": st.column_config.NumberColumn(format="R$ %.2f"),
+                    "Suprimentos": st.column_config.NumberColumn(format="R$ %.2f"),
+                    "Sangrias": st.column_config.NumberColumn(format="R$ %.2f"),
+                    "Saldo": st.column_config.NumberColumn(format="R$ %.2f"),
+                    "A Receber": st.column_config.NumberColumn(format="R$ %.2f"),
+                }
+            )
+        else:
+            st.info("Nenhum fechamento registrado ainda.")
@@ -1,9 +1,13 @@
 # views/home.py
 import streamlit as st
 import pandas as pd
-from database import run_query
+from database import vendas_do_dia, vendas_por_periodo, produtos_mais_vendidos, total_a_receber, \
+    contar_produtos_em_alerta, ultimas_vendas
 from datetime import date, timedelta
-import plotly.express as px  # (Opcional, mas vamos usar st.bar_chart nativo para simplicidade e rapidez)
+
+# Opções do gráfico: dias do período e (formato do rótulo, agrupamento no banco)
+PERIODOS = {"Últimos 7 dias": 7, "Últimos 30 dias": 30, "Últimos 90 dias": 90, "Últimos 12 meses": 365}
+AGRUPAMENTOS = {"Por dia": ("%d/%m", "dia"), "Por semana": ("%d/%m", "semana"), "Por mês": ("%m/%Y", "mes")}
 
 
 def render_home():
@@ -11,20 +15,18 @@ def render_home():
     st.write(f"Resumo do dia: **{date.today().strftime('%d/%m/%Y')}**")
 
     # --- 1. BUSCA DE DADOS (QUERIES) ---
-    # A. Vendas de Hoje
-    dados_hoje = run_query("SELECT SUM(total), COUNT(*) FROM vendas WHERE data_venda = ?", (date.today(),), fetch=True)
-    total_hoje = dados_hoje[0][0] if dados_hoje[0][0] else 0.0
-    qtd_vendas_hoje = dados_hoje[0][1]
+    # A. Vendas de Hoje (consolidado do dia, mantido por triggers)
+    hoje = vendas_do_dia()
+    total_hoje = hoje['total']
+    qtd_vendas_hoje = hoje['pedidos']
 
     # B. Contas a Receber (Geral)
     # Calculamos somando (Total - Valor Pago) apenas das Pendentes
-    dados_receber = run_query("SELECT SUM(total - valor_pago) FROM vendas WHERE status = 'Pendente'", fetch=True)
-    total_receber = dados_receber[0][0] if dados_receber and dados_receber[0][0] else 0.0
+    total_receber = total_a_receber()
 
     # C. Alertas de Estoque
     # Conta quantos produtos têm quantidade <= minimo_alerta
-    dados_estoque = run_query("SELECT COUNT(*) FROM produtos WHERE quantidade <= minimo_alerta", fetch=True)
-    qtd_alertas = dados_estoque[0][0]
+    qtd_alertas = contar_produtos_em_alerta()
 
     # --- 2. CARTÕES DE KPI (INDICADORES) ---
     with st.container(border=True):
@@ -32,7 +34,7 @@ def render_home():
         k1, k2, k3, k4 = st.columns(4)
 
         k1.metric("Vendas Hoje (R$)", f"R$ {total_hoje:.2f}", help="Total vendido hoje (faturado)")
-        k2.metric("Pedidos Hoje", f"{qtd_vendas_hoje}", help="Quantidade de vendas realizadas hoje")
+        k2.metric("Pedidos Hoje", f"{qtd_vendas_hoje}", help="Quantidade de pedidos realizados hoje")
         k3.metric("A Receber", f"R$ {total_receber:.2f}", delta="Pendências", delta_color="inverse",
                   help="Total que clientes te devem")
         k4.metric("Estoque Baixo", f"{qtd_alertas} itens", delta="Reposição", delta_color="inverse",
@@ -43,25 +45,38 @@ def render_home():
 
     with col_chart:
         with st.container(border=True):
-            st.markdown("##### 📈 Vendas: Últimos 7 Dias")
-
-            # Query para os últimos 7 dias
-            data_inicio = date.today() - timedelta(days=6)
-            query_chart = """
-                SELECT data_venda, SUM(total) as total_dia 
-                FROM vendas 
-                WHERE data_venda >= ? 
-                GROUP BY data_venda 
-                ORDER BY data_venda ASC
-            """
-            dados_chart = run_query(query_chart, (data_inicio,), fetch=True)
+            c_tit, c_per, c_agr = st.columns([1.2, 1, 1])
+            with c_tit:
+                st.markdown("##### 📈 Vendas no Período")
+            with c_per:
+                periodo = st.selectbox("Período", list(PERIODOS), label_visibility="collapsed")
+            with c_agr:
+                agrupamento = st.selectbox("Agrupar por", list(AGRUPAMENTOS), label_visibility="collapsed")
+
+            # Lê os consolidados diários do período (no máximo um registro por dia)
+            data_fim = date.today()
+            data_inicio = data_fim - timedelta(days=PERIODOS[periodo] - 1)
+            formato_data, agrupamento_sql = AGRUPAMENTOS[agrupamento]
+            dados_chart = vendas_por_periodo(data_inicio, data_fim, agrupamento_sql)
 
             if dados_chart:
-                df_chart = pd.DataFrame(dados_chart, columns=["Data", "Total"])
-                df_chart['Data'] = pd.to_datetime(df_chart['Data']).dt.strftime('%d/%m')
+                df_chart = pd.DataFrame(dados_chart, columns=["Data", "Total", "Pedidos"])
+                df_chart['Data'] = pd.to_datetime(df_chart['Data']).dt.strftime(formato_data)
                 df_chart.set_index("Data", inplace=True)
 
-                st.bar_chart(df_chart, color="#FF4B4B", height=250)
+                st.bar_chart(df_chart[["Total"]], color="#FF4B4B", height=250)
+
+                mais_vendidos = produtos_mais_vendidos(data_inicio, data_fim)
+                if mais_vendidos:
+                    st.caption("🏆 Mais vendidos no período")
+                    st.dataframe(
+                        pd.DataFrame(mais_vendidos, columns=["Produto", "Qtd", "Total"]),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "Total": st.column_config.NumberColumn(format="R$ %.2f")
+                        }
+                    )
             else:
                 st.info("Sem dados suficientes para o gráfico.")
 
@@ -69,7 +84,7 @@ def render_home():
         with st.container(border=True):
             st.markdown("##### ⏱️ Últimas 5 Vendas")
 
-            recentes = run_query("SELECT cliente_nome, total, status FROM vendas ORDER BY id DESC LIMIT 5", fetch=True)
+            recentes = ultimas_vendas(5)
             if recentes:
                 df_recentes = pd.DataFrame(recentes, columns=["Cliente", "Valor", "Status"])
                 st.dataframe(
@@ -1,37 +1,28 @@
 # views/login.py
 import streamlit as st
-import time
-import requests
+from animacoes import exibir_animacao
 from database import get_user_data, check_hashes, update_user_password
 
-# Tenta importar Lottie, se não tiver, usa fallback
-try:
-    from streamlit_lottie import st_lottie
 
-    HAS_LOTTIE = True
-except ImportError:
-    HAS_LOTTIE = False
-
-
-# --- FUNÇÃO SEGURA PARA CARREGAR ANIMAÇÃO ---
-@st.cache_data(show_spinner=False)
-def load_lottieurl(url):
-    if not HAS_LOTTIE:
-        return None
-    try:
-        # Timeout ultra-rápido (1s) para não travar a tela
-        r = requests.get(url, timeout=1)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except:
-        return None
+def _entrar(usuario, nome_real, permissoes):
+    # Define sessão; a animação de boas-vindas aparece já na tela do sistema (sem esperar aqui)
+    st.session_state.logged_in = True
+    st.session_state.username = usuario
+    st.session_state.user_nome = nome_real
+    st.session_state.permissoes = permissoes.split(',') if permissoes else []
+    st.session_state.boas_vindas = True
+    st.rerun()
 
 
 def render_login():
-    # Tenta carregar
-    anim_login = load_lottieurl("https://lottie.host/6e64d7c0-671e-450b-8d5c-912dfa88785e/3u1s4Xz6tB.json")
-    anim_success = load_lottieurl("https://lottie.host/939b4b0e-6169-4508-b785-52d3a0429188/8p7X5Zq7tB.json")
+    # Despedida de quem acabou de sair, mostrada uma vez acima do formulário
+    despedida = st.session_state.pop('despedida', None)
+    if despedida:
+        c1, c2, c3 = st.columns([1, 1, 1])
+        with c2:
+            exibir_animacao("tchau", height=120, key="bye_anim")
+            st.markdown(f"<h3 style='text-align: center; color: #2E8B57;'>Até logo, {despedida}!</h3>",
+                        unsafe_allow_html=True)
 
     # Placeholder principal
     login_area = st.empty()
@@ -49,10 +40,7 @@ def render_login():
                 # Se a animação carregou, mostra pequena no topo. Se não, mostra emoji.
                 col_logo, col_texto = st.columns([1, 2])
                 with col_logo:
-                    if anim_login and HAS_LOTTIE:
-                        st_lottie(anim_login, height=100, key="logo_anim")
-                    else:
-                        st.markdown("# 🌿")
+                    exibir_animacao("login", height=100, key="logo_anim")
 
                 with col_texto:
                     st.markdown("## Cerrado Tereré 67")
@@ -80,32 +68,7 @@ def render_login():
                                         st.warning("🔒 Troca de senha obrigatória.")
                                         st.rerun()
                                     else:
-                                        # === ANIMAÇÃO DE SUCESSO ===
-                                        login_area.empty()  # Limpa a tela
-
-                                        with login_area.container():
-                                            st.markdown("<br><br><br>", unsafe_allow_html=True)
-                                            c1, c2, c3 = st.columns([1, 2, 1])
-                                            with c2:
-                                                if anim_success and HAS_LOTTIE:
-                                                    st_lottie(anim_success, height=200, key="win_anim")
-                                                else:
-                                                    st.markdown("# 🎉")
-
-                                                st.markdown(
-                                                    f"<h1 style='text-align: center; color: #2E8B57;'>Bem-vindo!</h1>",
-                                                    unsafe_allow_html=True)
-                                                st.markdown(f"<h3 style='text-align: center;'>{nome_real}</h3>",
-                                                            unsafe_allow_html=True)
-
-                                        # Define sessão
-                                        st.session_state.logged_in = True
-                                        st.session_state.username = usuario
-                                        st.session_state.user_nome = nome_real
-                                        st.session_state.permissoes = permissoes.split(',') if permissoes else []
-
-                                        time.sleep(2)
-                                        st.rerun()
+                                        _entrar(usuario, nome_real, permissoes)
                                 else:
                                     st.error("Senha incorreta.")
                             else:
@@ -126,14 +89,8 @@ def render_login():
                             user_data = get_user_data(usuario_temp)
                             stored_password, nome_real, permissoes, mudar_senha = user_data[0]
 
-                            st.session_state.logged_in = True
-                            st.session_state.username = usuario_temp
-                            st.session_state.user_nome = nome_real
-                            st.session_state.permissoes = permissoes.split(',') if permissoes else []
                             del st.session_state.temp_user_valid
-
-                            st.success("Senha atualizada! Entrando...")
-                            time.sleep(1)
-                            st.rerun()
+                            st.toast("Senha atualizada!", icon="🔒")
+                            _entrar(usuario_temp, nome_real, permissoes)
                         else:
                             st.error("Senhas inválidas ou muito curtas.")
\ No newline at end of file
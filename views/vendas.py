@@ -2,26 +2,21 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, timedelta
-from database import run_query
+from database import registrar_venda, EstoqueInsuficiente, buscar_pedido, buscar_vendas, listar_produtos, \
+    listar_clientes, listar_emails
 from fpdf import FPDF
-import base64
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
+import hashlib
+import json
+import sqlite3
+from fila_emails import configurar_remetente, enviar_em_segundo_plano
 import time
 
 
 # --- 1. FUNÇÕES AUXILIARES ---
 
 def enviar_email_orcamento(remetente_email, remetente_senha, destinatario_email, cliente_nome, pdf_bytes):
+    """Coloca o orçamento na caixa de saída; o envio acontece em segundo plano (fila_emails)."""
     try:
-        msg = MIMEMultipart()
-        msg['From'] = remetente_email
-        msg['To'] = destinatario_email
-        msg['Subject'] = f"Orçamento Cerrado Tereré 67 - {cliente_nome}"
-
         corpo = f"""
         Olá, {cliente_nome}.
 
@@ -32,22 +27,12 @@ def enviar_email_orcamento(remetente_email, remetente_senha, destinatario_email,
         Atenciosamente,
         Equipe Cerrado Tereré 67.
         """
-        msg.attach(MIMEText(corpo, 'plain'))
-
-        part = MIMEBase('application', "octet-stream")
-        part.set_payload(pdf_bytes)
-        encoders.encode_base64(part)
-        part.add_header('Content-Disposition', f'attachment; filename="Orcamento_{cliente_nome}.pdf"')
-        msg.attach(part)
-
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(remetente_email, remetente_senha)
-        server.sendmail(remetente_email, destinatario_email, msg.as_string())
-        server.quit()
-        return True, "✅ E-mail enviado com sucesso!"
+        configurar_remetente(remetente_email, remetente_senha)
+        enviar_em_segundo_plano(remetente_email, destinatario_email, f"Orçamento Cerrado Tereré 67 - {cliente_nome}",
+                                corpo, pdf_bytes, f"Orcamento_{cliente_nome}.pdf")
+        return True, "📨 E-mail na fila de envio!"
     except Exception as e:
-        return False, f"❌ Erro ao enviar: {str(e)}"
+        return False, f"❌ Erro ao enfileirar: {str(e)}"
 
 
 def gerar_pdf_orcamento(cliente, itens, total, condicao_pagamento, vencimento):
@@ -109,7 +94,33 @@ def gerar_pdf_orcamento(cliente, itens, total, condicao_pagamento, vencimento):
     return pdf.output(dest='S').encode('latin-1', 'replace')
 
 
+def chave_orcamento(cliente, itens, total, condicao_pagamento, vencimento):
+    """Hash do conteúdo do orçamento: carrinho, cliente e condições de pagamento."""
+    conteudo = json.dumps([cliente, [[item.get('id'), item['nome'], item['qtd'], item['total_item']] for item in itens],
+                           round(float(total), 2), condicao_pagamento, vencimento], default=str)
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def pdf_orcamento_em_cache(chave, _cliente, _itens, _total, _condicao_pagamento, _vencimento):
+    # Só a chave entra no hash do cache; o PDF é gerado uma vez por conteúdo, sob demanda
+    return gerar_pdf_orcamento(_cliente, _itens, _total, _condicao_pagamento, _vencimento)
+
+
 # --- 2. TELA DE VENDAS ---
+def ajustar_carrinho(carrinho, resultado_estoque):
+    """Reduz cada linha recusada ao estoque disponível (remove as que ficam zeradas)."""
+    ajustado = []
+    restante = {}
+    for item, linha in zip(carrinho, resultado_estoque):
+        restante.setdefault(item['id'], linha['disponivel'] or 0)
+        qtd = min(item['qtd'], restante[item['id']])
+        restante[item['id']] -= qtd
+        if qtd > 0:
+            ajustado.append(dict(item, qtd=qtd, total_item=qtd * item['preco']))
+    return ajustado
+
+
 def render_vendas():
     if 'tela_vendas' not in st.session_state:
         st.session_state.tela_vendas = 'menu'
@@ -151,18 +162,31 @@ def render_vendas():
             with c2: data_fim = st.date_input("Até:", value=date.today())
             with c3: busca = st.text_input("Buscar (Cliente/Produto)")
 
-        query = "SELECT data_venda, cliente_nome, produto_nome, qtd_vendida, total, status FROM vendas WHERE data_venda BETWEEN ? AND ?"
-        params = [data_ini, data_fim]
-        if busca:
-            query += " AND (cliente_nome LIKE ? OR produto_nome LIKE ?)"
-            params.extend([f"%{busca}%", f"%{busca}%"])
-        query += " ORDER BY id DESC"
-
-        dados = run_query(query, tuple(params), fetch=True)
+        dados = buscar_vendas(data_ini, data_fim, busca)
         if dados:
-            df = pd.DataFrame(dados, columns=["Data", "Cliente", "Produto", "Qtd", "Total", "Status"])
+            df = pd.DataFrame(dados, columns=["Pedido", "Data", "Cliente", "Produto", "Qtd", "Total", "Status"])
             df['Data'] = pd.to_datetime(df['Data']).dt.strftime('%d/%m/%Y')
             st.dataframe(df, use_container_width=True, hide_index=True)
+
+            # Reimpressão: cabeçalho e itens do pedido são buscados pela chave
+            with st.container(border=True):
+                c_ped, c_btn = st.columns([2, 1])
+                with c_ped:
+                    pedido_sel = st.selectbox("Reimprimir comprovante do pedido:", df['Pedido'].dropna().unique())
+                with c_btn:
+                    st.write("")
+                    if pedido_sel is not None:
+                        pedido = buscar_pedido(int(pedido_sel))
+                        if pedido:
+                            vencimento = pd.to_datetime(pedido['data_vencimento']).strftime('%d/%m/%Y') \
+                                if pedido['data_vencimento'] else ""
+                            dados_pdf = (pedido['cliente'], pedido['itens'], pedido['total'],
+                                         pedido['tipo_pagamento'], vencimento)
+                            chave_pdf = chave_orcamento(*dados_pdf)
+                            st.download_button("📄 Baixar PDF",
+                                               data=lambda: pdf_orcamento_em_cache(chave_pdf, *dados_pdf),
+                                               file_name=f"pedido_{pedido['id']}.pdf", mime="application/pdf",
+                                               on_click="ignore", use_container_width=True)
         else:
             st.info("Nenhuma venda encontrada.")
 
@@ -181,12 +205,20 @@ def render_vendas():
             email_loja = st.text_input("Seu E-mail (Gmail)", key="email_cfg")
             senha_app = st.text_input("Senha de App", type="password", key="senha_cfg")
 
+            envios = listar_emails(5)
+            if envios:
+                st.caption("Últimos envios")
+                for _, destinatario, _, status, tentativas, erro, _, _ in envios:
+                    icone = {"Enviado": "✅", "Falhou": "❌"}.get(status, "⏳")
+                    st.caption(f"{icone} {destinatario} — {status}" + (f" ({tentativas}x: {erro})" if erro else ""))
+
         if 'carrinho' not in st.session_state:
             st.session_state.carrinho = []
 
-        produtos = run_query("SELECT id, nome, preco, quantidade FROM produtos", fetch=True)
-        clientes_db = run_query("SELECT id, nome FROM clientes", fetch=True)
-        lista_clientes = [c[1] for c in clientes_db] if clientes_db else []
+        produtos = listar_produtos()
+        clientes_db = listar_clientes()
+        dict_clientes = {c[0]: c[1] for c in clientes_db} if clientes_db else {}
+        lista_clientes = list(dict_clientes.keys())
 
         # --- ADICIONAR ITEM ---
         with st.container(border=True):
@@ -200,12 +232,15 @@ def render_vendas():
                     prod_sel = st.selectbox("Produto", list(dict_prods.keys()), label_visibility="collapsed",
                                             placeholder="Selecione...")
                     dados_prod = dict_prods[prod_sel]
-                    st.caption(f"Estoque: {dados_prod[3]} | Unit: R$ {dados_prod[2]:.2f}")
+                    # Limite só orienta o caixa: a conferência que vale é a do banco ao concluir a venda
+                    no_carrinho = sum(i['qtd'] for i in st.session_state.carrinho if i['id'] == dados_prod[0])
+                    disponivel = dados_prod[3] - no_carrinho
+                    st.caption(f"Estoque: {dados_prod[3]} | No carrinho: {no_carrinho} | Unit: R$ {dados_prod[2]:.2f}")
                 with c_qtd:
-                    qtd_item = st.number_input("Qtd", min_value=1, max_value=dados_prod[3], step=1,
-                                               label_visibility="collapsed")
+                    qtd_item = st.number_input("Qtd", min_value=1, max_value=max(disponivel, 1), step=1,
+                                               label_visibility="collapsed", disabled=disponivel <= 0)
                 with c_act:
-                    if st.button("Adicionar", type="secondary", use_container_width=True):
+                    if st.button("Adicionar", type="secondary", use_container_width=True, disabled=disponivel <= 0):
                         total_item = qtd_item * dados_prod[2]
                         st.session_state.carrinho.append(
                             {"id": dados_prod[0], "nome": dados_prod[1], "preco": dados_prod[2], "qtd": qtd_item,
@@ -218,12 +253,24 @@ def render_vendas():
 
             with col_cart:
                 st.markdown("#### 🛒 Carrinho")
+                recusas = st.session_state.get('recusas_estoque')
+                if recusas:
+                    st.error("Estoque insuficiente: a venda não foi gravada.")
+                    st.dataframe(pd.DataFrame([{"Item": r['nome'], "Pedido": r['qtd'],
+                                                "Disponível": r['disponivel'] if r['disponivel'] is not None else 0,
+                                                "Situação": "✅" if r['aceito'] else "❌"} for r in recusas]),
+                                 use_container_width=True, hide_index=True)
+                    if st.button("🔧 Ajustar carrinho ao estoque", use_container_width=True):
+                        st.session_state.carrinho = ajustar_carrinho(st.session_state.carrinho, recusas)
+                        st.session_state.pop('recusas_estoque', None)
+                        st.rerun()
                 df_carrinho = pd.DataFrame(st.session_state.carrinho)
                 st.dataframe(df_carrinho[['nome', 'qtd', 'preco', 'total_item']], use_container_width=True,
                              hide_index=True, column_config={"nome": "Item", "qtd": "Qtd", "preco": "Unit (R$)",
                                                              "total_item": "Total (R$)"})
                 if st.button("🗑️ Limpar Carrinho", use_container_width=True):
                     st.session_state.carrinho = []
+                    st.session_state.pop('recusas_estoque', None)
                     st.rerun()
 
             with col_checkout:
@@ -237,16 +284,20 @@ def render_vendas():
                                         label_visibility="collapsed")
 
                     cliente_final = "Consumidor Final"
+                    cliente_id = None
                     data_venc = date.today()
 
                     if tipo_pag == "A Prazo":
-                        cliente_final = st.selectbox("Cliente (Obrigatório)", lista_clientes)
+                        cliente_id = st.selectbox("Cliente (Obrigatório)", lista_clientes, format_func=dict_clientes.get)
                         dias = st.number_input("Dias Vencimento", value=30, min_value=1)
                         data_venc = date.today() + timedelta(days=dias)
                         st.caption(f"Vence em: {data_venc.strftime('%d/%m/%Y')}")
                     else:
                         if st.checkbox("Identificar Cliente?"):
-                            cliente_final = st.selectbox("Cliente", lista_clientes)
+                            cliente_id = st.selectbox("Cliente", lista_clientes, format_func=dict_clientes.get)
+
+                    if cliente_id is not None:
+                        cliente_final = dict_clientes[cliente_id]
 
                     st.divider()
 
@@ -254,23 +305,17 @@ def render_vendas():
                     st.markdown("**Documentação & Envio**")
                     email_cliente = st.text_input("E-mail do Cliente", placeholder="cliente@email.com")
 
-                    pdf_bytes = gerar_pdf_orcamento(cliente_final, st.session_state.carrinho, total_pedido, tipo_pag,
-                                                    data_venc.strftime('%d/%m/%Y'))
-                    b64 = base64.b64encode(pdf_bytes).decode()
-
-                    # CSS Botão customizado
-                    style_btn = """
-                        text-decoration: none; display: flex; justify-content: center; align-items: center; 
-                        height: 100%; width: 100%; border: 1px solid rgba(49, 51, 63, 0.2); 
-                        background-color: white; color: rgb(49, 51, 63); padding: 0.25rem 0.75rem; 
-                        border-radius: 0.5rem; font-family: 'Source Sans Pro', sans-serif;
-                    """
+                    # PDF só é gerado ao baixar/enviar, e reaproveitado enquanto o conteúdo não mudar
+                    dados_pdf = (cliente_final, st.session_state.carrinho, total_pedido, tipo_pag,
+                                 data_venc.strftime('%d/%m/%Y'))
+                    chave_pdf = chave_orcamento(*dados_pdf)
 
                     col_act1, col_act2 = st.columns(2)
                     with col_act1:
-                        st.markdown(
-                            f'<div style="height: 40px; display: flex; align-items: center;"><a href="data:application/octet-stream;base64,{b64}" download="orcamento.pdf" style="{style_btn}">📄 Baixar PDF</a></div>',
-                            unsafe_allow_html=True)
+                        st.download_button("📄 Baixar PDF",
+                                           data=lambda: pdf_orcamento_em_cache(chave_pdf, *dados_pdf),
+                                           file_name="orcamento.pdf", mime="application/pdf", on_click="ignore",
+                                           use_container_width=True)
                     with col_act2:
                         if st.button("📧 Enviar", use_container_width=True):
                             if not email_loja or not senha_app:
@@ -278,13 +323,13 @@ def render_vendas():
                             elif not email_cliente:
                                 st.error("Digite o e-mail!")
                             else:
-                                with st.spinner("Enviando..."):
-                                    suc, msg = enviar_email_orcamento(email_loja, senha_app, email_cliente,
-                                                                      cliente_final, pdf_bytes)
-                                    if suc:
-                                        st.toast(msg, icon="✅")
-                                    else:
-                                        st.error(msg)
+                                pdf_bytes = pdf_orcamento_em_cache(chave_pdf, *dados_pdf)
+                                suc, msg = enviar_email_orcamento(email_loja, senha_app, email_cliente,
+                                                                  cliente_final, pdf_bytes)
+                                if suc:
+                                    st.toast(msg, icon="✅")
+                                else:
+                                    st.error(msg)
 
                     st.write("")
 
@@ -292,16 +337,19 @@ def render_vendas():
                         if tipo_pag == "A Prazo" and not lista_clientes:
                             st.error("Cadastre clientes antes!")
                         else:
-                            for item in st.session_state.carrinho:
-                                vp = item['total_item'] if tipo_pag == "À Vista" else 0.0
-                                stt = "Recebido" if tipo_pag == "À Vista" else "Pendente"
-                                run_query(
-                                    '''INSERT INTO vendas (produto_id, produto_nome, cliente_nome, qtd_vendida, total, valor_pago, tipo_pagamento, data_venda, data_recebimento, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                                    (item['id'], item['nome'], cliente_final, item['qtd'], item['total_item'], vp,
-                                     tipo_pag, date.today(), data_venc, stt))
-                                run_query("UPDATE produtos SET quantidade = quantidade - ? WHERE id = ?",
-                                          (item['qtd'], item['id']))
-
+                            try:
+                                # Todos os itens + baixa condicional do estoque em um único commit
+                                registrar_venda(st.session_state.carrinho, cliente_id, cliente_final, tipo_pag,
+                                                date.today(), data_venc)
+                            except EstoqueInsuficiente as e:
+                                # Outro caixa vendeu antes: nada foi gravado, mostra o que falta linha a linha
+                                st.session_state.recusas_estoque = e.itens
+                                st.rerun()
+                            except sqlite3.Error as e:
+                                st.error(f"Erro ao registrar venda: {e}")
+                                st.stop()
+
+                            st.session_state.pop('recusas_estoque', None)
                             st.session_state.carrinho = []
                             st.session_state.tela_vendas = 'menu'
                             st.balloons()